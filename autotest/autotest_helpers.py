@@ -0,0 +1,16 @@
+# code shared by the autotest scripts
+
+import os
+
+
+def add_c_check_argument(parser):
+	"""
+	add the --c-check option giving the c_check.py to test, made absolute so it still works if a script changes directory
+	"""
+	parser.add_argument("--c-check", type=os.path.abspath, default=default_c_check(), help="path of c_check.py, default ./c_check.py or ../c_check.py relative to this script")
+
+
+def default_c_check():
+	if os.path.exists('c_check.py'):
+		return 'c_check.py'
+	return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'c_check.py')
@@ -0,0 +1,7 @@
+#include <ctype.h>
+#include <stdio.h>
+
+int main(void) {
+	int c = getchar();
+	return toupper(c);
+}
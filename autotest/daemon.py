@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+# check c_check_client.py gives the same stdout, stderr & exit status as running c_check.py directly,
+# both when a daemon started with c_check.py --daemon is running & when none is running
+#
+# usage: daemon.py [--timeout-seconds N] [--c-check path]
+
+import argparse, os, subprocess, sys, tempfile, time
+
+from autotest_helpers import add_c_check_argument
+
+# arguments & autotest file for each comparison
+CHECKS = [
+	['--not-permitted', 'goto', 'goto.c'],
+	['--warning', 'integer-ascii-code', 'integer_ascii_code.c'],
+	['--not-permitted', 'global-variable', 'global_variable.c', 'goto.c'],
+	['--not-permitted', 'break', 'non_utf8.c'],
+	['--no-such-option', 'goto.c'],
+]
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--timeout-seconds", type=float, default=30, help="maximum time to wait for the daemon to start")
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+	c_check = args.c_check
+	client = os.path.join(os.path.dirname(c_check), 'c_check_client.py')
+	os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+	with tempfile.TemporaryDirectory() as directory:
+		socket_path = os.path.join(directory, 'c_check.sock')
+		environment = dict(os.environ, C_CHECK_SOCKET=socket_path)
+		environment.pop('C_CHECK', None)
+		print(f"no daemon: {compare(c_check, client, environment)}")
+
+		daemon = subprocess.Popen([sys.executable, c_check, '--daemon', '--daemon-idle-timeout', '60'], env=environment, stderr=subprocess.DEVNULL)
+		try:
+			deadline = time.time() + args.timeout_seconds
+			while not os.path.exists(socket_path) and daemon.poll() is None and time.time() < deadline:
+				time.sleep(0.05)
+			if not os.path.exists(socket_path):
+				print("daemon: not listening")
+				return
+			# the client would fail if it ran c_check.py itself, rather than using the daemon
+			print(f"daemon: {compare(c_check, client, dict(environment, C_CHECK=os.path.join(directory, 'missing.py')))}")
+		finally:
+			daemon.terminate()
+			daemon.wait()
+
+
+def compare(c_check, client, environment):
+	"""
+	run the client & c_check.py on each of CHECKS
+	@returns description of the result
+	"""
+	for arguments in CHECKS:
+		expected = run([sys.executable, c_check] + arguments, environment)
+		p = run([sys.executable, client] + arguments, environment)
+		if (p.stdout, p.stderr, p.returncode) != (expected.stdout, expected.stderr, expected.returncode):
+			return f"{' '.join(arguments)}: client gave {(p.stdout, p.stderr, p.returncode)}, should be {(expected.stdout, expected.stderr, expected.returncode)}"
+	return f"same as c_check for {len(CHECKS)} runs"
+
+
+def run(command, environment):
+	return subprocess.run(command, env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+# check c_check.py handles very deeply nested code (several thousand levels by default)
+# without exceeding Python's recursion limit, reporting the lines it should
+# and building a syntax tree snapshot with consistent parent & depth information
+#
+# usage: deep_nesting.py [--depth N] [--budget-seconds N] [--c-check path]
+
+import argparse, os, re, subprocess, sys, tempfile, time
+
+from autotest_helpers import add_c_check_argument
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--depth", type=int, default=5000, help="nesting depth of generated code")
+	parser.add_argument("--budget-seconds", type=float, default=30, help="maximum time to check each file")
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+
+	sys.path.insert(0, os.path.dirname(args.c_check))
+	import c_check
+	index_parse_args = c_check.get_library_include() + ['-DNDEBUG']
+	index = c_check.clang.cindex.Index.create()
+
+	with tempfile.TemporaryDirectory() as directory:
+		for (name, generate) in GENERATORS.items():
+			(source, expected_reports) = generate(args.depth)
+			filename = os.path.join(directory, name + '.c')
+			with open(filename, 'w') as f:
+				f.write(source)
+			start = time.perf_counter()
+			p = subprocess.run([sys.executable, args.c_check, '--no-colorize', '--warning', 'ternary,indenting', filename], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+			elapsed = time.perf_counter() - start
+			reports = re.findall(r'^.*?:(\d+):\d+ warning: ternary|^ *(\d+)\*', p.stdout, flags=re.M)
+			reports = [('ternary', int(line)) if line else ('indenting', int(marked)) for (line, marked) in reports]
+			tree_problem = check_syntax_tree(c_check, index.parse(filename, args=index_parse_args), args.depth)
+			if 'Traceback' in p.stdout:
+				print(f"{name}: c_check failed: {p.stdout.splitlines()[-1]}")
+			elif elapsed > args.budget_seconds:
+				print(f"{name}: took {elapsed:.1f} seconds, budget is {args.budget_seconds} seconds")
+			elif reports != expected_reports:
+				print(f"{name}: reported {reports}, should be {expected_reports}")
+			elif tree_problem:
+				print(f"{name}: {tree_problem}")
+			else:
+				print(f"{name}: deeply nested code checked correctly")
+
+
+def check_syntax_tree(c_check, tu, minimum_depth):
+	"""
+	@returns description of any inconsistency in the snapshot of tu's syntax tree, None if there is none
+	"""
+	nodes = c_check.abstract_syntax_tree_nodes(tu.cursor)
+	max_depth = max(n.depth for n in nodes)
+	if max_depth < minimum_depth:
+		return f"syntax tree depth is {max_depth}, should be at least {minimum_depth}"
+	for n in nodes[1:]:
+		if n.depth != n.parent.depth + 1 or n not in n.parent.children:
+			return f"inconsistent parent for node at line {n.start_line}"
+	# nodes should be in depth-first order
+	order = []
+	stack = [nodes[0]]
+	while stack:
+		n = stack.pop()
+		order.append(n)
+		stack.extend(reversed(n.children))
+	if order != nodes:
+		return "syntax tree nodes are not in depth-first order"
+	return None
+
+
+def else_if_chain(depth):
+	"""
+	an if else-if chain with depth arms, its last arm incorrectly indented & containing a ternary
+	@returns (source, expected (check, line) reports)
+	"""
+	lines = ['int main(void) {', '\tint n = 0;', '\tint c = 3;', '\tif (c == 10) {', '\t\tn = 1;']
+	for i in range(depth):
+		lines += [f'\t}} else if (c == {i}) {{', f'\t\tn = {i};']
+	lines += ['\t} else {', '    n = c ? 1 : 2;', '\t}', '\treturn n;', '}']
+	ternary_line = len(lines) - 3
+	return ('\n'.join(lines) + '\n', [('ternary', ternary_line)] + [('indenting', ternary_line)])
+
+
+def operator_chain(depth):
+	"""
+	an expression of depth additions, one per line, whose deepest operand is a ternary
+	@returns (source, expected (check, line) reports)
+	"""
+	lines = ['int main(void) {', '\tint c = 3;', '\tint n = (c ? 1 : 2)']
+	lines += ['\t\t+ 1'] * depth
+	lines += ['\t\t;', '\treturn n;', '}']
+	return ('\n'.join(lines) + '\n', [('ternary', 3)])
+
+
+GENERATORS = {
+	"else_if_chain" : else_if_chain,
+	"operator_chain" : operator_chain,
+}
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+# check files using checked constructs only through macros from their own headers or system headers
+# (MAX from sys/param.h, FD_ZERO from sys/select.h) give the same output
+# with & without --lexical-fast-path, i.e. the lexical fast path & check plan pruning don't miss them
+#
+# usage: header_macros.py [--c-check path]
+
+import argparse, os, subprocess, sys
+
+from autotest_helpers import add_c_check_argument
+
+OWN_HEADER_CHECK_LISTS = ['ternary', 'goto', 'ternary,goto', 'ternary,goto,break,switch']
+
+# (files, extra arguments, check lists)
+# own_header/angle_include.c includes course.h with #include <...> so needs -I
+FILES = [
+	(['own_header/main.c', 'own_header/goto.c'], [], OWN_HEADER_CHECK_LISTS),
+	(['own_header/main.c', 'own_header/goto.c', 'own_header/angle_include.c'], ['-I', 'own_header'], OWN_HEADER_CHECK_LISTS),
+	(['system_header/max.c'], [], ['ternary', 'ternary,array']),
+	(['system_header/fd_zero.c'], [], ['do_while', 'do_while,array']),
+]
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+	c_check = args.c_check
+	os.chdir(os.path.dirname(os.path.abspath(__file__)))
+	n_runs = 0
+	for (source_files, include_args, check_lists) in FILES:
+		for source_file in source_files:
+			for checks in check_lists:
+				arguments = ['--no-colorize', '--not-permitted', checks] + include_args + [source_file]
+				expected = run(c_check, arguments)
+				p = run(c_check, ['--lexical-fast-path'] + arguments)
+				if (p.stdout, p.returncode) != (expected.stdout, expected.returncode):
+					print(f"{' '.join(arguments)}: output {(p.stdout, p.returncode)}, should be {(expected.stdout, expected.returncode)}")
+					return
+				if expected.returncode != 1:
+					print(f"{' '.join(arguments)}: exit status {expected.returncode}, should be 1")
+					return
+				n_runs += 1
+	print(f"same output with & without --lexical-fast-path for {n_runs} runs")
+
+
+def run(c_check, arguments):
+	return subprocess.run([sys.executable, c_check] + arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+if __name__ == "__main__":
+	main()
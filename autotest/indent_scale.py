@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+# check c_check.py's indenting checks on large generated files (10000 lines by default)
+# finish within a time budget and mark exactly the lines they should
+#
+# usage: indent_scale.py [--lines N] [--budget-seconds N] [--c-check path]
+
+import argparse, os, re, subprocess, sys, tempfile, time
+
+from autotest_helpers import add_c_check_argument
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--lines", type=int, default=10000, help="approximate number of lines in each generated file")
+	parser.add_argument("--budget-seconds", type=float, default=10, help="maximum time to check each file")
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		for (name, generate) in GENERATORS.items():
+			(source, incorrect_lines, mixed_functions) = generate(args.lines)
+			filename = os.path.join(directory, name + '.c')
+			with open(filename, 'w') as f:
+				f.write(source)
+			start = time.perf_counter()
+			p = subprocess.run([sys.executable, args.c_check, '--no-colorize', '--warning', 'indenting', filename], stdout=subprocess.PIPE, universal_newlines=True)
+			elapsed = time.perf_counter() - start
+			marked_lines = [int(line_number) for line_number in re.findall(r'^ *(\d+)\*', p.stdout, flags=re.M)]
+			n_mixed = p.stdout.count('is indented with a mixture of tabs and spaces')
+			if elapsed > args.budget_seconds:
+				print(f"{name}: took {elapsed:.1f} seconds, budget is {args.budget_seconds} seconds")
+			elif marked_lines != incorrect_lines:
+				print(f"{name}: {len(marked_lines)} lines marked as incorrectly indented, should be {len(incorrect_lines)}")
+			elif n_mixed != mixed_functions:
+				print(f"{name}: {n_mixed} functions reported as mixing tabs and spaces, should be {mixed_functions}")
+			else:
+				print(f"{name}: indenting checked within budget")
+
+
+def one_function(n_lines):
+	"""
+	a single long function with every third line incorrectly indented
+	every incorrect line has the function as its parent, so every line is shown
+	@returns (source, line numbers which should be marked, number of functions mixing tabs and spaces)
+	"""
+	lines = ['int main(void) {', '\tint x = 0;']
+	incorrect_lines = []
+	while len(lines) < n_lines:
+		if len(lines) % 3 == 0:
+			lines.append('    x = x + 1;')
+			incorrect_lines.append(len(lines))
+		else:
+			lines.append('\tx = x + 2;')
+	lines += ['\treturn x;', '}']
+	return ('\n'.join(lines) + '\n', incorrect_lines, 1)
+
+
+def many_functions(n_lines):
+	"""
+	many short functions, every fourth with one incorrectly indented line
+	@returns (source, line numbers which should be marked, number of functions mixing tabs and spaces)
+	"""
+	lines = []
+	incorrect_lines = []
+	i = 0
+	while len(lines) < n_lines:
+		lines += [f'int f{i}(int x) {{', '\tx = x + 1;', '\tx = x * 2;']
+		if i % 4 == 0:
+			lines.append('\t\tx = x - 3;')
+			incorrect_lines.append(len(lines))
+		lines += ['\treturn x;', '}', '']
+		i += 1
+	return ('\n'.join(lines) + '\n', incorrect_lines, 0)
+
+
+GENERATORS = {
+	"one_function" : one_function,
+	"many_functions" : many_functions,
+}
+
+
+if __name__ == "__main__":
+	main()
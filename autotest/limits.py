@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+
+# check c_check.py's --timeout, --cpu-limit & --memory-limit stop a file which would take
+# a very long time & a lot of memory to check (a macro bomb), reporting it with a distinct exit status,
+# while files before & after it are checked as usual, with & without --batch
+#
+# usage: limits.py [--c-check path]
+
+import argparse, json, os, subprocess, sys, tempfile
+
+from autotest_helpers import add_c_check_argument
+
+# expected exit status, message & --batch record limit for each way of limiting a file
+LIMITS = {
+	'timeout': (['--timeout', '2'], "took longer than 2 seconds"),
+	'cpu': (['--cpu-limit', '1'], "used more than 1 seconds of CPU time"),
+	'memory': (['--memory-limit', '600'], "used more than 600MB of memory"),
+}
+
+LIMIT_EXCEEDED_EXIT_STATUS = 3
+
+CHECKS = ['--no-colorize', '--not-permitted', 'goto,break,ternary']
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+	autotest_directory = os.path.dirname(os.path.abspath(__file__))
+
+	with tempfile.TemporaryDirectory() as directory:
+		source_files = []
+		for name in ['goto.c', 'break.c', 'ternary.c']:
+			with open(os.path.join(autotest_directory, name)) as f:
+				source = f.read()
+			source_files.append(os.path.join(directory, name))
+			with open(source_files[-1], 'w') as f:
+				f.write(source)
+		bomb = os.path.join(directory, 'bomb.c')
+		with open(bomb, 'w') as f:
+			f.write(macro_bomb())
+		for (limit, (limit_args, description)) in LIMITS.items():
+			print(f"{limit}: {check_limit(args.c_check, source_files, bomb, limit, limit_args, description)}")
+
+
+def check_limit(c_check, source_files, bomb, limit, limit_args, description):
+	"""
+	check the bomb among source_files, with limit_args, comparing with checking source_files without limits
+	@returns description of the result
+	"""
+	files = source_files[0:1] + [bomb] + source_files[1:]
+	message = f"c_check: {bomb} not checked: {description}\n"
+
+	expected = run(c_check, CHECKS + source_files)
+	p = run(c_check, CHECKS + limit_args + files)
+	if p.returncode != LIMIT_EXCEEDED_EXIT_STATUS:
+		return f"exit status {p.returncode}, should be {LIMIT_EXCEEDED_EXIT_STATUS}"
+	if p.stdout != expected.stdout:
+		return f"output for other files differs:\n{p.stdout}\nshould be:\n{expected.stdout}"
+	if message not in p.stderr:
+		return f"stderr is {p.stderr!r}, should include {message!r}"
+
+	expected = [json.loads(line) for line in run(c_check, CHECKS + ['--batch'] + source_files).stdout.splitlines()]
+	p = run(c_check, CHECKS + limit_args + ['--batch', '-j', '2'] + files)
+	records = [json.loads(line) for line in p.stdout.splitlines()]
+	if p.returncode != LIMIT_EXCEEDED_EXIT_STATUS:
+		return f"--batch exit status {p.returncode}, should be {LIMIT_EXCEEDED_EXIT_STATUS}"
+	if [record['path'] for record in records] != files:
+		return f"--batch records for {[record['path'] for record in records]}, should be {files}"
+	bomb_record = records.pop(1)
+	if (bomb_record['exit_status'], bomb_record.get('limit'), bomb_record['stderr']) != (LIMIT_EXCEEDED_EXIT_STATUS, limit, message):
+		return f"--batch record {bomb_record}"
+	if [record['output'] for record in records] != [record['output'] for record in expected]:
+		return "--batch output for other files differs"
+	return "file stopped, other files checked"
+
+
+def run(c_check, arguments):
+	return subprocess.run([sys.executable, c_check] + arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def macro_bomb():
+	"""
+	a program whose macros expand exponentially, so parsing it would take a very long time & a lot of memory
+	"""
+	lines = ['#define A0 1']
+	lines += [f'#define A{i} (A{i - 1} + A{i - 1})' for i in range(1, 40)]
+	lines += ['int main(void) {', '\treturn A32 > 0;', '}']
+	return '\n'.join(lines) + '\n'
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+# check c_check.py --lsp publishes the same diagnostics as c_check.py prints for each autotest .c file,
+# given as editor buffers for files which don't exist, that a burst of edits is checked once,
+# and that the server exits cleanly
+#
+# usage: lsp.py [--timeout-seconds N] [--c-check path] [file.c ...]
+
+import argparse, glob, json, os, re, select, subprocess, sys, tempfile
+
+from autotest_helpers import add_c_check_argument
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--timeout-seconds", type=float, default=30, help="maximum time to wait for a response")
+	add_c_check_argument(parser)
+	parser.add_argument("source_files", nargs='*', help="C files to open, default autotest/*.c")
+	args = parser.parse_args()
+	source_files = args.source_files or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.c')))
+
+	sys.path.insert(0, os.path.dirname(args.c_check))
+	import c_check
+	# checks spanning the files of a program need --project
+	check_args = ['--no-colorize', '--warning', ','.join(check for check in c_check.CHECKS if check not in c_check.PROGRAM_CHECKS)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		server = LanguageServerClient([sys.executable, args.c_check, '--lsp', '--lsp-debounce', '0.1'] + check_args, args.timeout_seconds)
+		try:
+			server.request('initialize', {'processId': os.getpid(), 'rootUri': None, 'capabilities': {}})
+			server.notify('initialized', {})
+			mismatches = compare_diagnostics(server, source_files, directory, args.c_check, check_args)
+			for mismatch in mismatches:
+				print(f"diagnostics: {mismatch}")
+			if not mismatches:
+				print("diagnostics: same as c_check output for every file")
+			print(f"edits: {check_edits(server, directory)}")
+			server.request('shutdown', None)
+			server.notify('exit', None)
+			print(f"exit status: {server.process.wait(args.timeout_seconds)}")
+		finally:
+			server.process.kill()
+			server.process.wait()
+
+
+def compare_diagnostics(server, source_files, directory, c_check_path, check_args):
+	"""
+	open each file as a buffer of a file in directory, which doesn't exist,
+	comparing the diagnostics published with those c_check prints for the file
+	@returns list of descriptions of files whose diagnostics differ
+	"""
+	mismatches = []
+	for filename in source_files:
+		uri = 'file://' + os.path.join(directory, os.path.basename(filename))
+		with open(filename, encoding='utf-8', errors='replace') as f:
+			server.notify('textDocument/didOpen', {'textDocument': {'uri': uri, 'languageId': 'c', 'version': 1, 'text': f.read()}})
+		published = server.diagnostics(uri)
+		if published is None:
+			mismatches.append(f"{filename}: no diagnostics published")
+			continue
+		mismatch = compare_file_diagnostics(filename, published['diagnostics'], c_check_path, check_args)
+		server.notify('textDocument/didClose', {'textDocument': {'uri': uri}})
+		closed = server.diagnostics(uri)
+		if mismatch is None and (closed is None or closed['diagnostics']):
+			mismatch = f"{filename}: diagnostics not cleared when closed"
+		if mismatch is not None:
+			mismatches.append(mismatch)
+	return mismatches
+
+
+def compare_file_diagnostics(filename, diagnostics, c_check_path, check_args):
+	"""
+	@returns description of how diagnostics published for filename differ from those c_check prints, None if they don't
+	"""
+	published = sorted((d['range']['start']['line'] + 1, d['range']['start']['character'] + 1, d['message'].splitlines()[0]) for d in diagnostics)
+	p = subprocess.run([sys.executable, c_check_path] + check_args + [filename], stdout=subprocess.PIPE, universal_newlines=True)
+	printed = re.findall(r'^.*?:(?:(\d+):(\d+):?)? (?:error|warning|fatal error): (.*)$', p.stdout, flags=re.M)
+	located = sorted((int(line), int(column), message) for (line, column, message) in printed if line)
+	if [d for d in published if d[2] not in {message for (_, _, message) in printed}]:
+		return f"{filename}: diagnostics published which c_check doesn't print"
+	if [d for d in published if d in located] != located:
+		return f"{filename}: published {published} should include {located}"
+	return None
+
+
+def check_edits(server, directory):
+	"""
+	@returns description of the result of editing a document many times in quick succession
+	"""
+	uri = 'file://' + os.path.join(directory, 'edited.c')
+	source = 'int main(void) {{\n\tint x = {};\n\treturn x;\n}}\n'
+	server.notify('textDocument/didOpen', {'textDocument': {'uri': uri, 'languageId': 'c', 'version': 1, 'text': source.format(0)}})
+	if server.diagnostics(uri) is None:
+		return "no diagnostics published"
+	for version in range(2, 22):
+		text = source.format(version) if version < 21 else source.format('x ? 1 : 2')
+		server.notify('textDocument/didChange', {'textDocument': {'uri': uri, 'version': version}, 'contentChanges': [{'text': text}]})
+	published = server.diagnostics(uri)
+	if published is None or published['version'] != 21:
+		return f"should publish diagnostics for version 21 only, published {published}"
+	if [d['message'] for d in published['diagnostics']] != ["ternary 'if' ?: used"]:
+		return f"published {published['diagnostics']} for last edit"
+	if server.diagnostics(uri, timeout=1) is not None:
+		return "diagnostics published more than once"
+	return "only last edit checked"
+
+
+class LanguageServerClient():
+	def __init__(self, command, timeout):
+		self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+		self.timeout = timeout
+		self.next_id = 1
+		self.received = b''
+
+	def send(self, message):
+		body = json.dumps({'jsonrpc': '2.0', **message}).encode('utf-8')
+		self.process.stdin.write(f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body)
+		self.process.stdin.flush()
+
+	def notify(self, method, params):
+		self.send({'method': method, 'params': params})
+
+	def request(self, method, params):
+		self.next_id += 1
+		self.send({'id': self.next_id, 'method': method, 'params': params})
+		while True:
+			message = self.receive(self.timeout)
+			if message is None or message.get('id') == self.next_id:
+				return message
+
+	def diagnostics(self, uri, timeout=None):
+		"""
+		@returns params of the next diagnostics published for uri, None if none are within timeout seconds
+		"""
+		while True:
+			message = self.receive(timeout or self.timeout)
+			if message is None:
+				return None
+			if message.get('method') == 'textDocument/publishDiagnostics' and message['params']['uri'] == uri:
+				return message['params']
+
+	def receive(self, timeout):
+		"""
+		@returns next message from the server, None if there isn't one within timeout seconds
+		"""
+		while True:
+			(headers, separator, body) = self.received.partition(b'\r\n\r\n')
+			length = re.search(rb'(?i)content-length: *(\d+)', headers)
+			if separator and length and len(body) >= int(length.group(1)):
+				self.received = body[int(length.group(1)):]
+				return json.loads(body[0:int(length.group(1))])
+			(readable, _, _) = select.select([self.process.stdout], [], [], timeout)
+			data = os.read(self.process.stdout.fileno(), 65536) if readable else b''
+			if not data:
+				return None
+			self.received += data
+
+
+if __name__ == "__main__":
+	main()
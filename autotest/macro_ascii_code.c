@@ -0,0 +1,11 @@
+#include <stdio.h>
+
+#define NEWLINE 10
+
+int main(void) {
+	int c = getchar();
+	while (c != NEWLINE) {
+		c = getchar();
+	}
+	return 0;
+}
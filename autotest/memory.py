@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+# check c_check.py's memory use stays flat when it checks many files (5000 by default) in one process,
+# sampling its resident set size as it writes a --batch line for each file,
+# and that recycling libclang's index with --max-rss doesn't change results
+#
+# usage: memory.py [--files N] [--max-growth-mb N] [--c-check path]
+
+import argparse, json, os, subprocess, sys, tempfile
+
+from autotest_helpers import add_c_check_argument
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--files", type=int, default=5000, help="number of generated files checked")
+	parser.add_argument("--samples", type=int, default=10, help="number of times memory use is sampled")
+	parser.add_argument("--max-growth-mb", type=float, default=8, help="maximum growth in resident set size after the first sample")
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		for i in range(args.files):
+			with open(os.path.join(directory, f'file_{i:05}.c'), 'w') as f:
+				f.write(program(i))
+		(records, samples) = check_files(args, directory, [], args.files // args.samples)
+		if len(records) != args.files:
+			print(f"{len(records)} files checked, should be {args.files}")
+		elif len(samples) < 2:
+			print("c_check's memory use could not be sampled")
+		elif max(samples[1:]) - samples[0] > args.max_growth_mb:
+			print(f"memory use grew from {samples[0]:.0f}MB to {max(samples[1:]):.0f}MB checking {args.files} files")
+		else:
+			print(f"memory use flat checking {args.files} files")
+
+		# a limit below c_check's memory use recycles the index after every file
+		subset = [record['path'] for record in records[0:200]]
+		manifest = os.path.join(directory, 'manifest')
+		with open(manifest, 'w') as f:
+			f.write(''.join(path + '\n' for path in subset))
+		(recycled_records, _) = check_files(args, None, ['--manifest', manifest, '--max-rss', '1'], len(subset))
+		if [record['output'] for record in recycled_records] != [record['output'] for record in records[0:200]]:
+			print("results differ when the index is recycled")
+		else:
+			print("results unchanged when the index is recycled")
+
+
+def check_files(args, directory, extra_args, sample_interval):
+	"""
+	run c_check --batch on directory (if not None), sampling its resident set size every sample_interval files
+	@returns (list of batch records, list of samples in megabytes)
+	"""
+	command = [sys.executable, args.c_check, '--batch', '--warning', 'goto,ternary,indenting,multiple_malloc,integer_ascii_code'] + extra_args + ([directory] if directory else [])
+	p = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+	records = []
+	samples = []
+	for line in p.stdout:
+		records.append(json.loads(line))
+		if len(records) % sample_interval == 0:
+			rss = resident_set_size(p.pid)
+			if rss is not None:
+				samples.append(rss)
+	p.wait()
+	return (records, samples)
+
+
+def resident_set_size(pid):
+	"""
+	@returns resident set size of process pid in megabytes, None if it can't be found
+	"""
+	try:
+		with open(f'/proc/{pid}/status') as f:
+			for line in f:
+				if line.startswith('VmRSS:'):
+					return int(line.split()[1]) / 1024
+	except OSError:
+		pass
+	return None
+
+
+def program(i):
+	"""
+	a small program, varied so files differ in shape & size, without #includes so they're quick to parse
+	"""
+	functions = []
+	for j in range(i % 7 + 1):
+		functions.append(f"""
+int f{j}(int x) {{
+	int total = {i};
+	while (x > {j}) {{
+		if (x % 2 == 0) {{
+			total = total + x * {j + 1};
+		}} else {{
+			total = total - 10;
+		}}
+		x = x - 1;
+	}}
+	return total > 0 ? total : -total;
+}}
+""")
+	calls = ' + '.join(f'f{j}({i % 100})' for j in range(i % 7 + 1))
+	return f"void *malloc(unsigned long size);\n{''.join(functions)}\nint main(void) {{\n\tint *p = malloc({i % 50 + 1});\n\treturn {calls} + (p == 0);\n}}\n"
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,8 @@
+// rsum of a character, in Latin-1
+#include <stdio.h>
+
+int main(void) {
+	int c = getchar();
+	printf("caf\n");
+	return c == 10;
+}
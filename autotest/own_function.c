@@ -0,0 +1,21 @@
+#include <stdio.h>
+
+// string.h & unistd.h also declare functions named index & link, but these are the program's own
+int index(int array[], int length, int value) {
+	for (int i = 0; i < length; i = i + 1) {
+		if (array[i] == value) {
+			return i;
+		}
+	}
+	return -1;
+}
+
+int link(int a, int b) {
+	return a * 10 + b;
+}
+
+int main(void) {
+	int array[] = {3, 1, 4};
+	printf("%d %d\n", index(array, 3, 4), link(1, 2));
+	return 0;
+}
@@ -0,0 +1,12 @@
+#include <stdio.h>
+#include <course.h>
+
+int main(int argc, char *argv[]) {
+	if (argc < 2) {
+		goto usage;
+	}
+	printf("%s\n", CHOOSE(argc > 2, argv[2], argv[1]));
+	return 0;
+usage:
+	return 1;
+}
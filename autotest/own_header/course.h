@@ -0,0 +1,3 @@
+// macros which expand to constructs checks look for
+#define CHOOSE(condition, a, b) ((condition) ? (a) : (b))
+#define GIVE_UP(label) goto label
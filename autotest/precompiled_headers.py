@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+# check c_check.py --precompiled-headers gives the same output & exit status as parsing without a precompiled header,
+# for the autotest .c files & files which start by including the headers, one with a compile error
+# so it is reparsed without the precompiled header, when the precompiled header is built & when it is reused
+#
+# usage: precompiled_headers.py [--c-check path]
+
+import argparse, glob, os, subprocess, sys, tempfile
+
+from autotest_helpers import add_c_check_argument
+
+HEADERS = ['stdio.h', 'stdlib.h']
+
+PROGRAMS = {
+	'uses_headers.c': """#include <stdio.h>
+#include <stdlib.h>
+
+int main(void) {
+	int c = getchar();
+	while (c != 10) {
+		c = getchar();
+	}
+	return c ? EXIT_SUCCESS : EXIT_FAILURE;
+}
+""",
+	'compile_error.c': """#include <stdio.h>
+#include <stdlib.h>
+
+int main(void) {
+	printf("%d\\n", undeclared);
+	return EXIT_SUCCESS;
+}
+""",
+	'other_order.c': """#include <stdlib.h>
+#include <stdio.h>
+
+int main(void) {
+	goto end;
+end:
+	return EXIT_SUCCESS;
+}
+""",
+}
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+	autotest_directory = os.path.dirname(os.path.abspath(__file__))
+	sys.path.insert(0, os.path.dirname(args.c_check))
+	import c_check
+	# checks spanning the files of a program need --project
+	check_args = ['--no-colorize', '--warning', ','.join(check for check in c_check.CHECKS if check not in c_check.PROGRAM_CHECKS)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		source_files = sorted(glob.glob(os.path.join(autotest_directory, '*.c')))
+		for (name, source) in PROGRAMS.items():
+			source_files.append(os.path.join(directory, name))
+			with open(source_files[-1], 'w') as f:
+				f.write(source)
+		cache_directory = os.path.join(directory, 'cache')
+		pch_args = ['--precompiled-headers', ','.join(HEADERS), '--cache-dir', cache_directory]
+
+		n_mismatches = 0
+		for source_file in source_files:
+			expected = run(args.c_check, check_args + [source_file])
+			for attempt in ['built', 'reused']:
+				p = run(args.c_check, check_args + pch_args + [source_file])
+				if (p.stdout, p.returncode) != (expected.stdout, expected.returncode):
+					print(f"{os.path.basename(source_file)}: output with precompiled header {attempt} {(p.stdout, p.returncode)}, should be {(expected.stdout, expected.returncode)}")
+					n_mismatches += 1
+			if source_file.endswith('compile_error.c') and 'undeclared' not in p.stdout:
+				print(f"compile error not reported: {p.stdout}")
+				n_mismatches += 1
+		if not glob.glob(os.path.join(cache_directory, '*.pch')):
+			print("precompiled header not built")
+		elif not n_mismatches:
+			print("same output for every file")
+
+
+def run(c_check, arguments):
+	return subprocess.run([sys.executable, c_check] + arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+if __name__ == "__main__":
+	main()
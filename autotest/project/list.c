@@ -0,0 +1,20 @@
+#include <stdlib.h>
+#include "list.h"
+
+int n_nodes;
+
+struct node *list_add(struct node *head, int value) {
+	struct node *n = malloc(sizeof *n);
+	n->value = value;
+	n->next = head;
+	n_nodes = n_nodes + 1;
+	return n;
+}
+
+void list_free(struct node *head) {
+	while (head != NULL) {
+		struct node *next = head->next;
+		free(head);
+		head = next;
+	}
+}
@@ -0,0 +1,10 @@
+struct node {
+	int value;
+	struct node *next;
+};
+
+extern int n_nodes;
+
+struct node *list_add(struct node *head, int value);
+int list_length(struct node *head);
+void list_free(struct node *head);
@@ -0,0 +1,15 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include "list.h"
+
+int n_nodes;
+
+int main(void) {
+	int *counts = malloc(10 * sizeof (int));
+	struct node *head = NULL;
+	head = list_add(head, 1);
+	printf("%d %d\n", list_length(head), n_nodes);
+	list_free(head);
+	free(counts);
+	return 0;
+}
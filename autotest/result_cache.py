@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+
+# check c_check.py --cache-dir replays results for unchanged files, rechecks a file when a header it includes changes,
+# removes least recently used results to stay under --cache-max-size,
+# and gives the same results when many processes share a cache directory
+#
+# usage: result_cache.py [--processes N] [--c-check path]
+
+import argparse, json, os, subprocess, sys, tempfile
+
+from autotest_helpers import add_c_check_argument
+
+CHECKS = ['--no-colorize', '--warning', 'integer-ascii-code']
+
+PROGRAM = """#include <stdio.h>
+#include "course.h"
+
+int main(void) {{
+	int c = NEXT_CHARACTER();
+	while (c != {code}) {{
+		c = NEXT_CHARACTER();
+	}}
+	return 0;
+}}
+"""
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--processes", type=int, default=8, help="number of processes sharing a cache directory")
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		source_directory = os.path.join(directory, 'source')
+		os.mkdir(source_directory)
+		header = os.path.join(source_directory, 'course.h')
+		write_file(header, "#define NEXT_CHARACTER() getchar()\n")
+		# ASCII codes 65.. so each file has a different result of the same size
+		source_files = []
+		for i in range(20):
+			source_files.append(os.path.join(source_directory, f'file{i:02}.c'))
+			write_file(source_files[-1], PROGRAM.format(code=65 + i))
+		checker = CacheChecker(args.c_check, directory)
+		print(f"hit: {check_hit(checker, source_files[0])}")
+		print(f"header changed: {check_header_changed(checker, source_files[0], header)}")
+		print(f"eviction: {check_eviction(checker, source_files[0:5])}")
+		print(f"concurrent: {check_concurrent(checker, source_files, args.processes)}")
+
+
+class CacheChecker():
+	"""
+	runs c_check.py on files with a cache directory, noting which files were parsed
+	"""
+	def __init__(self, c_check, directory):
+		self.c_check = c_check
+		self.directory = directory
+		self.n_cache_directories = 0
+		self.n_runs = 0
+
+	def new_cache_directory(self):
+		self.n_cache_directories += 1
+		return os.path.join(self.directory, f'cache{self.n_cache_directories}')
+
+	def start(self, cache_directory, source_files, cache_args=()):
+		"""
+		@returns (process, filename timings are written to)
+		"""
+		self.n_runs += 1
+		timings_json = os.path.join(self.directory, f'timings{self.n_runs}.json')
+		command = [sys.executable, self.c_check] + CHECKS + ['--cache-dir', cache_directory, '--timings-json', timings_json] + list(cache_args) + source_files
+		return (subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True), timings_json)
+
+	def finish(self, process, timings_json):
+		"""
+		@returns (stdout, stderr, exit status, list of files parsed)
+		"""
+		(stdout, stderr) = process.communicate()
+		with open(timings_json) as f:
+			reports = json.load(f)
+		os.unlink(timings_json)
+		parsed = [report['file'] for report in reports if 'parse' in report['phases']]
+		return (stdout, stderr, process.returncode, parsed)
+
+	def run(self, cache_directory, source_files, cache_args=()):
+		return self.finish(*self.start(cache_directory, source_files, cache_args))
+
+	def expected(self, source_files):
+		"""
+		@returns (stdout, stderr, exit status) checking source_files without a cache
+		"""
+		p = subprocess.run([sys.executable, self.c_check] + CHECKS + source_files, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+		return (p.stdout, p.stderr, p.returncode)
+
+
+def check_hit(checker, source_file):
+	"""
+	@returns description of the result of checking a file twice
+	"""
+	cache_directory = checker.new_cache_directory()
+	expected = checker.expected([source_file])
+	first = checker.run(cache_directory, [source_file])
+	second = checker.run(cache_directory, [source_file])
+	if first[0:3] != expected or second[0:3] != expected:
+		return f"results {first[0:3]} & {second[0:3]}, should be {expected}"
+	if (first[3], second[3]) != ([source_file], []):
+		return f"parsed {first[3]} then {second[3]}, should be parsed the first time only"
+	return "unchanged file not parsed again"
+
+
+def check_header_changed(checker, source_file, header):
+	"""
+	@returns description of the result of checking a file, changing a header it includes & checking it again
+	"""
+	cache_directory = checker.new_cache_directory()
+	original_result = checker.run(cache_directory, [source_file])
+	with open(header) as f:
+		original = f.read()
+	try:
+		# c is no longer a character, so the ASCII code isn't reported
+		write_file(header, "#define NEXT_CHARACTER() 0\n")
+		expected = checker.expected([source_file])
+		changed = checker.run(cache_directory, [source_file])
+	finally:
+		write_file(header, original)
+	if changed[3] != [source_file]:
+		return "file not parsed again after header changed"
+	if changed[0:3] != expected:
+		return f"result {changed[0:3]} after header changed, should be {expected}"
+	if not original_result[0] or changed[0]:
+		return "warning should be given only before header changed"
+	return "file rechecked"
+
+
+def check_eviction(checker, source_files):
+	"""
+	check 4 files with room in the cache for a little more than 4 results,
+	check the first file again, then check a fifth file
+	the second & third file's results should be removed, as they were used least recently
+
+	@returns description of the result
+	"""
+	cache_directory = checker.new_cache_directory()
+	checker.run(cache_directory, source_files[0:1])
+	result_size = cache_size(cache_directory)
+	max_size = str(4.5 * result_size / (1024 * 1024))
+	cache_directory = checker.new_cache_directory()
+	for source_file in source_files[0:4] + source_files[0:1] + source_files[4:5]:
+		checker.run(cache_directory, [source_file], ['--cache-max-size', max_size])
+	if cache_size(cache_directory) > 4.5 * result_size:
+		return f"cache is {cache_size(cache_directory)} bytes, should be at most {4.5 * result_size}"
+	parsed = []
+	for source_file in source_files[0:5]:
+		parsed += checker.run(cache_directory, [source_file], ['--cache-max-size', '64'])[3]
+	if parsed != source_files[1:3]:
+		return f"results removed for {parsed}, should be {source_files[1:3]}"
+	return "least recently used results removed"
+
+
+def check_concurrent(checker, source_files, n_processes):
+	"""
+	check source_files in n_processes processes at once sharing a cache directory,
+	with the cache large enough for all results, then so small results are removed while others are added
+
+	@returns description of the result
+	"""
+	expected = checker.expected(source_files)
+	for max_size in ['64', str(8 * cache_size_for(checker, source_files[0]) / (1024 * 1024))]:
+		cache_directory = checker.new_cache_directory()
+		for repetition in range(2):
+			# processes check the files in different orders, so they write the same entries at different times
+			processes = []
+			for i in range(n_processes):
+				files = source_files[i:] + source_files[:i]
+				processes.append((checker.start(cache_directory, files, ['--cache-max-size', max_size]), files))
+			for ((process, timings_json), files) in processes:
+				(stdout, stderr, returncode, parsed) = checker.finish(process, timings_json)
+				if (sorted(stdout.splitlines()), stderr, returncode) != (sorted(expected[0].splitlines()), expected[1], expected[2]):
+					return f"cache max size {max_size}: result {(stdout, stderr, returncode)}, should be {expected}"
+				if max_size == '64' and repetition and parsed:
+					return f"{parsed} parsed again with results cached"
+	return f"same results from {n_processes} processes"
+
+
+def cache_size_for(checker, source_file):
+	cache_directory = checker.new_cache_directory()
+	checker.run(cache_directory, [source_file])
+	return cache_size(cache_directory)
+
+
+def cache_size(cache_directory):
+	"""
+	@returns total size of the results in cache_directory
+	"""
+	size = 0
+	for (root, _, filenames) in os.walk(cache_directory):
+		if root != cache_directory:
+			size += sum(os.path.getsize(os.path.join(root, filename)) for filename in filenames)
+	return size
+
+
+def write_file(filename, contents):
+	with open(filename, 'w') as f:
+		f.write(contents)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+
+# check time spent importing modules when c_check.py is run with the given arguments is within a budget
+# and that clang.cindex is not imported if there is nothing to check
+#
+# modules python imports at startup anyway (e.g. site) are not counted
+# the best of several runs is used to reduce noise
+#
+# usage: startup_time.py [--budget-ms N] [--runs N] [--c-check path] [c_check arguments ...]
+
+import argparse, subprocess, sys
+
+from autotest_helpers import add_c_check_argument
+
+# modules which should only be imported when there's a file to check
+HEAVY_MODULES = ['clang.cindex', 'ctypes', 'termcolor', 'colorama', 'multiprocessing', 'subprocess']
+
+
+def main():
+	# -h/--help are passed to c_check.py
+	parser = argparse.ArgumentParser(add_help=False)
+	parser.add_argument("--budget-ms", type=float, default=25, help="maximum time importing modules in milliseconds")
+	parser.add_argument("--runs", type=int, default=5, help="number of runs, best time is used")
+	add_c_check_argument(parser)
+	(args, c_check_args) = parser.parse_known_args()
+
+	startup_modules = import_times(['-c', 'pass'])
+	best_time = None
+	for _ in range(args.runs):
+		times = import_times([args.c_check] + c_check_args)
+		total = sum(time for (module, time) in times.items() if module not in startup_modules)
+		if best_time is None or total < best_time:
+			best_time = total
+			best_times = times
+
+	heavy = [module for module in HEAVY_MODULES if module in best_times]
+	if heavy:
+		print(f"modules imported though there is nothing to check: {' '.join(heavy)}")
+	if best_time / 1000 > args.budget_ms:
+		print(f"import time {best_time / 1000:.1f}ms exceeds budget of {args.budget_ms}ms")
+		slowest = sorted((time, module) for (module, time) in best_times.items() if module not in startup_modules)
+		for (time, module) in reversed(slowest[-5:]):
+			print(f"{time / 1000:8.1f}ms {module}")
+	if not heavy and best_time / 1000 <= args.budget_ms:
+		print("import time within budget")
+
+
+def import_times(python_args):
+	"""
+	@returns dict of module name -> microseconds spent importing the module itself (excluding its imports)
+	"""
+	p = subprocess.run([sys.executable, '-X', 'importtime'] + python_args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+	times = {}
+	for line in p.stderr.splitlines():
+		if not line.startswith('import time:'):
+			continue
+		fields = line[len('import time:'):].split('|')
+		if len(fields) == 3 and fields[0].strip().isdigit():
+			times[fields[2].strip()] = int(fields[0])
+	return times
+
+
+if __name__ == "__main__":
+	main()
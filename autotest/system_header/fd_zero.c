@@ -0,0 +1,7 @@
+#include <sys/select.h>
+
+int main(void) {
+	fd_set descriptors[1];
+	FD_ZERO(&descriptors[0]);
+	return 0;
+}
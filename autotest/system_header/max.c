@@ -0,0 +1,7 @@
+#include <sys/param.h>
+
+int main(int argc, char *argv[]) {
+	int digits[10] = {0};
+	digits[0] = argc;
+	return MAX(digits[0], 2);
+}
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+
+# check c_check.py runs clang to find its resource directory & libclang only when
+# $C_CHECK_TOOLCHAIN_CACHE doesn't have them for the clang binary's current modification time,
+# and never when --clang-resource-dir & --libclang are given
+#
+# usage: toolchain_cache.py [--c-check path]
+
+import argparse, json, os, shutil, subprocess, sys, tempfile
+
+from autotest_helpers import add_c_check_argument
+
+CHECKS = ['--no-colorize', '--not-permitted', 'goto', 'goto.c']
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+	c_check = args.c_check
+	os.chdir(os.path.dirname(os.path.abspath(__file__)))
+	clang = shutil.which('clang')
+	if not clang:
+		print("no 'clang' binary found")
+		return
+
+	with tempfile.TemporaryDirectory() as directory:
+		# a clang which records each time it is run
+		bin_directory = os.path.join(directory, 'bin')
+		os.mkdir(bin_directory)
+		runs_file = os.path.join(directory, 'runs')
+		wrapper = os.path.join(bin_directory, 'clang')
+		with open(wrapper, 'w') as f:
+			f.write(f'#!/bin/sh\necho >>"{runs_file}"\nexec "{clang}" "$@"\n')
+		os.chmod(wrapper, 0o755)
+		cache_file = os.path.join(directory, 'cache', 'toolchain.json')
+		environment = dict(os.environ, PATH=bin_directory + os.pathsep + os.environ['PATH'], C_CHECK_TOOLCHAIN_CACHE=cache_file)
+		expected_environment = dict(os.environ, C_CHECK_TOOLCHAIN_CACHE=os.path.join(directory, 'expected.json'))
+		expected = subprocess.run([sys.executable, c_check] + CHECKS, env=expected_environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+		def clang_runs(extra_args=[]):
+			"""
+			@returns number of times clang was run checking a file, None if the output is wrong
+			"""
+			if os.path.exists(runs_file):
+				os.unlink(runs_file)
+			p = subprocess.run([sys.executable, c_check] + extra_args + CHECKS, env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+			if (p.stdout, p.returncode) != (expected.stdout, expected.returncode):
+				return None
+			if not os.path.exists(runs_file):
+				return 0
+			with open(runs_file) as f:
+				return len(f.read().splitlines())
+
+		print(f"first run: clang run {clang_runs()} times")
+		print(f"cache used: clang run {clang_runs()} times")
+		stat = os.stat(wrapper)
+		os.utime(wrapper, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+		print(f"clang modified: clang run {clang_runs()} times")
+
+		with open(cache_file) as f:
+			toolchain = json.load(f)[os.path.realpath(wrapper)]
+		os.unlink(cache_file)
+		runs = clang_runs(['--clang-resource-dir', toolchain['resource_dir'], '--libclang', toolchain['libclang']])
+		print(f"--clang-resource-dir & --libclang: clang run {runs} times, cache {'written' if os.path.exists(cache_file) else 'not written'}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+# check c_check.py --watch rechecks a file when it is edited, with the same output as checking it afresh,
+# and that the recheck is quick, using inotify and then polling
+#
+# usage: watch.py [--edits N] [--budget-ms N] [--c-check path]
+
+import argparse, os, re, select, subprocess, sys, tempfile, time
+
+from autotest_helpers import add_c_check_argument
+
+CHECKS = 'goto,break,ternary,indenting,global_variable'
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--edits", type=int, default=8, help="number of edits made to the watched file")
+	parser.add_argument("--budget-ms", type=float, default=100, help="maximum median time c_check reports for rechecking an edited file")
+	parser.add_argument("--timeout-seconds", type=float, default=30, help="maximum time to wait for a recheck")
+	add_c_check_argument(parser)
+	args = parser.parse_args()
+
+	for (name, watch_args) in [('inotify', []), ('polling', ['--watch-poll-interval', '0.1'])]:
+		with tempfile.TemporaryDirectory() as directory:
+			print(f"{name}: {watch(args, directory, watch_args)}")
+
+
+def watch(args, directory, watch_args):
+	"""
+	start c_check --watch on a generated file, edit it repeatedly, comparing each recheck with a fresh check
+	@returns description of the result
+	"""
+	filename = os.path.join(directory, 'watched.c')
+	write_file(filename, program(0))
+	command = [sys.executable, args.c_check, '--no-colorize', '--warning', CHECKS, '--watch'] + watch_args + [filename]
+	p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	try:
+		output = read_check(p, args.timeout_seconds)
+		if output is None:
+			return "initial check not finished"
+		times = []
+		for edit in range(1, args.edits + 1):
+			# a different modification time & size is needed for polling to notice the change
+			time.sleep(0.02)
+			write_file(filename, program(edit))
+			output = read_check(p, args.timeout_seconds)
+			if output is None:
+				return f"edit {edit} not rechecked"
+			(output, milliseconds) = output
+			expected = fresh_check(args.c_check, filename)
+			if output != expected:
+				return f"edit {edit} output differs from checking afresh:\n{output}\nshould be:\n{expected}"
+			times.append(milliseconds)
+		median = sorted(times)[len(times) // 2]
+		if median > args.budget_ms:
+			return f"median recheck took {median}ms, budget is {args.budget_ms}ms"
+		return "edits rechecked correctly within budget"
+	finally:
+		p.kill()
+		p.wait()
+
+
+def read_check(p, timeout):
+	"""
+	@returns (output, milliseconds) of the next check c_check reports finishing, None if it doesn't within timeout seconds
+	"""
+	data = b''
+	deadline = time.time() + timeout
+	while True:
+		match = re.search(rb'^c_check: checked \S+ in (\d+)ms\n', data, flags=re.M)
+		if match:
+			return (strip_messages(data[:match.start()].decode()), int(match.group(1)))
+		(readable, _, _) = select.select([p.stdout], [], [], max(0, deadline - time.time()))
+		if not readable:
+			return None
+		chunk = os.read(p.stdout.fileno(), 65536)
+		if not chunk:
+			return None
+		data += chunk
+
+
+def fresh_check(c_check, filename):
+	p = subprocess.run([sys.executable, c_check, '--no-colorize', '--warning', CHECKS, filename], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+	return strip_messages(p.stdout)
+
+
+def strip_messages(output):
+	"""
+	remove c_check's own messages, e.g. about watching files, leaving what it reports about the file checked
+	"""
+	return ''.join(line for line in output.splitlines(keepends=True) if not line.startswith('c_check: '))
+
+
+def program(edit):
+	"""
+	a program with many functions, edit chooses which function is changed & how
+	@returns C source
+	"""
+	functions = []
+	for i in range(40):
+		body = [f'\tint n = x + {i};', '\twhile (n > 0) {', '\t\tn = n - 2;', '\t}', '\treturn n;']
+		if i == edit * 5 % 40:
+			body = [
+				[f'\tint n = x + {i};', '\tgoto done;', 'done:', '\treturn n;'],
+				[f'\tint n = x ? {i} : 1;', '    return n;'],
+				['\twhile (x) {', '\t\tbreak;', '\t}', '\treturn x;'],
+			][edit % 3]
+		functions.append(f'int f{i}(int x) {{\n' + '\n'.join(body) + '\n}\n')
+	if edit % 4 == 0:
+		functions.insert(edit % 40, f'int global_{edit};\n')
+	return '#include <stdio.h>\n\n' + '\n'.join(functions) + '\nint main(void) {\n\treturn f0(1);\n}\n'
+
+
+def write_file(filename, contents):
+	# written then renamed, as many editors do, so the file is never seen partly written
+	with open(filename + '.tmp', 'w') as f:
+		f.write(contents)
+	os.replace(filename + '.tmp', filename)
+
+
+if __name__ == "__main__":
+	main()
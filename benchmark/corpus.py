@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+
+# generate synthetic student-style C programs of configurable shape and size
+#
+# usage: benchmark/corpus.py [--shapes a,b] [--sizes 10,100] [--seed N] directory
+# writes directory/SHAPE_SIZE.c for each shape & size
+#
+# size is the number of repeated units in a program, each unit is 5-40 lines
+
+import argparse, os, random, sys
+
+
+def autotest_unit(i, rng):
+	"""
+	constructs from the autotest cases, so every check in c_check.CHECKS fires
+	"""
+	return f"""
+int global_{i};
+const int const_global_{i};
+
+union union_{i} {{
+    int b;
+}};
+
+int unit_{i}(int argc, char *argv[]) {{
+	static int static_{i};
+	int int_array[3];
+	char char_array[3];
+	char c;
+	c = getchar();
+	int d = getchar();
+	while (d != 10) {{
+		if (d >= 65 && d <= 90) {{
+			break;
+		}}
+		d = getchar();
+		continue;
+	}}
+	do {{
+	}} while (0);
+	switch (argc) {{
+	default: ;
+	}}
+	malloc(4);
+	malloc(4);
+	assert(argc);
+	strlen("");
+	read(0, 0, 0);
+	goto done_{i};
+done_{i}:
+	return argc ? 1 : (d, 0);
+}}
+
+int badly_indented_{i}(void) {{
+	return 0;
+    return 1;
+        return 2;
+}}
+"""
+
+
+def if_else_chain_unit(i, rng):
+	"""
+	one arm of a long if/else-if chain, see program_if_else_chain
+	"""
+	return f"""	}} else if (c == {48 + i % 75}) {{
+		n = n * {i % 7 + 2} + {i};
+		if (n > {1000 + i}) {{
+			n = n % {97 + i % 13};
+		}}
+"""
+
+
+def long_function_unit(i, rng):
+	"""
+	statements for a single long function, see program_long_function
+	"""
+	return f"""	total = total + values[{i % 100}] * {i % 9 + 1};
+	if (total > {10000 + i}) {{
+		total = total - {i};
+	}}
+	for (int j = 0; j < {i % 5 + 1}; j++) {{
+		values[j] = total % {i % 31 + 2};
+	}}
+"""
+
+
+def globals_unit(i, rng):
+	return f"""int counter_{i};
+double ratio_{i} = {i}.5;
+char name_{i}[16];
+static int hidden_{i};
+"""
+
+
+def getchar_loop_unit(i, rng):
+	return f"""
+int read_line_{i}(char line[], int size) {{
+	int n = 0;
+	int c = getchar();
+	while (c != EOF && c != 10 && n < size - 1) {{
+		if (c >= 97 && c <= 122) {{
+			c = c - 32;
+		}}
+		line[n] = c;
+		n = n + 1;
+		c = getchar();
+	}}
+	line[n] = '\\0';
+	return n;
+}}
+"""
+
+
+def badly_indented_unit(i, rng):
+	indents = ['', '\t', '\t\t', '    ', '  ', '\t ']
+	lines = [
+		'int x = {i};',
+		'while (x > 0) {{',
+		'x = x - 1;',
+		'if (x % 2 == 0) {{',
+		'putchar(\'a\' + x % 26);',
+		'}}',
+		'}}',
+		'return x;',
+	]
+	body = ''.join(rng.choice(indents) + line.format(i=i) + '\n' for line in lines)
+	return f"\nint indented_{i}(void) {{\n{body}}}\n"
+
+
+HEADERS = "#include <assert.h>\n#include <stdio.h>\n#include <stdlib.h>\n#include <string.h>\n#include <unistd.h>\n"
+
+
+def program_autotest(size, rng):
+	units = ''.join(autotest_unit(i, rng) for i in range(size))
+	return f"{HEADERS}{units}\nint main(void) {{\n\treturn 0;\n}}\n"
+
+
+def program_if_else_chain(size, rng):
+	arms = ''.join(if_else_chain_unit(i, rng) for i in range(size))
+	return f"""{HEADERS}
+int main(void) {{
+	int n = 0;
+	int c = getchar();
+	if (c == 10) {{
+		n = 1;
+{arms}	}} else {{
+		n = -1;
+	}}
+	printf("%d\\n", n);
+	return 0;
+}}
+"""
+
+
+def program_long_function(size, rng):
+	statements = ''.join(long_function_unit(i, rng) for i in range(size))
+	return f"""{HEADERS}
+int main(void) {{
+	int values[100] = {{0}};
+	int total = 0;
+{statements}	printf("%d\\n", total);
+	return 0;
+}}
+"""
+
+
+def program_globals(size, rng):
+	units = ''.join(globals_unit(i, rng) for i in range(size))
+	return f"{HEADERS}\n{units}\nint main(void) {{\n\treturn counter_0;\n}}\n"
+
+
+def program_getchar_loops(size, rng):
+	units = ''.join(getchar_loop_unit(i, rng) for i in range(size))
+	return f"{HEADERS}{units}\nint main(void) {{\n\tchar line[80];\n\treturn read_line_0(line, 80);\n}}\n"
+
+
+def program_badly_indented(size, rng):
+	units = ''.join(badly_indented_unit(i, rng) for i in range(size))
+	return f"{HEADERS}{units}\nint main(void) {{\n\treturn 0;\n}}\n"
+
+
+SHAPES = {
+	"autotest"       : program_autotest,
+	"if_else_chain"  : program_if_else_chain,
+	"long_function"  : program_long_function,
+	"globals"        : program_globals,
+	"getchar_loops"  : program_getchar_loops,
+	"badly_indented" : program_badly_indented,
+}
+
+
+def generate(shape, size, seed=0):
+	"""
+	@returns C source of a program of the given shape with size units
+	the same shape, size & seed always produce the same program
+	"""
+	return SHAPES[shape](size, random.Random(f'{seed}-{shape}-{size}'))
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--shapes", default=','.join(SHAPES), help=f"comma separated shapes, default all of: {','.join(SHAPES)}")
+	parser.add_argument("--sizes", default="10,100,1000", help="comma separated sizes")
+	parser.add_argument("--seed", type=int, default=0, help="random seed")
+	parser.add_argument("directory", help="directory to write programs to")
+	args = parser.parse_args()
+
+	os.makedirs(args.directory, exist_ok=True)
+	for shape in args.shapes.split(','):
+		if shape not in SHAPES:
+			print(f"{sys.argv[0]}: unknown shape '{shape}'", file=sys.stderr)
+			sys.exit(1)
+		for size in args.sizes.split(','):
+			with open(os.path.join(args.directory, f'{shape}_{size}.c'), 'w') as f:
+				f.write(generate(shape, int(size), args.seed))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+# compare time taken to parse files with and without a precompiled header
+# of the headers most files include
+#
+# usage: benchmark/preamble.py [-r repeats] [--headers stdio.h,stdlib.h] [file.c ...]
+# with no files, the autotest corpus is used
+# files which don't start by including the headers are parsed without the precompiled header
+
+import argparse, glob, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c_check
+import clang.cindex
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-r", "--repeats", type=int, default=10, help="number of times each parse is timed")
+	parser.add_argument("--headers", default="stdio.h,stdlib.h,string.h", help="comma separated headers to precompile")
+	parser.add_argument("source_files", nargs='*', help="C files to parse, default autotest/*.c")
+	args = parser.parse_args()
+
+	headers = args.headers.split(',')
+	with tempfile.TemporaryDirectory() as directory:
+		source_files = args.source_files
+		if not source_files:
+			autotest_directory = os.path.join(os.path.dirname(c_check.__file__), 'autotest')
+			source_files = sorted(glob.glob(os.path.join(autotest_directory, '*.c')))
+			# a file which uses all the headers
+			synthetic_file = os.path.join(directory, 'synthetic.c')
+			with open(synthetic_file, 'w') as f:
+				f.write(''.join(f'#include <{header}>\n' for header in headers))
+				f.write('int main(void) {\n\tprintf("%d\\n", atoi("42"));\n\treturn 0;\n}\n')
+			source_files.append(synthetic_file)
+
+		index_parse_args = c_check.get_library_include() + ['-DNDEBUG']
+		index = clang.cindex.Index.create()
+		precompiled_header = c_check.PrecompiledHeader(headers, directory, index_parse_args)
+
+		start = time.perf_counter()
+		precompiled_header.build(index)
+		print(f"precompiled header built in {(time.perf_counter() - start)*1000:.1f}ms")
+
+		total_plain = total_precompiled = 0
+		print(f"{'file':32} {'plain ms':>9} {'pch ms':>9} {'speedup':>8}")
+		for filename in source_files:
+			with open(filename, encoding='utf-8', errors='replace') as f:
+				C_source = f.read()
+			extra_args = precompiled_header.parse_args(index, C_source)
+			plain_time = best_time(lambda: index.parse(filename, args=index_parse_args), args.repeats)
+			precompiled_time = best_time(lambda: index.parse(filename, args=index_parse_args + extra_args), args.repeats)
+			total_plain += plain_time
+			total_precompiled += precompiled_time
+			used = '' if extra_args else ' (not applicable)'
+			print(f"{os.path.basename(filename):32} {plain_time*1000:9.2f} {precompiled_time*1000:9.2f} {plain_time/precompiled_time:7.1f}x{used}")
+		print(f"{'total':32} {total_plain*1000:9.2f} {total_precompiled*1000:9.2f} {total_plain/total_precompiled:7.1f}x")
+
+
+def best_time(function, repeats):
+	times = []
+	for _ in range(repeats):
+		start = time.perf_counter()
+		function()
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+# compare time taken by the syntax tree checks with and without the token pre-scan
+# which drops checks whose trigger tokens aren't in the file (see prune_check_plan)
+#
+# usage: benchmark/prescan.py [-r repeats] [--checks a,b] [file.c ...]
+# with no files, clean programs generated by corpus.py and the autotest corpus are used
+
+import argparse, glob, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c_check
+import corpus
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-r", "--repeats", type=int, default=10, help="number of times each walk is timed")
+	parser.add_argument("--checks", default="break,continue,do_while,goto,switch,ternary,union", help="comma separated checks to enable, default keyword checks")
+	parser.add_argument("source_files", nargs='*', help="C files to check, default generated programs and autotest/*.c")
+	args = parser.parse_args()
+
+	index_parse_args = c_check.get_library_include() + ['-DNDEBUG']
+	index = c_check.clang.cindex.Index.create()
+	with tempfile.TemporaryDirectory() as directory:
+		source_files = args.source_files
+		if not source_files:
+			for shape in ['long_function', 'getchar_loops', 'globals']:
+				for size in [10, 100]:
+					filename = os.path.join(directory, f'{shape}_{size}.c')
+					with open(filename, 'w') as f:
+						f.write(corpus.generate(shape, size))
+					source_files.append(filename)
+			autotest_directory = os.path.join(os.path.dirname(c_check.__file__), 'autotest')
+			source_files += sorted(glob.glob(os.path.join(autotest_directory, '*.c')))
+
+		check_args = checks_args(args.checks)
+		total_full = total_pruned = 0
+		print(f"{'file':32} {'nodes':>6} {'checks':>6} {'kept':>5} {'full ms':>8} {'pre-scan ms':>11} {'speedup':>8}")
+		for filename in source_files:
+			tu = index.parse(filename, args=index_parse_args)
+			nodes = c_check.abstract_syntax_tree_nodes(tu.cursor)
+			with open(filename, encoding='utf-8', errors='replace') as f:
+				source_lines = f.read().splitlines()
+			tokens = c_check.TokenIndex(tu)
+			tokens.tokenize()
+
+			check_args.full_parse = False
+			kept = c_check.prune_check_plan(check_args.check_plan, '\n'.join(source_lines))
+			pruned_time = best_time(lambda: walk(nodes, check_args, source_lines, filename, tokens), args.repeats)
+			check_args.full_parse = True
+			full_time = best_time(lambda: walk(nodes, check_args, source_lines, filename, tokens), args.repeats)
+			total_full += full_time
+			total_pruned += pruned_time
+			n_checks = len({function for checks in check_args.check_plan.values() for (function, _) in checks})
+			n_kept = len({function for checks in kept.values() for (function, _) in checks})
+			print(f"{os.path.basename(filename):32} {len(nodes):6} {n_checks:6} {n_kept:5} {full_time*1000:8.2f} {pruned_time*1000:11.2f} {full_time/pruned_time:7.1f}x")
+		print(f"{'total':32} {'':6} {'':6} {'':5} {total_full*1000:8.2f} {total_pruned*1000:11.2f} {total_full/total_pruned:7.1f}x")
+
+
+def checks_args(checks):
+	argv = sys.argv
+	try:
+		sys.argv = ['c_check.py', '--no-colorize', '--warning', checks]
+		args = c_check.args_parser()
+	finally:
+		sys.argv = argv
+	c_check.set_colored(args)
+	args.check_plan = c_check.get_check_plan(args)
+	args.banned_header_index = c_check.BannedHeaderIndex(c_check.banned_headers(args), None, c_check.get_library_include() + ['-DNDEBUG'])
+	return args
+
+
+def walk(nodes, args, source_lines, filename, tokens):
+	"""
+	run the syntax tree checks as check_file does, including the pre-scan unless args.full_parse
+	"""
+	checker = c_check.SyntaxTreeChecker(args, source_lines, filename, tokens)
+	if checker.enabled():
+		c_check.walk_syntax_tree(nodes[0], [checker])
+		checker.finish()
+
+
+def best_time(function, repeats):
+	times = []
+	for _ in range(repeats):
+		start = time.perf_counter()
+		function()
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+
+if __name__ == "__main__":
+	main()
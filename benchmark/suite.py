@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+
+# time each phase of checking synthetic programs (see corpus.py) of a range of shapes & sizes
+# and the autotest corpus, with every check enabled
+#
+# results are written as JSON; given a previous results file, any phase which has become
+# more than --threshold times slower is reported and the exit status is 1
+#
+# usage: benchmark/suite.py [--shapes a,b] [--sizes 10,100,300] [-r repeats] [-o results.json] [--baseline old.json] [file.c ...]
+
+import argparse, ctypes, glob, io, json, os, platform, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c_check
+import corpus
+
+RESULTS_FORMAT_VERSION = 1
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--shapes", default=','.join(corpus.SHAPES), help="comma separated corpus shapes")
+	parser.add_argument("--sizes", default="10,100,300", help="comma separated corpus sizes")
+	parser.add_argument("-r", "--repeats", type=int, default=3, help="number of times each phase is timed, best time is used")
+	parser.add_argument("-o", "--output", help="write results as JSON to this file")
+	parser.add_argument("--baseline", help="compare against results in this JSON file")
+	parser.add_argument("--threshold", type=float, default=1.5, help="report phases slower than this multiple of the baseline")
+	parser.add_argument("--min-difference-ms", type=float, default=1, help="ignore phases slower by less than this")
+	parser.add_argument("source_files", nargs='*', help="C files to time as well as the generated corpus, default autotest/*.c")
+	args = parser.parse_args()
+
+	index_parse_args = c_check.get_library_include() + ['-DNDEBUG']
+	check_args = all_checks_args(index_parse_args)
+	index = c_check.clang.cindex.Index.create()
+
+	source_files = args.source_files
+	if not source_files:
+		autotest_directory = os.path.join(os.path.dirname(c_check.__file__), 'autotest')
+		source_files = sorted(glob.glob(os.path.join(autotest_directory, '*.c')))
+
+	results = {}
+	with tempfile.TemporaryDirectory() as directory:
+		unexercised = unexercised_checks(index, index_parse_args, directory)
+		if unexercised:
+			print(f"checks not exercised by the autotest shape: {' '.join(unexercised)}", file=sys.stderr)
+			sys.exit(1)
+
+		print(f"{'program':28} {'lines':>7} {'nodes':>7} {'parse ms':>9} {'checks ms':>9} {'total ms':>9}")
+		for shape in args.shapes.split(','):
+			for size in args.sizes.split(','):
+				filename = os.path.join(directory, f'{shape}_{size}.c')
+				with open(filename, 'w') as f:
+					f.write(corpus.generate(shape, int(size)))
+				results[f'{shape}/{size}'] = time_program(index, filename, check_args, index_parse_args, args.repeats)
+				print_result(f'{shape}/{size}', results[f'{shape}/{size}'])
+		for filename in source_files:
+			name = 'file/' + os.path.basename(filename)
+			results[name] = time_program(index, filename, check_args, index_parse_args, args.repeats)
+			print_result(name, results[name])
+
+	report = {
+		'version': RESULTS_FORMAT_VERSION,
+		'python': platform.python_version(),
+		'libclang': c_check.clang.cindex.Config.library_file,
+		'repeats': args.repeats,
+		'results': results,
+	}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1, sort_keys=True)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		if baseline.get('version') != RESULTS_FORMAT_VERSION:
+			print(f"{args.baseline}: results format version {baseline.get('version')} not {RESULTS_FORMAT_VERSION}", file=sys.stderr)
+			sys.exit(1)
+		regressions = find_regressions(baseline['results'], results, args.threshold, args.min_difference_ms)
+		for (name, phase, old, new) in regressions:
+			print(f"regression: {name} {phase} {old:.2f}ms -> {new:.2f}ms ({new/old:.1f}x)")
+		if regressions:
+			sys.exit(1)
+
+
+def all_checks_args(index_parse_args):
+	"""
+	@returns c_check arguments with every check enabled as a warning, except c_check.PROGRAM_CHECKS which need --project
+	"""
+	argv = sys.argv
+	try:
+		sys.argv = ['c_check.py', '--no-colorize', '--warning', ','.join(check for check in c_check.CHECKS if check not in c_check.PROGRAM_CHECKS), '--banned-headers', 'stdlib.h']
+		args = c_check.args_parser()
+	finally:
+		sys.argv = argv
+	c_check.set_colored(args)
+	args.result_cache = None
+	args.precompiled_header = None
+	args.banned_header_index = c_check.BannedHeaderIndex(c_check.banned_headers(args), None, index_parse_args)
+	args.lexical_triggers = None
+	return args
+
+
+def time_program(index, filename, args, index_parse_args, repeats):
+	"""
+	time_phases but a program c_check can't handle is recorded rather than stopping the benchmark
+	"""
+	try:
+		return time_phases(index, filename, args, index_parse_args, repeats)
+	except RecursionError:
+		return {'error': 'recursion limit exceeded'}
+	except ctypes.ArgumentError as e:
+		# ctypes turns a RecursionError in a libclang call into an ArgumentError
+		if 'RecursionError' not in str(e):
+			raise
+		return {'error': 'recursion limit exceeded'}
+
+
+def time_phases(index, filename, args, index_parse_args, repeats):
+	"""
+	check filename as c_check.check_file does, timing each phase separately
+	checkers are timed by walking the syntax tree once for each checker
+	@returns dict with the file's lines & nodes and best time in milliseconds of each phase
+	"""
+	with open(filename, encoding='utf-8', errors='replace') as f:
+		source = f.read()
+	source_lines = source.splitlines()
+	args.check_plan = c_check.get_check_plan(args)
+	best = {}
+	def timed(phase, function):
+		start = time.perf_counter()
+		value = function()
+		elapsed = (time.perf_counter() - start) * 1000
+		best[phase] = min(best.get(phase, elapsed), elapsed)
+		return value
+
+	for _ in range(repeats):
+		tu = timed('parse', lambda: index.parse(filename, args=index_parse_args))
+		nodes = timed('syntax_tree', lambda: c_check.abstract_syntax_tree_nodes(tu.cursor))
+		tokens = c_check.TokenIndex(tu)
+		timed('tokens', tokens.tokenize)
+		checkers = []
+		for checker_class in c_check.CHECKERS:
+			checker = checker_class(args, source_lines, filename, tokens)
+			if checker.enabled():
+				def check():
+					c_check.walk_syntax_tree(nodes[0], [checker])
+					checker.finish()
+				timed('checker:' + checker_class.__name__, check)
+				checkers.append(checker)
+		diagnostics = [diagnostic for checker in checkers for diagnostic in sorted(checker.diagnostics, key=c_check.diagnostic_order)]
+		timed('output', lambda: c_check.render_diagnostics(diagnostics, args, lambda filename: source_lines))
+
+	phases = {phase: round(milliseconds, 3) for (phase, milliseconds) in best.items()}
+	phases['total'] = round(sum(best.values()), 3)
+	return {'lines': len(source_lines), 'nodes': len(nodes), 'phases': phases}
+
+
+def unexercised_checks(index, index_parse_args, directory):
+	"""
+	@returns list of checks which produce no output on the autotest shape
+	checks spanning the files of a program (c_check.PROGRAM_CHECKS) aren't run on a single file
+	"""
+	filename = os.path.join(directory, 'exercise_all_checks.c')
+	with open(filename, 'w') as f:
+		f.write(corpus.generate('autotest', 2))
+	unexercised = []
+	for check in c_check.CHECKS:
+		if check in c_check.PROGRAM_CHECKS:
+			continue
+		args = all_checks_args(index_parse_args)
+		for other_check in c_check.CHECKS:
+			setattr(args, other_check, 'warning' if other_check == check else None)
+		args.check_plan = c_check.get_check_plan(args)
+		stdout = io.StringIO()
+		real_stdout = sys.stdout
+		try:
+			sys.stdout = stdout
+			c_check.check_file(index, filename, args, index_parse_args)
+		finally:
+			sys.stdout = real_stdout
+		if not stdout.getvalue():
+			unexercised.append(check)
+	return unexercised
+
+
+def find_regressions(baseline_results, results, threshold, min_difference_ms):
+	"""
+	@returns list of (program, phase, baseline ms, new ms) for phases slower by more than threshold
+	"""
+	regressions = []
+	for (name, result) in sorted(results.items()):
+		if name not in baseline_results or 'phases' not in result or 'phases' not in baseline_results[name]:
+			continue
+		for (phase, new) in sorted(result['phases'].items()):
+			old = baseline_results[name]['phases'].get(phase)
+			if old and new > old * threshold and new - old > min_difference_ms:
+				regressions.append((name, phase, old, new))
+	return regressions
+
+
+def print_result(name, result):
+	if 'error' in result:
+		print(f"{name:28} {result['error']}")
+		return
+	phases = result['phases']
+	checks = sum(milliseconds for (phase, milliseconds) in phases.items() if phase.startswith('checker:'))
+	print(f"{name:28} {result['lines']:7} {result['nodes']:7} {phases['parse']:9.2f} {checks:9.2f} {phases['total']:9.2f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+# compare time taken to extract the main file's nodes from a translation unit
+# when cursors are filtered by comparing their file name (as c_check used to)
+# against comparing file handles (abstract_syntax_tree_nodes)
+#
+# usage: benchmark/traversal.py [-r repeats] [file.c ...]
+# with no files, the autotest corpus is used
+
+import argparse, glob, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c_check
+import clang.cindex
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-r", "--repeats", type=int, default=20, help="number of times each traversal is timed")
+	parser.add_argument("source_files", nargs='*', help="C files to traverse, default autotest/*.c")
+	args = parser.parse_args()
+
+	source_files = args.source_files
+	if not source_files:
+		autotest_directory = os.path.join(os.path.dirname(c_check.__file__), 'autotest')
+		source_files = sorted(glob.glob(os.path.join(autotest_directory, '*.c')))
+
+	index_parse_args = c_check.get_library_include() + ['-DNDEBUG']
+	index = clang.cindex.Index.create()
+
+	total_filename = total_handle = 0
+	print(f"{'file':32} {'nodes':>6} {'file name ms':>12} {'file handle ms':>14} {'speedup':>8}")
+	for filename in source_files:
+		tu = index.parse(filename, args=index_parse_args)
+		n_nodes = len(c_check.abstract_syntax_tree_nodes(tu.cursor))
+		filename_time = best_time(lambda: filename_traversal(tu.cursor), args.repeats)
+		handle_time = best_time(lambda: c_check.abstract_syntax_tree_nodes(tu.cursor), args.repeats)
+		total_filename += filename_time
+		total_handle += handle_time
+		print(f"{os.path.basename(filename):32} {n_nodes:6} {filename_time*1000:12.2f} {handle_time*1000:14.2f} {filename_time/handle_time:7.1f}x")
+	print(f"{'total':32} {'':6} {total_filename*1000:12.2f} {total_handle*1000:14.2f} {total_filename/total_handle:7.1f}x")
+
+
+def filename_traversal(translation_unit_cursor):
+	"""
+	abstract_syntax_tree_nodes but filtering cursors by comparing file names as c_check used to
+	"""
+	main_filename = translation_unit_cursor.displayname
+	def is_from_main_file(cursor):
+		filename = cursor.location.file.name if cursor.location.file else cursor.displayname
+		return filename == main_filename
+	nodes = [c_check.Node(translation_unit_cursor, None, None, 0)]
+	c_check.add_syntax_tree_children(nodes[0], nodes, main_filename, is_from_main_file)
+	return nodes
+
+
+def best_time(function, repeats):
+	times = []
+	for _ in range(repeats):
+		start = time.perf_counter()
+		function()
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+
+if __name__ == "__main__":
+	main()
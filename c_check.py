@@ -17,9 +17,9 @@
 #
 # Repo: https://github.com/COMP1511UNSW/c_check
 
-import argparse, collections, glob, os, re, sys
-import clang.cindex
-from clang.cindex import CursorKind as CKind, TypeKind as TKind
+import argparse, bisect, collections, functools, io, os, re, sys, time
+
+# clang.cindex is slow to import, so it is imported by import_clang only when a file is to be checked
 
 # clang cindex source: https://github.com/llvm-mirror/clang/blob/master/bindings/python/clang/cindex.py
 # API description: https://www.pydoc.io/pypi/prophy-1.0.1/autoapi/parsers/clang/cindex/index.html#parsers.clang.cindex.Cursor
@@ -36,6 +36,7 @@ c_check.py --not-permitted=global_variable,goto,static_local_variable \
 
 SYNTAX_TREE_NODE_CHECKS = {
 	"array"                 : "check if array used (for exercises where ararys are not permitted)",
+	"banned_header"          : "check for use of functions from the headers given with --banned-headers (for exercises where these are not permitted)",
 	"break"                  : "check if break used",
 	"comma"                  : "check if comma operator used",
 	"continue"               : "check if continue used",
@@ -52,6 +53,52 @@ SYNTAX_TREE_NODE_CHECKS = {
 	"unistd_library"         : "check for use of functions from unistd.h",
 }
 
+# the only kinds of node (CursorKind names) each syntax tree check can fire on
+SYNTAX_TREE_NODE_CHECK_KINDS = {
+	"array"                 : ["VAR_DECL"],
+	"banned_header"          : ["DECL_REF_EXPR"],
+	"break"                  : ["BREAK_STMT"],
+	"comma"                  : ["BINARY_OPERATOR"],
+	"continue"               : ["CONTINUE_STMT"],
+	"do_while"               : ["DO_STMT"],
+	"global_variable"       : ["VAR_DECL"],
+	"goto"                   : ["GOTO_STMT"],
+	"multiple_malloc"        : ["CALL_EXPR"],
+	"non_char_array"        : ["VAR_DECL"],
+	"static_local_variable" : ["VAR_DECL"],
+	"string_library"         : ["DECL_REF_EXPR"],
+	"switch"                 : ["SWITCH_STMT"],
+	"ternary"              : ["CONDITIONAL_OPERATOR"],
+	"union"                  : ["UNION_DECL"],
+	"unistd_library"         : ["DECL_REF_EXPR"],
+}
+
+
+# checks which can only fire if one of these tokens is in the source, see lexical_triggers
+LEXICAL_CHECK_TRIGGERS = {
+	"array"                 : ["["],
+	"break"                  : ["break"],
+	"comma"                  : [","],
+	"continue"               : ["continue"],
+	"do_while"               : ["do"],
+	"goto"                   : ["goto"],
+	"multiple_malloc"        : ["malloc", "calloc", "realloc"],
+	"non_char_array"        : ["["],
+	"static_local_variable" : ["static"],
+	"switch"                 : ["switch"],
+	"ternary"              : ["?"],
+	"union"                  : ["union"],
+}
+
+
+# checks for use of functions, variables & enumeration constants declared by headers, see BannedHeaderIndex
+# the headers for banned_header are given with --banned-headers
+BANNED_HEADER_CHECKS = {
+	"banned_header"          : [],
+	"string_library"         : ["string.h"],
+	"unistd_library"         : ["unistd.h"],
+}
+
 
 FUNCTION_CHECKS = {
 	"assign_getchar_char"    : "check for common bug of getchar/fgetc/getc being assigned to char variable, e.g char c = getchar();",
@@ -60,9 +107,16 @@ FUNCTION_CHECKS = {
 }
 
 
-CHECKS = {**SYNTAX_TREE_NODE_CHECKS, **FUNCTION_CHECKS}
+# checks spanning the files of a program, run over summaries of each file with --project, see check_program_summaries
+PROGRAM_CHECKS = {
+	"linking"                : "check functions & global variables used are defined, and defined only once, across the files of a program (with --project)",
+}
+
+
+CHECKS = {**SYNTAX_TREE_NODE_CHECKS, **FUNCTION_CHECKS, **PROGRAM_CHECKS}
 
-EXTRA_HELP_TEXT = f"""
+def extra_help_text():
+	return f"""
 
 For example:
 
@@ -72,9 +126,84 @@ Available checkers are:
 
 """ + '\n'.join(f"{k:24} - {v}" for (k,v) in sorted(CHECKS.items()))
 
+
 def main():
 	args = args_parser()
 
+	if args.daemon:
+		run_daemon(args.socket or daemon_socket_path(), args.daemon_idle_timeout)
+		return
+
+	batch = args.batch or args.manifest
+	source_files = [filename for filename in args.source_files if filename.endswith('.c')]
+
+	args.lexical_triggers = lexical_triggers(args)
+	if args.lexical_triggers is not None and not batch and not args.watch and not args.timings and not args.timings_json:
+		# files which can't fail any check produce no output, so needn't be looked at again
+		source_files = [filename for filename in source_files if lexical_triggers_in_file(filename, args.lexical_triggers)]
+
+	if not source_files and not batch and not args.lsp:
+		# nothing to check, so don't pay for loading clang
+		sys.exit(0)
+
+	if batch or args.lsp:
+		# batch & LSP output is JSON so escape sequences would only get in the way
+		args.colorize = False
+	set_colored(args)
+
+	# if NDEBUG is not specified use of assert will trigger ternary warnings
+	index_parse_args = get_library_include(args.clang_resource_dir, args.libclang) + ['-I' + i for i in args.include_directories] + ['-DNDEBUG']
+
+	args.check_plan = get_check_plan(args)
+
+	if args.timings or args.timings_json:
+		count_libclang_calls()
+
+	args.result_cache = None
+	if args.cache_dir and not args.debug:
+		args.result_cache = ResultCache(args.cache_dir, args.cache_max_size, args, index_parse_args)
+
+	args.precompiled_header = None
+	if args.precompiled_headers and not args.debug:
+		headers = [header.strip() for header in args.precompiled_headers.split(',') if header.strip()]
+		args.precompiled_header = PrecompiledHeader(headers, args.cache_dir, index_parse_args)
+
+	args.banned_header_index = BannedHeaderIndex(banned_headers(args), args.cache_dir, index_parse_args)
+
+	if args.watch:
+		watch_files(source_files, args, index_parse_args)
+
+	if args.lsp:
+		sys.exit(0 if LanguageServer(args, index_parse_args).run() else 1)
+
+	jobs = args.jobs if args.jobs is not None else (0 if args.project else 1)
+	jobs = jobs or os.cpu_count() or 1
+	args.isolated = bool(args.timeout or args.cpu_limit or args.memory_limit)
+	args.limits_exceeded = False
+	if batch:
+		args.manifest_unreadable = False
+		error_occurred = not check_batch(batch_source_files(args), args, index_parse_args, jobs)
+		# otherwise a run which checked nothing would look clean
+		error_occurred = error_occurred or args.manifest_unreadable
+	elif args.project:
+		error_occurred = not check_program(source_files, args, index_parse_args, jobs)
+	elif (jobs > 1 and len(source_files) > 1) or args.isolated:
+		error_occurred = not check_files_parallel(source_files, args, index_parse_args, jobs)
+	else:
+		index = clang.cindex.Index.create()
+		error_occurred = False
+		for filename in source_files:
+			if not check_file_timed(index, filename, args, index_parse_args):
+				error_occurred = True
+			index = index_within_memory_limit(index, args)
+	if args.timings_json:
+		write_timings_json(args.timings_json)
+	if args.limits_exceeded:
+		sys.exit(LIMIT_EXCEEDED_EXIT_STATUS)
+	sys.exit(1 if error_occurred else 0)
+
+
+def set_colored(args):
 	global colored
 	if args.colorize:
 		try:
@@ -93,21 +222,10 @@ def main():
 	else:
 		colored = lambda x, *args, **kwargs: x
 
-	# if NDEBUG is not specified use of assert will trigger ternary warnings
-	index_parse_args = get_library_include() + ['-I' + i for i in args.include_directories] + ['-DNDEBUG']
-
-	index = clang.cindex.Index.create()
-	error_occurred = False
-	for filename in args.source_files:
-		if filename.endswith('.c'):
-			if not check_file(index, filename, args, index_parse_args):
-				error_occurred = True
-	sys.exit(1 if error_occurred else 0)
-
 
 
 def args_parser():
-	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=EXTRA_HELP_TEXT)
+	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=extra_help_text())
 
 	parser.add_argument("--error", help="error if any of comma separated list of checks fails, exit with status 1")
 	parser.add_argument("--not-permitted", help="error plus not permitted message if any of comma separated list of checks fails, exit with status 1")
@@ -126,13 +244,58 @@ def args_parser():
 	parser.add_argument("--no-colorize", action="store_false", dest='colorize', help="do not colorize output")
 
 
+	parser.add_argument("--max-diagnostics", type=int, default=100, help="show at most this many diagnostics of each level for a file, counting the rest, 0 for no limit")
+
+	parser.add_argument("--lexical-fast-path", action="store_false", dest="full_parse", default=True, help="don't parse files which can't fail the checks enabled, judging from their tokens, so compile errors in them aren't reported")
+	parser.add_argument("--full-parse", action="store_true", dest="full_parse", default=True, help="parse every file (default)")
+
 	parser.add_argument("-I",  dest="include_directories", action="append", default=[], help="add directory for include directories")
+	parser.add_argument("-j", "--jobs", type=int, help="check up to this many files in parallel, 0 for one per CPU, default 1 or one per CPU with --project")
+	parser.add_argument("--max-rss", type=float, help="if memory use (resident set size) exceeds this many megabytes after checking a file, recycle the libclang index & free memory")
+	parser.add_argument("--timeout", type=float, help="check each file in a worker process, killed if the file takes longer than this many seconds")
+	parser.add_argument("--cpu-limit", type=float, help="check each file in a worker process, killed if the file uses more than this many seconds of CPU time")
+	parser.add_argument("--memory-limit", type=float, help="check each file in a worker process limited to this many megabytes of address space")
+	parser.add_argument("--project", action="store_true", help="check the files given as one program, multiple_malloc & linking checks span all the files")
+	parser.add_argument("--cache-dir", default=os.environ.get('C_CHECK_CACHE_DIR'), help="cache results in this directory, default $C_CHECK_CACHE_DIR")
+	parser.add_argument("--cache-max-size", type=float, default=64, help="maximum size of cache in megabytes, least recently used results are removed")
+	parser.add_argument("--banned-headers", default=os.environ.get('C_CHECK_BANNED_HEADERS'), help="comma separated list of headers, e.g. math.h,ctype.h, whose functions the banned_header check reports, default $C_CHECK_BANNED_HEADERS")
+	parser.add_argument("--precompiled-headers", default=os.environ.get('C_CHECK_PRECOMPILED_HEADERS'), help="comma separated list of headers, e.g. stdio.h,stdlib.h, to precompile for files which start by including them, default $C_CHECK_PRECOMPILED_HEADERS")
+
+	parser.add_argument("--clang-resource-dir", default=os.environ.get('C_CHECK_CLANG_RESOURCE_DIR'), help="clang's resource directory (clang -print-resource-dir), default $C_CHECK_CLANG_RESOURCE_DIR or found from clang")
+	parser.add_argument("--libclang", default=os.environ.get('C_CHECK_LIBCLANG'), help="path of libclang.so, default $C_CHECK_LIBCLANG or found from clang")
+
+	parser.add_argument("--timings", action="store_true", default=bool(os.environ.get('C_CHECK_TIMINGS')), help="print time taken by each phase & checker for each file to stderr, default true if $C_CHECK_TIMINGS is set")
+	parser.add_argument("--timings-json", default=os.environ.get('C_CHECK_TIMINGS_JSON'), help="write time taken by each phase & checker for each file as JSON to this file, default $C_CHECK_TIMINGS_JSON")
+
+	parser.add_argument("--batch", action="store_true", help="check all .c files in the given files & directories, writing a JSON line describing each file")
+	parser.add_argument("--manifest", help="file listing files to check in batch mode, one per line, - for stdin")
+	parser.add_argument("--batch-output", help="append batch JSON lines to this file rather than printing them")
+	parser.add_argument("--resume", action="store_true", help="skip files which already have a line in --batch-output")
+
+	parser.add_argument("--watch", action="store_true", help="check files, then check them again whenever they or files they include change, until interrupted")
+	parser.add_argument("--watch-poll-interval", type=float, default=0, help="with --watch, poll for changes every this many seconds rather than using inotify")
+
+	parser.add_argument("--lsp", action="store_true", help="run as a Language Server Protocol server on stdin & stdout, publishing diagnostics for C files open in an editor")
+	parser.add_argument("--lsp-debounce", type=float, default=0.3, help="with --lsp, seconds without edits before a document is checked")
+
+	parser.add_argument("--daemon", action="store_true", help="run as a daemon which keeps libclang loaded, checking files for c_check_client.py")
+	parser.add_argument("--socket", help="unix socket the daemon listens on, default $C_CHECK_SOCKET or c_check-UID.sock in $XDG_RUNTIME_DIR or /tmp")
+	parser.add_argument("--daemon-idle-timeout", type=float, default=3600, help="seconds without requests before the daemon exits, 0 for never")
 
 	parser.add_argument("-d", "--debug", action="count", default=0 ,  help="show debug ouput")
 	parser.add_argument("source_files",  nargs='*', default=[], help="")
 
 	args = parser.parse_args()
 
+	if args.resume and not args.batch_output:
+		parser.error("--resume requires --batch-output")
+
+	if args.project and (args.batch or args.manifest or args.watch or args.lsp):
+		parser.error("--project can not be used with --batch, --watch or --lsp")
+
+	if (args.timeout or args.cpu_limit or args.memory_limit) and (args.watch or args.lsp):
+		parser.error("--timeout, --cpu-limit & --memory-limit can not be used with --watch or --lsp")
+
 	for check in CHECKS:
 		setattr(args, check, None)
 
@@ -151,123 +314,2012 @@ def args_parser():
 				sys.exit(1)
 			setattr(args, check, value)
 
+	if args.linking and not args.project:
+		parser.error("the linking check requires --project")
+
 	return args
 
 
-def get_library_include():
-	import shutil, subprocess
-	clang_bin = shutil.which('clang')
-	if not clang_bin:
-		print("c_check: no 'clang' binary found!", file=sys.stderr)
-		return []
+@functools.lru_cache(maxsize=None)
+def get_library_include(clang_resource_dir=None, libclang=None):
+	"""
+	load libclang and @returns arguments to parse with clang's own include directory
+	clang_resource_dir & libclang are found from the clang binary if not supplied
+	"""
+	import_clang()
+	if not clang_resource_dir or not libclang:
+		toolchain = find_toolchain()
+		if not toolchain:
+			return []
+		clang_resource_dir = clang_resource_dir or toolchain['resource_dir']
+		libclang = libclang or toolchain['libclang']
+
+	include_directory = os.path.join(clang_resource_dir, 'include')
+	if not clang.cindex.Config.loaded:
+		clang.cindex.Config.set_library_file(libclang)
+
+	return ['-isystem', include_directory]
+
+
+def import_clang():
+	global clang, CKind, TKind
+	import clang.cindex
+	from clang.cindex import CursorKind as CKind, TypeKind as TKind
+
+
+def find_toolchain():
+	"""
+	find clang's resource directory & libclang
+	running clang is slow so results are cached in a file, keyed on clang's path & modification time
+	@returns dict with keys resource_dir & libclang or None
+	"""
+	import json, shutil
+	clang_bin = shutil.which('clang')
+	if not clang_bin:
+		print("c_check: no 'clang' binary found!", file=sys.stderr)
+		return None
+	clang_bin = os.path.realpath(clang_bin)
+
+	cache_file = toolchain_cache_path()
+	try:
+		with open(cache_file) as f:
+			toolchains = json.load(f)
+	except (OSError, ValueError):
+		toolchains = {}
+	try:
+		clang_mtime = os.stat(clang_bin).st_mtime_ns
+	except OSError:
+		clang_mtime = None
+
+	toolchain = toolchains.get(clang_bin) if isinstance(toolchains, dict) else None
+	if (
+		isinstance(toolchain, dict) and
+		toolchain.get('mtime') == clang_mtime and
+		os.path.isdir(toolchain.get('resource_dir', '')) and
+		os.path.exists(toolchain.get('libclang', ''))
+		):
+		return toolchain
+
+	import glob, subprocess
+	clang_resource_dir = subprocess.check_output([clang_bin, '-print-resource-dir'], universal_newlines=True).splitlines()[0]
+
+	# it'd sure be nice if clang knew where libclang was...
+	libclang_path = os.path.dirname(os.path.dirname(clang_resource_dir))
+	libclangs = glob.glob(f'{libclang_path}/libclang.so.*')
+	if not libclangs:
+		print("c_check: can't find 'libclang.so'!", file=sys.stderr)
+		return None
+
+	toolchain = {'mtime': clang_mtime, 'resource_dir': clang_resource_dir, 'libclang': libclangs[0]}
+	if not isinstance(toolchains, dict):
+		toolchains = {}
+	toolchains[clang_bin] = toolchain
+	try:
+		os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+		write_file_atomically(cache_file, json.dumps(toolchains))
+	except OSError:
+		# caching is only an optimization
+		pass
+	return toolchain
+
+
+def toolchain_cache_path():
+	if os.environ.get('C_CHECK_TOOLCHAIN_CACHE'):
+		return os.environ['C_CHECK_TOOLCHAIN_CACHE']
+	directory = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	return os.path.join(directory, 'c_check', 'toolchain.json')
+
+
+def lexical_triggers(args):
+	"""
+	if every enabled check can only fire when particular tokens are in the source (see LEXICAL_CHECK_TRIGGERS)
+	files without any of those tokens needn't be parsed
+
+	Compile errors can't be seen without parsing, so this is only done with --lexical-fast-path.
+	With --project every file is parsed, as each must be summarized.
+	Headers found in -I directories may be the program's own, so with -I every file is parsed,
+	as is any file including a header with #include "..." (see lexical_triggers_present).
+
+	@returns set of tokens which mean a file must be parsed, None if every file must be parsed
+	"""
+	if args.full_parse or args.debug or args.project or args.include_directories:
+		return None
+	triggers = set()
+	for check in CHECKS:
+		if not getattr(args, check):
+			continue
+		if check not in LEXICAL_CHECK_TRIGGERS:
+			return None
+		triggers.update(LEXICAL_CHECK_TRIGGERS[check])
+	return triggers
+
+
+# comments, literals, preprocessing numbers, identifiers & the punctuators in LEXICAL_CHECK_TRIGGERS
+C_LEXICAL_TOKEN = re.compile(r'''
+	//[^\n]*|
+	/\*.*?\*/|
+	"(?:\\.|[^"\\\n])*"|
+	'(?:\\.|[^'\\\n])*'|
+	\.?\d(?:[eEpP][+-]|[\w.])*|
+	[A-Za-z_]\w*|
+	<:|
+	[?[,]
+	''', re.DOTALL | re.VERBOSE)
+
+
+def lexical_triggers_in_file(C_source_filename, triggers):
+	"""
+	@returns True if any of triggers is a token in the file, or it can't be read
+	"""
+	try:
+		with open(C_source_filename, encoding='utf-8', errors='replace') as f:
+			return lexical_triggers_present(f.read(), triggers)
+	except OSError:
+		# let check_file report the error
+		return True
+
+
+def lexical_triggers_present(C_source, triggers):
+	"""
+	@returns True if any of triggers is a token in C_source,
+	or C_source includes a header other than a system header, as its macros could expand to them,
+	or any header, if triggers include those of SYSTEM_MACRO_CHECKS
+	"""
+	if includes_header(C_source, own_header=True):
+		return True
+	if not SYSTEM_MACRO_TRIGGERS.isdisjoint(triggers) and includes_header(C_source):
+		return True
+	return bool(lexical_triggers_found(C_source, triggers))
+
+
+# checks whose constructs macros from system headers often expand to,
+# e.g. MAX's ?: from sys/param.h or FD_ZERO's do while from sys/select.h,
+# so a file's tokens can't show it passes them if it includes any header
+SYSTEM_MACRO_CHECKS = ['comma', 'do_while', 'ternary']
+
+SYSTEM_MACRO_TRIGGERS = {token for check in SYSTEM_MACRO_CHECKS for token in LEXICAL_CHECK_TRIGGERS[check]}
+
+# a directive mentioning include, directives like #define X include are matched too, which only means the file is parsed
+HEADER_INCLUDE = re.compile(r'^[ \t]*(?:#|%:).*\binclude', re.MULTILINE)
+
+# as HEADER_INCLUDE, but not #include <...>, e.g. #include "course.h" or #include HEADER
+OWN_HEADER_INCLUDE = re.compile(r'^[ \t]*(?:#|%:).*\binclude\w*\b(?![ \t]*<)', re.MULTILINE)
+
+
+def includes_header(C_source, own_header=False):
+	"""
+	@returns True if C_source may include a header, if own_header a header other than a system header
+	"""
+	if '\\\n' in C_source:
+		C_source = C_source.replace('\\\n', '')
+	return bool((OWN_HEADER_INCLUDE if own_header else HEADER_INCLUDE).search(C_source))
+
+
+def lexical_triggers_found(C_source, triggers):
+	"""
+	@returns set of triggers which are tokens in C_source
+	"""
+	# most sources don't contain the triggers at all, even in comments & literals,
+	# and a regex search is much faster than tokenizing
+	if '\\\n' not in C_source and not trigger_search_pattern(frozenset(triggers)).search(C_source):
+		return set()
+	return {token for token in lexical_tokens(C_source) if token in triggers}
+
+
+@functools.lru_cache(maxsize=None)
+def trigger_search_pattern(triggers):
+	"""
+	@returns regex matching any of triggers anywhere in a source
+	"""
+	words = [re.escape(token) for token in triggers if re.match(r'\w', token)]
+	punctuators = [re.escape(token) for token in triggers if not re.match(r'\w', token)]
+	if '[' in triggers:
+		punctuators.append('<:')
+	alternatives = punctuators + ([r'\b(?:' + '|'.join(words) + r')\b'] if words else [])
+	return re.compile('|'.join(alternatives) or r'(?!)')
+
+
+def lexical_tokens(C_source):
+	"""
+	generate identifiers, keywords & the punctuators in LEXICAL_CHECK_TRIGGERS in C_source
+	tokens in comments & literals are skipped, tokens in preprocessor directives aren't
+	"""
+	# remove line splices, e.g. a keyword split across lines
+	C_source = C_source.replace('\\\n', '')
+	for m in C_LEXICAL_TOKEN.finditer(C_source):
+		token = m.group()
+		if token == '<:':
+			yield '['
+		elif token[0] not in '/"\'.0123456789':
+			yield token
+
+
+def prune_check_plan(plan, C_source):
+	"""
+	remove checks which can't fire because none of their trigger tokens (see LEXICAL_CHECK_TRIGGERS)
+	are in C_source from a check plan (see get_check_plan)
+
+	Checks on node kinds not in the file already cost nothing, so this only pays
+	if it can leave the plan empty, letting the syntax tree walk be skipped.
+	If the plan has any check without trigger tokens it is returned unchanged,
+	as it is if C_source includes any header, whose macros could expand to trigger tokens,
+	e.g. MAX from sys/param.h to ?:
+
+	@returns the pruned check plan
+	"""
+	check_names = {function.__name__[len('check_'):] for checks in plan.values() for (function, _) in checks}
+	if not check_names.issubset(LEXICAL_CHECK_TRIGGERS) or includes_header(C_source):
+		return plan
+	all_triggers = {token for name in check_names for token in LEXICAL_CHECK_TRIGGERS[name]}
+	present = lexical_triggers_found(C_source, all_triggers)
+	def can_fire(function):
+		return not present.isdisjoint(LEXICAL_CHECK_TRIGGERS[function.__name__[len('check_'):]])
+	pruned_plan = {}
+	for (kind, checks) in plan.items():
+		checks = [(function, level) for (function, level) in checks if can_fire(function)]
+		if checks:
+			pruned_plan[kind] = checks
+	return pruned_plan
+
+
+def get_check_plan(args):
+	"""
+	map each CursorKind to the enabled syntax tree checks interested in it
+	so each node costs one dict lookup rather than a call per check
+	@returns dict of CursorKind -> list of (check function, level)
+	"""
+	plan = collections.defaultdict(list)
+	for check in SYNTAX_TREE_NODE_CHECKS:
+		level = getattr(args, check)
+		if not level:
+			continue
+		if check == 'multiple_malloc' and args.project:
+			# malloc calls are counted across the program's files by check_program_summaries
+			continue
+		function = globals()['check_' + check]
+		for kind_name in SYNTAX_TREE_NODE_CHECK_KINDS[check]:
+			plan[getattr(CKind, kind_name)].append((function, level))
+	return dict(plan)
+
+
+def check_files_parallel(source_files, args, index_parse_args, jobs, summaries=None):
+	"""
+	check files using a pool of worker processes each with their own Index.
+	Output for each file is buffered by the worker and printed in the order files were given.
+	With --timeout, --cpu-limit or --memory-limit files are checked by IsolatedWorkers.
+	if summaries is a list, a summary of each file (see summarize_translation_unit) is appended to it
+	@returns False if any check fails, True otherwise
+	"""
+	import multiprocessing
+	# CursorKinds don't survive pickling, so workers build their own check plan
+	worker_args = argparse.Namespace(**vars(args))
+	del worker_args.check_plan
+	all_passed = True
+	initargs = (worker_args, index_parse_args, clang.cindex.Config.library_file)
+	if args.isolated:
+		pool = IsolatedWorkers(min(jobs, len(source_files)), args, initargs)
+	else:
+		pool = multiprocessing.Pool(min(jobs, len(source_files)), initializer=init_check_file_worker, initargs=initargs)
+	with pool:
+		for result in pool.imap(check_file_worker, source_files):
+			if isinstance(result, LimitExceeded):
+				args.limits_exceeded = True
+				result = ('', result.message + '\n', False, [], {'filename': result.filename})
+			(stdout, stderr, passed, reports, summary) = result
+			sys.stdout.write(stdout)
+			sys.stdout.flush()
+			sys.stderr.write(stderr)
+			timings_reports.extend(reports)
+			if summaries is not None:
+				summaries.append(summary)
+			if not passed:
+				all_passed = False
+	return all_passed
+
+
+def check_program(source_files, args, index_parse_args, jobs):
+	"""
+	check source_files as the files of one program (--project)
+	each file is checked as usual, producing a summary, then checks spanning files are run over the summaries
+	@returns False if any check fails, True otherwise
+	"""
+	summaries = []
+	if (jobs > 1 and len(source_files) > 1) or args.isolated:
+		all_passed = check_files_parallel(source_files, args, index_parse_args, jobs, summaries)
+	else:
+		index = clang.cindex.Index.create()
+		all_passed = True
+		for filename in source_files:
+			summary = {'filename': filename}
+			if not check_file_timed(index, filename, args, index_parse_args, summary=summary):
+				all_passed = False
+			summaries.append(summary)
+			index = index_within_memory_limit(index, args)
+	levels = check_program_summaries(summaries, args)
+	if ('not_permitted' in levels) or ('error' in levels):
+		return False
+	return all_passed
+
+
+def summarize_translation_unit(tu, nodes):
+	"""
+	summarize what checks spanning files need to know about a translation unit (see check_program_summaries)
+	nodes is the snapshot of tu's syntax tree, locations are [start line, start column, end line, end column]
+	@returns dict, which can be serialized as JSON, with:
+		malloc_calls: locations of calls to malloc, calloc & realloc, in walk order
+		functions, globals: name -> location of definitions of functions & variables with external linkage
+		references: name -> {'kind', 'location'} of the first use of each function or variable with external linkage
+			declared outside system headers but not defined in tu, e.g. declared in the program's own headers
+	"""
+	summary = {'malloc_calls': [], 'functions': {}, 'globals': {}, 'references': {}}
+	is_in_system_header = get_system_header_test()
+	referenced_names = set()
+	external = clang.cindex.LinkageKind.EXTERNAL
+	for n in nodes:
+		location = [n.start_line, n.start_column, n.end_line, n.end_column]
+		if n.kind == CKind.CALL_EXPR and n.spelling in ['malloc', 'calloc', 'realloc']:
+			summary['malloc_calls'].append(location)
+		elif n.kind == CKind.FUNCTION_DECL and n.depth == 1:
+			if n.spelling not in summary['functions'] and n.is_definition() and n.linkage == external:
+				summary['functions'][n.spelling] = location
+		elif n.kind == CKind.VAR_DECL and n.depth == 1:
+			# a declaration without extern, e.g. int x; is a (tentative) definition
+			is_definition = n.is_definition() or n.storage_class != clang.cindex.StorageClass.EXTERN
+			if n.spelling not in summary['globals'] and is_definition and n.linkage == external:
+				summary['globals'][n.spelling] = location
+		elif n.kind == CKind.DECL_REF_EXPR:
+			referenced = n.referenced
+			if not referenced or referenced.kind not in [CKind.FUNCTION_DECL, CKind.VAR_DECL]:
+				continue
+			name = referenced.spelling
+			if name in referenced_names:
+				continue
+			referenced_names.add(name)
+			if (referenced.linkage == external and
+					referenced.get_definition() is None and
+					referenced.location.file and
+					not is_in_system_header(referenced.location)):
+				kind = 'function' if referenced.kind == CKind.FUNCTION_DECL else 'variable'
+				summary['references'][name] = {'kind': kind, 'location': location}
+	summary['complete'] = True
+	return summary
+
+
+SummaryLocation = collections.namedtuple('SummaryLocation', ['filename', 'start_line', 'start_column', 'end_line', 'end_column'])
+
+
+def check_program_summaries(summaries, args):
+	"""
+	run the checks spanning the files of a program over their summaries (see summarize_translation_unit)
+	printing any diagnostics, located using SummaryLocations in place of Nodes, with one write
+	the linking check is skipped if any file couldn't be summarized, e.g. because of a compile error
+	@returns list of levels of diagnostic messages printed
+	"""
+	levels = []
+	diagnostics = []
+	def report(filename, location, message, level):
+		diagnostics.append(node_diagnostic(SummaryLocation(filename, *location), message, level))
+		levels.append(level)
+
+	if args.multiple_malloc:
+		malloc_calls = [(summary['filename'], location) for summary in summaries for location in summary.get('malloc_calls', [])]
+		for (filename, location) in malloc_calls[1:]:
+			report(filename, location, "malloc called", args.multiple_malloc)
+
+	if args.linking and all(summary.get('complete') for summary in summaries):
+		defined = set()
+		for (kind, definitions) in [('function', 'functions'), ('variable', 'globals')]:
+			first_definitions = {}
+			for summary in summaries:
+				for (name, location) in summary[definitions].items():
+					if name in first_definitions:
+						(first_filename, first_location) = first_definitions[name]
+						message = f"{kind} '{colored(name, 'cyan')}' is defined in more than one file, first at {first_filename}:{first_location[0]}:{first_location[1]}"
+						report(summary['filename'], location, message, args.linking)
+					else:
+						first_definitions[name] = (summary['filename'], location)
+			defined.update(first_definitions)
+		for summary in summaries:
+			for (name, reference) in summary['references'].items():
+				if name not in defined:
+					defined.add(name)
+					report(summary['filename'], reference['location'], f"{reference['kind']} '{colored(name, 'cyan')}' is used but not defined in any file", args.linking)
+
+	if args.extra_text and (('not_permitted' in levels) or ('not_recommended' in levels)):
+		diagnostics.append(text_diagnostic(None, args.extra_text))
+
+	source_lines = {}
+	def file_source_lines(filename):
+		if filename and filename not in source_lines:
+			try:
+				with open(filename, encoding='utf-8', errors='replace') as f:
+					source_lines[filename] = f.read().splitlines()
+			except OSError:
+				source_lines[filename] = []
+		return source_lines.get(filename, [])
+
+	sys.stdout.write(render_diagnostics(diagnostics, args, file_source_lines))
+	return levels
+
+
+def batch_source_files(args):
+	"""
+	generate the files to check in batch mode:
+	.c files given as arguments, .c files found in directories given as arguments,
+	and files listed in args.manifest
+	args.manifest_unreadable is set if args.manifest can't be read
+	"""
+	for pathname in args.source_files:
+		if os.path.isdir(pathname):
+			for (directory, subdirectories, filenames) in os.walk(pathname):
+				subdirectories.sort()
+				for filename in sorted(filenames):
+					if filename.endswith('.c'):
+						yield os.path.join(directory, filename)
+		elif pathname.endswith('.c'):
+			yield pathname
+	if args.manifest:
+		try:
+			f = sys.stdin if args.manifest == '-' else open(args.manifest)
+		except OSError as e:
+			print(f"c_check: {e}", file=sys.stderr)
+			args.manifest_unreadable = True
+			return
+		with f:
+			for line in f:
+				if line.strip():
+					yield line.strip()
+
+
+def check_batch(source_files, args, index_parse_args, jobs):
+	"""
+	check source_files writing a JSON line (see check_file_record) for each file as it is checked
+	source_files can be a generator, files are read from it as needed
+	@returns False if any check fails, True otherwise
+	"""
+	import json
+	if args.resume:
+		done = batch_output_files(args.batch_output)
+		source_files = (filename for filename in source_files if filename not in done)
+	try:
+		output = open(args.batch_output, 'a') if args.batch_output else sys.stdout
+	except OSError as e:
+		print(f"c_check: {e}", file=sys.stderr)
+		return False
+
+	all_passed = True
+	def write_record(record):
+		nonlocal all_passed
+		output.write(json.dumps(record) + '\n')
+		output.flush()
+		if record['exit_status']:
+			all_passed = False
+		if record.get('limit'):
+			args.limits_exceeded = True
+
+	if jobs > 1 or args.isolated:
+		import multiprocessing
+		worker_args = argparse.Namespace(**vars(args))
+		del worker_args.check_plan
+		initargs = (worker_args, index_parse_args, clang.cindex.Config.library_file)
+		if args.isolated:
+			pool = IsolatedWorkers(jobs, args, initargs)
+		else:
+			pool = multiprocessing.Pool(jobs, initializer=init_check_file_worker, initargs=initargs)
+		with pool:
+			for record in pool.imap(check_file_record_worker, source_files):
+				if isinstance(record, LimitExceeded):
+					record = limit_exceeded_record(record)
+				write_record(record)
+	else:
+		index = clang.cindex.Index.create()
+		for filename in source_files:
+			write_record(check_file_record(index, filename, args, index_parse_args))
+			index = index_within_memory_limit(index, args)
+	if output is not sys.stdout:
+		output.close()
+	return all_passed
+
+
+def batch_output_files(batch_output):
+	"""
+	@returns set of the files with a line in batch_output, for --resume
+	a partial last line, left if c_check was interrupted, is removed
+	"""
+	import json
+	done = set()
+	try:
+		with open(batch_output, 'rb+') as f:
+			complete_length = 0
+			for line in f:
+				if not line.endswith(b'\n'):
+					break
+				try:
+					done.add(json.loads(line)['path'])
+				except (ValueError, KeyError, TypeError):
+					pass
+				complete_length += len(line)
+			f.truncate(complete_length)
+	except FileNotFoundError:
+		pass
+	return done
+
+
+def check_file_record(index, C_source_filename, args, index_parse_args):
+	"""
+	check C_source_filename capturing its output
+	an exception checking the file is recorded as a crash, like a worker crashing with --timeout etc.,
+	so the rest of the batch is still checked
+	@returns dict describing the result, for batch mode
+	"""
+	import contextlib, traceback
+	stdout = io.StringIO()
+	stderr = io.StringIO()
+	levels = []
+	records = []
+	start = time.perf_counter()
+	try:
+		with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+			passed = check_file_timed(index, C_source_filename, args, index_parse_args, levels=levels, records=records)
+	except Exception:
+		time_ms = round((time.perf_counter() - start) * 1000, 3)
+		return limit_exceeded_record(limit_exceeded(C_source_filename, 'crash', args, time_ms), traceback.format_exc())
+	return {
+		'path': C_source_filename,
+		'exit_status': 0 if passed else 1,
+		'levels': levels,
+		'diagnostics': records,
+		'output': stdout.getvalue(),
+		'stderr': stderr.getvalue(),
+		'time_ms': round((time.perf_counter() - start) * 1000, 3),
+	}
+
+
+def limit_exceeded_record(exceeded, details=''):
+	"""
+	@returns dict describing a file not checked, for batch mode, from LimitExceeded exceeded
+	details, e.g. a traceback, are added to the record's stderr
+	"""
+	return {'path': exceeded.filename, 'exit_status': LIMIT_EXCEEDED_EXIT_STATUS, 'limit': exceeded.limit,
+		'levels': [], 'diagnostics': [], 'output': '', 'stderr': exceeded.message + '\n' + details, 'time_ms': exceeded.time_ms}
+
+
+def check_file_record_worker(C_source_filename):
+	global worker_state
+	(index, args, index_parse_args) = worker_state
+	record = check_file_record(index, C_source_filename, args, index_parse_args)
+	timings_reports.clear()
+	worker_state = (index_within_memory_limit(index, args), args, index_parse_args)
+	return record
+
+
+def index_within_memory_limit(index, args):
+	"""
+	if --max-rss is set and the process's resident set size exceeds it, dispose of index,
+	collect garbage and ask the C library to return freed memory to the operating system
+	called between files, when no translation unit made with index is still in use
+	@returns index, or a new Index if it was recycled
+	"""
+	if not args.max_rss or resident_set_size() <= args.max_rss:
+		return index
+	import ctypes, gc
+	dispose_clang_object(index, 'clang_disposeIndex')
+	gc.collect()
+	try:
+		ctypes.CDLL(None).malloc_trim(0)
+	except (OSError, AttributeError):
+		# not glibc
+		pass
+	return clang.cindex.Index.create()
+
+
+def resident_set_size():
+	"""
+	@returns resident set size of this process in megabytes, or its peak if that isn't available
+	"""
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+	except (OSError, ValueError, IndexError):
+		import resource
+		peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		# kilobytes on Linux, bytes on macOS
+		return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def dispose_clang_object(clang_object, dispose_function):
+	"""
+	free a libclang object (Index or TranslationUnit) now, rather than when the python object is garbage collected
+	it must not be used afterwards, nor anything from it, e.g. cursors of a translation unit
+	"""
+	getattr(clang.cindex.conf.lib, dispose_function)(clang_object)
+	# the bindings' __del__ will then pass NULL, which libclang ignores
+	clang_object.obj = clang_object._as_parameter_ = None
+
+
+def init_check_file_worker(args, index_parse_args, library_file):
+	global worker_state
+	import_clang()
+	if library_file and not clang.cindex.Config.loaded:
+		clang.cindex.Config.set_library_file(library_file)
+	set_colored(args)
+	args.check_plan = get_check_plan(args)
+	if args.timings or args.timings_json:
+		count_libclang_calls()
+	worker_state = (clang.cindex.Index.create(), args, index_parse_args)
+
+
+def check_file_worker(C_source_filename):
+	"""
+	@returns (stdout, stderr, passed, timings reports, summary) from checking C_source_filename
+	summary is None unless args.project is set
+	"""
+	import contextlib
+	global worker_state
+	(index, args, index_parse_args) = worker_state
+	stdout = io.StringIO()
+	stderr = io.StringIO()
+	summary = {'filename': C_source_filename} if args.project else None
+	with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+		passed = check_file_timed(index, C_source_filename, args, index_parse_args, summary=summary)
+	reports = timings_reports[:]
+	timings_reports.clear()
+	worker_state = (index_within_memory_limit(index, args), args, index_parse_args)
+	return (stdout.getvalue(), stderr.getvalue(), bool(passed), reports, summary)
+
+
+# exit status if any file wasn't checked because it exceeded --timeout, --cpu-limit or --memory-limit
+LIMIT_EXCEEDED_EXIT_STATUS = 3
+
+
+LimitExceeded = collections.namedtuple('LimitExceeded', ['filename', 'limit', 'message', 'time_ms'])
+LimitExceeded.__doc__ = """
+result of a file whose worker exceeded a limit, limit is 'timeout', 'cpu', 'memory' or 'crash'
+"""
+
+
+class IsolatedWorkers():
+	"""
+	Worker processes, like multiprocessing.Pool, for --timeout, --cpu-limit & --memory-limit,
+	so a file which makes libclang or a checker run away (macro bombs, huge generated arrays, ...)
+	costs only its own result.
+
+	Each worker checks one file at a time. Its address space is limited with RLIMIT_AS,
+	and before each file its CPU time soft limit (RLIMIT_CPU) is set, so the kernel kills it with SIGXCPU.
+	A worker which takes longer than the timeout is killed. A worker which exceeds a limit,
+	or dies for any other reason, is replaced and its file's result is a LimitExceeded.
+	"""
+	def __init__(self, jobs, args, initargs):
+		self.jobs = jobs
+		self.args = args
+		self.initargs = initargs
+		self.workers = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exception):
+		for worker in self.workers:
+			worker.process.kill()
+			worker.process.join()
+		self.workers = []
+
+	def imap(self, function, source_files):
+		"""
+		generate function(filename) computed by workers for each of source_files, in order,
+		or a LimitExceeded for a file whose worker exceeded a limit
+		"""
+		import multiprocessing.connection
+		source_files = iter(source_files)
+		results = {}
+		next_result = 0
+		n_files = 0
+		while True:
+			idle = [worker for worker in self.workers if worker.filename is None]
+			while source_files is not None and (idle or len(self.workers) < self.jobs):
+				filename = next(source_files, None)
+				if filename is None:
+					source_files = None
+					break
+				worker = idle.pop() if idle else self.start_worker(function)
+				worker.start(filename, n_files)
+				n_files += 1
+			busy = [worker for worker in self.workers if worker.filename is not None]
+			if not busy:
+				break
+			timeout = None
+			if self.args.timeout:
+				timeout = max(0, min(worker.started for worker in busy) + self.args.timeout - time.perf_counter())
+			ready = multiprocessing.connection.wait([worker.connection for worker in busy], timeout)
+			for worker in busy:
+				if worker.connection in ready:
+					try:
+						results[worker.number] = worker.connection.recv()
+					except (EOFError, OSError):
+						results[worker.number] = self.replace(worker, self.death_limit(worker))
+						continue
+					if isinstance(results[worker.number], LimitExceeded):
+						self.replace(worker, None)
+					worker.filename = None
+				elif self.args.timeout and time.perf_counter() - worker.started > self.args.timeout:
+					results[worker.number] = self.replace(worker, 'timeout')
+			while next_result in results:
+				yield results.pop(next_result)
+				next_result += 1
+		for worker in self.workers:
+			worker.connection.send(None)
+			worker.process.join()
+		self.workers = []
+
+	def start_worker(self, function):
+		import multiprocessing
+		(connection, worker_connection) = multiprocessing.Pipe()
+		limits = (self.args.cpu_limit, self.args.memory_limit)
+		process = multiprocessing.Process(target=isolated_worker, args=(worker_connection, function, self.initargs, limits), daemon=True)
+		process.start()
+		worker_connection.close()
+		worker = IsolatedWorker(process, connection)
+		self.workers.append(worker)
+		return worker
+
+	def death_limit(self, worker):
+		"""
+		@returns the limit which probably killed worker, which has died
+		"""
+		import signal
+		worker.process.join()
+		if worker.process.exitcode == -signal.SIGXCPU:
+			return 'cpu'
+		if self.args.memory_limit:
+			# libclang aborts or crashes if it can't allocate memory
+			return 'memory'
+		return 'crash'
+
+	def replace(self, worker, limit):
+		"""
+		stop worker, which a new worker will replace when needed
+		@returns LimitExceeded for worker's file, if limit is not None
+		"""
+		worker.process.kill()
+		worker.process.join()
+		worker.connection.close()
+		self.workers.remove(worker)
+		if limit is None:
+			return None
+		time_ms = round((time.perf_counter() - worker.started) * 1000, 3)
+		return limit_exceeded(worker.filename, limit, self.args, time_ms)
+
+
+class IsolatedWorker():
+	def __init__(self, process, connection):
+		self.process = process
+		self.connection = connection
+		self.filename = None
+		self.number = None
+		self.started = None
+
+	def start(self, filename, number):
+		self.filename = filename
+		self.number = number
+		self.started = time.perf_counter()
+		self.connection.send(filename)
+
+
+def isolated_worker(connection, function, initargs, limits):
+	"""
+	worker process for IsolatedWorkers, sending function(filename) for each filename received
+	"""
+	import resource, tempfile
+	(cpu_limit, memory_limit) = limits
+	libclang_messages = tempfile.TemporaryFile()
+	stderr_fd = os.dup(2)
+	init_check_file_worker(*initargs)
+	# a worker killed for exceeding a limit shouldn't leave a core file
+	resource.setrlimit(resource.RLIMIT_CORE, (0, resource.getrlimit(resource.RLIMIT_CORE)[1]))
+	if memory_limit:
+		(_, hard) = resource.getrlimit(resource.RLIMIT_AS)
+		limit = int(memory_limit * 1024 * 1024)
+		resource.setrlimit(resource.RLIMIT_AS, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+	while True:
+		filename = connection.recv()
+		if filename is None:
+			return
+		if cpu_limit:
+			# the limit is on the process's total CPU time so is moved on for each file
+			usage = resource.getrusage(resource.RUSAGE_SELF)
+			(_, hard) = resource.getrlimit(resource.RLIMIT_CPU)
+			limit = int(usage.ru_utime + usage.ru_stime + cpu_limit + 0.999)
+			resource.setrlimit(resource.RLIMIT_CPU, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+		start = time.perf_counter()
+		# libclang recovers from crashes & failing to allocate memory, reporting only that the file can't be parsed,
+		# so what it writes to stderr is captured to find out why
+		libclang_messages.seek(0)
+		libclang_messages.truncate()
+		sys.stderr.flush()
+		os.dup2(libclang_messages.fileno(), 2)
+		try:
+			result = function(filename)
+			limit = None
+		except MemoryError:
+			limit = 'memory'
+		finally:
+			os.dup2(stderr_fd, 2)
+		libclang_messages.seek(0)
+		messages = libclang_messages.read()
+		if limit or re.search(rb'out of memory|Allocation failed|bad_alloc', messages):
+			limit = 'memory'
+		elif b'crash detected' in messages:
+			limit = 'crash'
+		elif messages:
+			os.write(2, messages)
+		if limit:
+			# the worker is replaced, as after a crash libclang's state can't be relied on
+			result = limit_exceeded(filename, limit, initargs[0], round((time.perf_counter() - start) * 1000, 3))
+		connection.send(result)
+
+
+def limit_exceeded(C_source_filename, limit, args, time_ms):
+	"""
+	@returns LimitExceeded describing why C_source_filename wasn't checked
+	"""
+	if limit == 'timeout':
+		description = f"took longer than {args.timeout:g} seconds"
+	elif limit == 'cpu':
+		description = f"used more than {args.cpu_limit:g} seconds of CPU time"
+	elif limit == 'memory':
+		description = f"used more than {args.memory_limit:g}MB of memory" if args.memory_limit else "ran out of memory"
+	else:
+		description = "c_check crashed"
+	return LimitExceeded(C_source_filename, limit, f"c_check: {C_source_filename} not checked: {description}", time_ms)
+
+
+def check_file_timed(index, C_source_filename, args, index_parse_args, levels=None, summary=None, records=None):
+	"""
+	check_file_cached, reporting the time taken if --timings or --timings-json is used
+	@returns False if any check fails, True otherwise
+	"""
+	if not args.timings and not args.timings_json:
+		return check_file_cached(index, C_source_filename, args, index_parse_args, levels=levels, summary=summary, records=records)
+	timings = Timings(C_source_filename)
+	with timings.phase('total'):
+		passed = check_file_cached(index, C_source_filename, args, index_parse_args, timings, levels=levels, summary=summary, records=records)
+	report = timings.report()
+	if args.timings:
+		print_timings(report)
+	if args.timings_json:
+		timings_reports.append(report)
+	return passed
+
+
+def check_file_cached(index, C_source_filename, args, index_parse_args, timings=None, levels=None, summary=None, records=None):
+	"""
+	check_file, but if args.result_cache is set replay the output of
+	a previous check of the same source with the same configuration if available
+	(and with --project, the file's summary)
+	@returns False if any check fails, True otherwise
+	"""
+	cache = args.result_cache
+	timings = timings or NO_TIMINGS
+	if not cache:
+		return check_file(index, C_source_filename, args, index_parse_args, timings=timings, levels=levels, summary=summary, records=records)
+	import contextlib
+	try:
+		with open(C_source_filename, 'rb') as f:
+			C_source = f.read()
+	except OSError:
+		return check_file(index, C_source_filename, args, index_parse_args, timings=timings, levels=levels, summary=summary, records=records)
+
+	with timings.phase('result_cache'):
+		key = cache.key(C_source_filename, C_source)
+		result = cache.get(key)
+	if not result:
+		stdout = io.StringIO()
+		stderr = io.StringIO()
+		# directories are included so a header added which would be included instead is noticed
+		included_files = [os.path.dirname(C_source_filename) or '.'] + args.include_directories
+		result_levels = []
+		result_records = []
+		with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+			passed = check_file(index, C_source_filename, args, index_parse_args, included_files=included_files, timings=timings, levels=result_levels, summary=summary, records=result_records)
+		with timings.phase('result_cache'):
+			result = {
+				'stdout': stdout.getvalue(),
+				'stderr': stderr.getvalue(),
+				'passed': bool(passed),
+				'levels': result_levels,
+				'records': result_records,
+				'summary': summary,
+				'dependencies': cache.file_states(included_files),
+			}
+			cache.put(key, result)
+	elif summary is not None:
+		summary.update(result.get('summary') or {})
+	with timings.phase('output'):
+		sys.stdout.write(result['stdout'])
+		sys.stderr.write(result['stderr'])
+	if levels is not None:
+		levels.extend(result['levels'])
+	if records is not None:
+		records.extend(result['records'])
+	return result['passed']
+
+
+class ResultCache():
+	"""
+	content-addressed on-disk cache of the output & exit status from checking a file
+
+	The key is a hash of the source, its filename, the current directory,
+	the resolved check configuration, and the c_check & libclang versions.
+	Each entry also records the size & modification time of every file the source included
+	(headers from -I directories, system headers) and of the directories searched for headers
+	and is ignored if any have changed.
+
+	Entries are written atomically so many processes can share a cache directory.
+	An entry's modification time is updated when it is used, and when the total size
+	exceeds max_size megabytes least recently used entries are removed.
+	"""
+	def __init__(self, directory, max_size, args, index_parse_args):
+		import hashlib, json
+		self.directory = directory
+		self.max_size = max_size * 1024 * 1024
+		with open(__file__, 'rb') as f:
+			c_check_version = hashlib.sha256(f.read()).hexdigest()
+		library_file = clang.cindex.Config.library_file
+		libclang_version = self.file_states([library_file]) if library_file else None
+		configuration = {
+			'checks': {check: getattr(args, check) for check in CHECKS},
+			'text': [args.where_text, args.extra_text, args.mixed_indenting_text],
+			'banned_headers': banned_headers(args),
+			'indenting': args.highlight_incorrect_indenting,
+			'max_diagnostics': args.max_diagnostics,
+			'colorize': bool(args.colorize),
+			'project': bool(args.project),
+			'full_parse': bool(args.full_parse),
+			'index_parse_args': index_parse_args,
+			'c_check': c_check_version,
+			'libclang': [library_file, libclang_version],
+		}
+		self.configuration = json.dumps(configuration, sort_keys=True).encode()
+
+	def key(self, C_source_filename, C_source):
+		import hashlib, json
+		h = hashlib.sha256(self.configuration)
+		h.update(json.dumps([C_source_filename, os.getcwd()]).encode())
+		h.update(C_source)
+		return h.hexdigest()
+
+	def entry_path(self, key):
+		return os.path.join(self.directory, key[0:2], key + '.json')
+
+	def get(self, key):
+		"""
+		@returns cached result for key, None if there is no valid cached result
+		"""
+		import json
+		path = self.entry_path(key)
+		try:
+			with open(path, encoding='utf-8') as f:
+				result = json.load(f)
+		except (OSError, ValueError):
+			return None
+		dependencies = result.get('dependencies', [])
+		if self.file_states(name for (name, _, _) in dependencies) != dependencies:
+			return None
+		try:
+			os.utime(path)
+		except OSError:
+			pass
+		return result
+
+	def put(self, key, result):
+		import json
+		path = self.entry_path(key)
+		data = json.dumps(result).encode()
+		try:
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			write_file_atomically(path, data)
+			self.add_usage(len(data))
+		except OSError as e:
+			print(f"c_check: can not write cache: {e}", file=sys.stderr)
+
+	def add_usage(self, size):
+		"""
+		a running total of bytes written is kept in the file 'usage', updated with a lock held
+		when it exceeds max_size, entries are removed and the total recalculated
+		"""
+		import fcntl
+		with open(os.path.join(self.directory, 'lock'), 'a') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			usage_path = os.path.join(self.directory, 'usage')
+			try:
+				with open(usage_path) as f:
+					usage = int(f.read() or 0)
+			except (OSError, ValueError):
+				usage = 0
+			usage += size
+			if usage > self.max_size:
+				usage = self.evict()
+			with open(usage_path, 'w') as f:
+				f.write(str(usage))
+
+	def evict(self):
+		"""
+		remove least recently used entries until cache is 3/4 of max_size
+		@returns size of remaining entries
+		"""
+		entries = []
+		for subdirectory in os.scandir(self.directory):
+			if not subdirectory.is_dir():
+				continue
+			for entry in os.scandir(subdirectory.path):
+				if entry.name.endswith('.tmp'):
+					continue
+				try:
+					stat = entry.stat()
+				except OSError:
+					continue
+				entries.append((stat.st_mtime, stat.st_size, entry.path))
+		entries.sort()
+		total = sum(size for (_, size, _) in entries)
+		for (_, size, path) in entries:
+			if total <= 0.75 * self.max_size:
+				break
+			try:
+				os.unlink(path)
+			except OSError:
+				pass
+			total -= size
+		return total
+
+	@staticmethod
+	def file_states(filenames):
+		"""
+		@returns list of [filename, modification time, size], size -1 if file doesn't exist
+		"""
+		states = []
+		for filename in filenames:
+			try:
+				stat = os.stat(filename)
+				states.append([filename, stat.st_mtime_ns, stat.st_size])
+			except OSError:
+				states.append([filename, 0, -1])
+		return states
+
+
+def check_file(index, C_source_filename, args, index_parse_args, included_files=None, timings=None, levels=None, summary=None, records=None):
+	"""
+	if included_files is a list, the names of all files included by the source are appended to it
+	if timings is a Timings, the time taken by each phase & checker is added to it
+	if levels is a list, the levels of diagnostics printed are appended to it
+	if summary is a dict, a summary of the file is added to it (see summarize_translation_unit)
+	if records is a list, a dict describing each diagnostic is appended to it, even those not shown (see diagnostic_records)
+	@returns False if any check fails, True otherwise
+	"""
+	timings = timings or NO_TIMINGS
+	try:
+		with timings.phase('read'):
+			with open(C_source_filename, 'rb') as f:
+				C_source_bytes = f.read()
+	except OSError as e:
+		print(e, file=sys.stderr)
+		return False
+	C_source = C_source_bytes.decode('utf-8', errors='replace')
+
+	if args.lexical_triggers is not None:
+		with timings.phase('lexical_scan'):
+			if not lexical_triggers_present(C_source, args.lexical_triggers):
+				return True
+	try:
+		with timings.phase('parse'):
+			(tu, precompiled_header_files) = parse_C_source(index, C_source_filename, C_source, args, index_parse_args, C_source_bytes)
+	except clang.cindex.TranslationUnitLoadError:
+		return False
+	try:
+		if included_files is not None:
+			included_files.extend(inclusion.include.name for inclusion in tu.get_includes())
+			included_files.extend(precompiled_header_files)
+		return check_translation_unit(tu, C_source_filename, C_source, args, timings=timings, levels=levels, summary=summary, records=records)
+	finally:
+		# freed now, rather than whenever the garbage collector gets to the translation unit,
+		# so memory doesn't grow when many files are checked
+		dispose_clang_object(tu, 'clang_disposeTranslationUnit')
+
+
+def check_translation_unit(tu, C_source_filename, C_source, args, timings=None, levels=None, function_results=None, summary=None, records=None):
+	"""
+	check the translation unit tu made by parsing C_source, see check_file
+	if function_results is a FunctionResults, what checkers did for functions
+	unchanged since C_source was last checked is reused rather than snapshotting & walking them
+	@returns False if any check fails, True otherwise
+	"""
+	timings = timings or NO_TIMINGS
+	C_source_lines = C_source.splitlines()
+	with timings.phase('diagnostics'):
+		compile_diagnostics = []
+		compile_error = False
+		for diagnostic in tu.diagnostics:
+			compile_error = diagnostic.severity in [clang.cindex.Diagnostic.Error, clang.cindex.Diagnostic.Fatal]
+			if compile_error or args.debug:
+				compile_diagnostics.append(clang_diagnostic(diagnostic, C_source_filename))
+			if compile_error:
+				break
+		if compile_diagnostics:
+			sys.stdout.write(render_diagnostics(compile_diagnostics, args, lambda filename: C_source_lines))
+			if records is not None:
+				records.extend(diagnostic_records(compile_diagnostics, args))
+		if compile_error:
+			return 1
+	with timings.phase('syntax_tree'):
+		skip_children = function_results.start(tu, C_source) if function_results else None
+		abstract_syntax_tree = abstract_syntax_tree_nodes(tu.cursor, skip_children)
+		if function_results:
+			function_results.check_context(abstract_syntax_tree[0])
+	timings.nodes = len(abstract_syntax_tree)
+
+	if summary is not None:
+		with timings.phase('summary'):
+			summary.update(summarize_translation_unit(tu, abstract_syntax_tree))
+
+	if args.debug:
+		print_ast(abstract_syntax_tree)
+
+	# when functions are replayed from function_results, few nodes are examined
+	tokens = TokenIndex(tu, abstract_syntax_tree[0].children if function_results else None)
+	if timings is not NO_TIMINGS:
+		# otherwise the first checker to look up a token would be charged for tokenizing
+		with timings.phase('tokens'):
+			tokens.tokenize()
+
+	checkers = [checker(args, C_source_lines, C_source_filename, tokens) for checker in CHECKERS]
+	checkers = [checker for checker in checkers if checker.enabled()]
+	if timings is not NO_TIMINGS:
+		checkers = [TimedChecker(checker, timings) for checker in checkers]
+
+	if checkers:
+		with timings.phase('walk'):
+			walk_syntax_tree(abstract_syntax_tree[0], checkers, function_results)
+
+	# diagnostics are output in checker order, stopping after the first checker with an error
+	passed = True
+	diagnostics = []
+	for checker in checkers:
+		diagnostics_printed = checker.finish()
+		diagnostics += sorted(checker.diagnostics, key=diagnostic_order)
+		if levels is not None:
+			levels.extend(diagnostics_printed)
+		if ('not_permitted' in diagnostics_printed) or ('error' in diagnostics_printed):
+			passed = False
+			break
+	with timings.phase('output'):
+		sys.stdout.write(render_diagnostics(diagnostics, args, lambda filename: C_source_lines))
+		if records is not None:
+			records.extend(diagnostic_records(diagnostics, args))
+
+	release_syntax_tree(abstract_syntax_tree)
+	return passed
+
+
+def clang_diagnostic(diagnostic, C_source_filename):
+	"""
+	@returns Diagnostic for a diagnostic from libclang, e.g. a compile error, shown as libclang formats it
+	but always located using C_source_filename, as libclang uses an absolute path for the main file
+	once a translation unit with a precompiled preamble is reparsed
+	"""
+	severities = {
+		clang.cindex.Diagnostic.Note: 'note',
+		clang.cindex.Diagnostic.Warning: 'warning',
+		clang.cindex.Diagnostic.Error: 'error',
+		clang.cindex.Diagnostic.Fatal: 'fatal error',
+	}
+	text = diagnostic.format()
+	location = diagnostic.location
+	filename = location.file.name if location.file else None
+	if filename and filename != C_source_filename and os.path.realpath(filename) == os.path.realpath(C_source_filename):
+		if text.startswith(filename + ':'):
+			text = C_source_filename + text[len(filename):]
+		filename = C_source_filename
+	severity = severities.get(diagnostic.severity, 'ignored')
+	return Diagnostic(filename, location.line or None, location.column or None, None, diagnostic.spelling, render_clang_diagnostic, details=(severity, text))
+
+
+def render_clang_diagnostic(diagnostic, args, source_lines):
+	(_, text) = diagnostic.details
+	return text + '\n'
+
+
+def walk_syntax_tree(node, checkers, function_results=None):
+	"""
+	single depth-first walk of a syntax tree snapshot (see abstract_syntax_tree_nodes)
+	calling the enter/exit hooks of every checker
+	enter_function/exit_function bracket the nodes of each function definition
+	if function_results is a FunctionResults, functions it has results for are replayed rather than walked
+	and the results of walking other functions are saved in it
+
+	an explicit stack is used rather than recursion so deeply nested code
+	(long else-if chains, long chains of binary operators) can't exceed Python's recursion limit
+	stack entries are (node, None) to enter a node and (node, is_function) to exit it
+	"""
+	stack = [(node, None)]
+	while stack:
+		(node, is_function) = stack.pop()
+		if is_function is not None:
+			for checker in checkers:
+				checker.exit(node)
+			if is_function:
+				for checker in checkers:
+					checker.exit_function(node)
+				if function_results:
+					function_results.save(node, checkers)
+			continue
+
+		if function_results and function_results.replay(node, checkers):
+			continue
+
+		# skip declarations
+		is_function = (node.depth == 1 and
+			node.kind == CKind.FUNCTION_DECL and
+			any(c.kind == CKind.COMPOUND_STMT for c in node.children))
+
+		if is_function:
+			if function_results:
+				function_results.mark(node, checkers)
+			for checker in checkers:
+				checker.enter_function(node)
+		for checker in checkers:
+			checker.enter(node)
+		stack.append((node, is_function))
+		stack.extend((child, None) for child in reversed(node.children))
+
+
+class FunctionResults():
+	"""
+	what each checker did for each function definition in a file, kept between checks by --watch
+	so when the file changes, functions whose source is unchanged needn't be snapshotted or walked again
+
+	A function's results are reused if its source text & starting column are unchanged,
+	the file's source outside function bodies (declarations, prototypes, macros, ...) is unchanged,
+	and every checker is in the same state when the function is reached (see Checker.function_state).
+	Line numbers are saved relative to the function's first line, so results are reused for functions which have moved.
+	Results are only kept for the functions in the last check of the file.
+	"""
+	def __init__(self):
+		self.results = {}
+		self.previous = {}
+		self.context = None
+		self.source = None
+		self.deferred = {}
+		self.is_from_main_file = None
+		self.entry = None
+		self.cancelled = None
+
+	def clear(self):
+		"""
+		forget all results, e.g. because an included file has changed
+		"""
+		self.results = {}
+		self.context = None
+
+	def start(self, tu, C_source):
+		"""
+		called before tu, parsed from C_source, is snapshotted
+		@returns function for abstract_syntax_tree_nodes which skips the children of functions with saved results
+		"""
+		self.previous = self.results
+		self.results = {}
+		self.deferred = {}
+		self.is_from_main_file = get_main_file_test(tu)
+		if '\ufffd' in C_source:
+			# not valid UTF-8, so libclang's byte offsets can't be used to find function source
+			self.source = None
+			self.previous = {}
+			return None
+		self.source = C_source.encode('utf-8')
+		return self.skip_children
+
+	def skip_children(self, node):
+		if node.depth != 1 or node.kind != CKind.FUNCTION_DECL:
+			return False
+		key = self.key(node)
+		if key not in self.previous:
+			return False
+		self.deferred[node] = key
+		return True
+
+	def key(self, function):
+		return (self.source[function.start_offset:function.end_offset], function.start_column)
+
+	def check_context(self, root):
+		"""
+		called once root has been snapshotted, results are discarded if the source outside function bodies has changed
+		"""
+		if self.source is None:
+			return
+		context = []
+		offset = 0
+		for node in root.children:
+			if node in self.deferred:
+				(body_start, body_end) = self.previous[self.deferred[node]]['body']
+				body = (node.start_offset + body_start, node.start_offset + body_end)
+			else:
+				bodies = [child for child in node.children if child.kind == CKind.COMPOUND_STMT]
+				if node.kind != CKind.FUNCTION_DECL or not bodies:
+					continue
+				body = (bodies[-1].start_offset, bodies[-1].end_offset)
+			context.append(self.source[offset:body[0]])
+			offset = body[1]
+		context.append(self.source[offset:])
+		# lines added or removed or re-indented between functions only move them
+		context = re.sub(rb'[ \t]*\n\s*', b'\n', b'{}'.join(context))
+		if context != self.context:
+			self.previous = {}
+			self.context = context
+
+	def replay(self, node, checkers):
+		"""
+		@returns True if saved results for the function node have been replayed to checkers,
+		otherwise if node's children were skipped they are snapshotted so it can be walked
+		"""
+		key = self.deferred.pop(node, None)
+		if key is None:
+			return False
+		states = tuple(checker.function_state() for checker in checkers)
+		previous = self.previous.get(key)
+		if not previous or states not in previous['saved']:
+			add_syntax_tree_children(node, [], node.filename, self.is_from_main_file)
+			return False
+		for (checker, saved) in zip(checkers, previous['saved'][states]):
+			checker.replay_function(node, saved)
+		self.results[key] = previous
+		return True
+
+	def mark(self, function, checkers):
+		"""
+		called before the function is walked
+		if self.cancelled returns True the check is abandoned, keeping results saved so far
+		"""
+		if self.cancelled and self.cancelled():
+			self.results = {**self.previous, **self.results}
+			raise CheckCancelled()
+		self.entry = (tuple(checker.function_state() for checker in checkers), [checker.function_mark() for checker in checkers])
+
+	def save(self, function, checkers):
+		"""
+		called after the function is walked
+		"""
+		if self.source is None:
+			return
+		(states, marks) = self.entry
+		bodies = [child for child in function.children if child.kind == CKind.COMPOUND_STMT]
+		body = (bodies[-1].start_offset - function.start_offset, bodies[-1].end_offset - function.start_offset)
+		result = self.results.setdefault(self.key(function), {'body': body, 'saved': {}})
+		result['saved'][states] = [checker.save_function(function, mark) for (checker, mark) in zip(checkers, marks)]
+
+
+class CheckCancelled(Exception):
+	"""
+	raised to abandon checking a file whose contents have changed again, see FunctionResults.mark
+	"""
+
+
+def parse_C_source(index, C_source_filename, C_source, args, index_parse_args, C_source_bytes):
+	"""
+	parse C_source_filename using args.precompiled_header if it is applicable
+	if there are any errors parse without the precompiled header
+	so error messages are always exactly those of a plain parse
+
+	C_source_bytes, the file's contents, are given to libclang rather than it rereading the file.
+	They must be bytes: the contents of unsaved_files are passed with their length, and older clang python
+	bindings took the length of a str, in characters, so a file containing UTF-8 was cut short -
+	producing a syntax error at its end, e.g. with crack_substitution.c. Decoding with errors='replace'
+	& re-encoding would also change a file which isn't valid UTF-8, moving columns.
+
+	@returns (translation unit, files the precompiled header depends on)
+	"""
+	unsaved_files = [(C_source_filename, C_source_bytes)]
+	precompiled_header = args.precompiled_header
+	precompiled_header_args = precompiled_header.parse_args(index, C_source) if precompiled_header else []
+	if precompiled_header_args:
+		try:
+			tu = index.parse(C_source_filename, args=index_parse_args + precompiled_header_args, unsaved_files=unsaved_files)
+			errors = [clang.cindex.Diagnostic.Error, clang.cindex.Diagnostic.Fatal]
+			if not any(diagnostic.severity in errors for diagnostic in tu.diagnostics):
+				return (tu, precompiled_header.dependencies())
+			dispose_clang_object(tu, 'clang_disposeTranslationUnit')
+		except clang.cindex.TranslationUnitLoadError:
+			pass
+	return (index.parse(C_source_filename, args=index_parse_args, unsaved_files=unsaved_files), [])
+
+
+class HeaderDerivedFiles():
+	"""
+	directory storing files derived from headers, e.g. precompiled headers & the USRs headers declare,
+	the cache directory if there is one, otherwise a per-user temporary directory
+
+	Files are named with a key hashed from what they are derived from & the libclang version.
+	A directory belonging to someone else is not used, as they could have put misleading files there.
+	"""
+	def __init__(self, directory):
+		import tempfile
+		self.directory = directory or os.path.join(tempfile.gettempdir(), f'c_check-{os.getuid()}')
+
+	def key(self, key_data):
+		import hashlib, json
+		library_file = clang.cindex.Config.library_file
+		key_data = key_data + [ResultCache.file_states([library_file]) if library_file else None]
+		return hashlib.sha256(json.dumps(key_data).encode()).hexdigest()[0:32]
+
+	def path(self, name):
+		return os.path.join(self.directory, name)
+
+	def owned(self, create=False):
+		"""
+		@returns True iff the directory exists, after creating it if create, and belongs to the user
+		"""
+		try:
+			if create:
+				os.makedirs(self.directory, mode=0o700, exist_ok=True)
+			return os.stat(self.directory).st_uid == os.getuid()
+		except OSError:
+			return False
+
+
+def write_file_atomically(path, contents):
+	"""
+	write contents to path via a temporary file in the same directory which is renamed,
+	so other processes never see a partly written file
+	contents is a str, bytes, or a function given the temporary file's name which writes it
+	"""
+	import tempfile
+	(fd, temporary_path) = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+	try:
+		if callable(contents):
+			os.close(fd)
+			contents(temporary_path)
+		else:
+			with os.fdopen(fd, 'wb' if isinstance(contents, bytes) else 'w') as f:
+				f.write(contents)
+		os.replace(temporary_path, path)
+	except BaseException:
+		try:
+			os.unlink(temporary_path)
+		except OSError:
+			pass
+		raise
+
+
+class PrecompiledHeader():
+	"""
+	Most of the time parsing a typical file goes on the same few headers (stdio.h, stdlib.h, ...).
+	A precompiled header (PCH) of these headers is built when first needed and stored on disk,
+	in the cache directory if there is one, otherwise a per-user temporary directory.
+	The PCH is rebuilt if any file it was built from changes.
+
+	The PCH is used only for files which #include <...> all the headers, in the same order,
+	preceded only by blank lines & comments, so the declarations & macros seen are unchanged.
+	The file's own #includes are still processed, so headers need include guards, as system headers have.
+	"""
+	def __init__(self, headers, directory, index_parse_args):
+		self.headers = headers
+		self.index_parse_args = index_parse_args
+		self.store = HeaderDerivedFiles(directory)
+		key = self.store.key([headers, index_parse_args])
+		self.path = self.store.path(f'pch-{key}.pch')
+		self.dependencies_path = self.store.path(f'pch-{key}.json')
+		self.header_path = self.store.path(f'pch-{key}.h')
+		self.file_states = None
+		self.unusable = False
+
+	def parse_args(self, index, C_source):
+		"""
+		@returns extra arguments for parsing C_source with the PCH, [] if the PCH isn't applicable
+		"""
+		if self.unusable or leading_system_includes(C_source, len(self.headers)) != self.headers:
+			return []
+		if self.file_states is None and not self.load() and not self.build(index):
+			self.unusable = True
+			return []
+		return ['-include-pch', self.path]
+
+	def dependencies(self):
+		return [self.path] + [name for (name, _, _) in self.file_states]
+
+	def load(self):
+		"""
+		@returns True iff an up to date PCH is on disk
+		"""
+		import json
+		if not self.store.owned():
+			return False
+		try:
+			with open(self.dependencies_path) as f:
+				file_states = json.load(f)
+		except (OSError, ValueError):
+			return False
+		if not os.path.exists(self.path):
+			return False
+		if ResultCache.file_states(name for (name, _, _) in file_states) != file_states:
+			return False
+		self.file_states = file_states
+		return True
+
+	def build(self, index):
+		"""
+		@returns True iff PCH successfully built
+		"""
+		import json
+		if not self.store.owned(create=True):
+			return False
+		try:
+			with open(self.header_path, 'w') as f:
+				f.write(''.join(f'#include <{header}>\n' for header in self.headers))
+			tu = index.parse(self.header_path, args=self.index_parse_args + ['-x', 'c-header'],
+				options=clang.cindex.TranslationUnit.PARSE_INCOMPLETE)
+			errors = [clang.cindex.Diagnostic.Error, clang.cindex.Diagnostic.Fatal]
+			if any(diagnostic.severity in errors for diagnostic in tu.diagnostics):
+				return False
+			file_states = ResultCache.file_states([self.header_path] + [inclusion.include.name for inclusion in tu.get_includes()])
+
+			write_file_atomically(self.path, tu.save)
+			write_file_atomically(self.dependencies_path, json.dumps(file_states))
+		except (OSError, clang.cindex.TranslationUnitLoadError, clang.cindex.TranslationUnitSaveError) as e:
+			print(f"c_check: can not build precompiled header: {e}", file=sys.stderr)
+			return False
+		self.file_states = file_states
+		return True
+
+
+def leading_system_includes(C_source, n):
+	"""
+	@returns list of the names of the first n headers from #include <...> lines at the start of C_source,
+	stopping at the first line which is not an #include, blank or a comment
+	"""
+	headers = []
+	in_comment = False
+	for line in C_source.splitlines():
+		if len(headers) >= n:
+			break
+		if in_comment:
+			if '*/' not in line:
+				continue
+			in_comment = False
+			line = line[line.index('*/') + 2:]
+		line = line.strip()
+		if not line or line.startswith('//'):
+			continue
+		if line.startswith('/*'):
+			if '*/' in line[2:]:
+				if line.endswith('*/'):
+					continue
+				break
+			in_comment = True
+			continue
+		m = re.match(r'#\s*include\s*<([^>]+)>\s*(//.*)?$', line)
+		if not m:
+			break
+		headers.append(m.group(1))
+	return headers
+
+
+class Timings():
+	"""
+	wall & CPU time taken by each phase of checking a file & by each checker,
+	the number of nodes in its syntax tree and the number of calls made to libclang, for --timings
+	a phase can be timed repeatedly, its times are summed
+	"""
+	def __init__(self, filename):
+		self.filename = filename
+		self.times = {}
+		self.nodes = None
+		self.libclang_calls = collections.Counter(libclang_calls)
+
+	def phase(self, name):
+		return TimingsPhase(self, name)
+
+	def add(self, name, wall, cpu):
+		times = self.times.setdefault(name, [0, 0])
+		times[0] += wall
+		times[1] += cpu
+
+	def report(self):
+		"""
+		@returns dict describing the timings, times in milliseconds
+		"""
+		calls = collections.Counter(libclang_calls)
+		calls.subtract(self.libclang_calls)
+		calls = {name: count for (name, count) in calls.most_common() if count}
+		return {
+			'file': self.filename,
+			'nodes': self.nodes,
+			'libclang_calls': sum(calls.values()),
+			'libclang_calls_by_function': calls,
+			'phases': {name: {'wall_ms': round(wall * 1000, 3), 'cpu_ms': round(cpu * 1000, 3)} for (name, (wall, cpu)) in self.times.items()},
+		}
+
+
+class TimingsPhase():
+	def __init__(self, timings, name):
+		self.timings = timings
+		self.name = name
+
+	def __enter__(self):
+		self.wall = time.perf_counter()
+		self.cpu = time.process_time()
+
+	def __exit__(self, *exception):
+		self.timings.add(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu)
+		return False
+
+
+class NoTimings():
+	"""
+	stand-in for Timings when --timings isn't used, so timing a phase costs almost nothing
+	"""
+	def phase(self, name):
+		return self
+
+	def __enter__(self):
+		pass
+
+	def __exit__(self, *exception):
+		return False
+
+
+NO_TIMINGS = NoTimings()
+
+# reports from Timings.report to be written by --timings-json
+timings_reports = []
+
+# libclang function name -> number of calls, once count_libclang_calls has been called
+libclang_calls = collections.Counter()
+libclang_calls_counted = False
+
+
+def count_libclang_calls():
+	"""
+	replace the python bindings' libclang functions with wrappers which count their calls in libclang_calls
+	"""
+	global libclang_calls_counted
+	if libclang_calls_counted:
+		return
+	libclang_calls_counted = True
+	lib = clang.cindex.conf.lib
+	for (name, *_) in clang.cindex.functionList:
+		function = getattr(lib, name, None)
+		if function is not None:
+			setattr(lib, name, counted_libclang_function(name, function))
+
+
+def counted_libclang_function(name, function):
+	"""
+	@returns function wrapped to count its calls in libclang_calls,
+	or function unchanged if calls aren't being counted
+	"""
+	if not libclang_calls_counted:
+		return function
+	def counted(*args):
+		libclang_calls[name] += 1
+		return function(*args)
+	return counted
+
+
+def print_timings(report):
+	print(f"{report['file']}: {report['nodes']} nodes, {report['libclang_calls']} libclang calls", file=sys.stderr)
+	print(f"\t{'phase':32} {'wall ms':>9} {'cpu ms':>9}", file=sys.stderr)
+	for (name, times) in report['phases'].items():
+		print(f"\t{name:32} {times['wall_ms']:9.2f} {times['cpu_ms']:9.2f}", file=sys.stderr)
+
+
+def write_timings_json(filename):
+	import json
+	try:
+		with open(filename, 'w') as f:
+			json.dump(timings_reports, f, indent=1)
+	except OSError as e:
+		print(f"c_check: {e}", file=sys.stderr)
+
+
+class TimedChecker():
+	"""
+	wraps a checker, adding the time spent in each of its hooks to timings
+	"""
+	def __init__(self, checker, timings):
+		self.checker = checker
+		self.timings = timings
+		self.name = 'checker:' + type(checker).__name__
+
+	def timed(self, hook, *args):
+		wall = time.perf_counter()
+		cpu = time.process_time()
+		result = hook(*args)
+		self.timings.add(self.name, time.perf_counter() - wall, time.process_time() - cpu)
+		return result
+
+	def enter_function(self, function):
+		self.timed(self.checker.enter_function, function)
+
+	def exit_function(self, function):
+		self.timed(self.checker.exit_function, function)
+
+	def enter(self, n):
+		self.timed(self.checker.enter, n)
+
+	def exit(self, n):
+		self.timed(self.checker.exit, n)
+
+	def finish(self):
+		return self.timed(self.checker.finish)
+
+	def replay_function(self, function, saved):
+		self.timed(self.checker.replay_function, function, saved)
+
+	def __getattr__(self, name):
+		return getattr(self.checker, name)
+
+
+class Checker():
+	"""
+	checkers subscribe to the single walk of the syntax tree made by walk_syntax_tree
+	diagnostics are collected in self.diagnostics so they can be rendered in checker order after the walk
+	"""
+	def __init__(self, args, source_lines, source_filename, tokens):
+		self.args = args
+		self.source_lines = source_lines
+		self.source_filename = source_filename
+		self.tokens = tokens
+		self.diagnostics = []
+		self.levels = []
+
+	def enabled(self):
+		return True
+
+	def enter_function(self, function):
+		pass
+
+	def exit_function(self, function):
+		pass
+
+	def enter(self, n):
+		pass
+
+	def exit(self, n):
+		pass
+
+	def finish(self):
+		"""
+		called after the walk is complete
+		@returns list of levels of diagnostic messages printed
+		"""
+		return self.levels
+
+	# hooks used by FunctionResults so --watch can reuse what a checker did for an unchanged function
+
+	def function_state(self):
+		"""
+		@returns value identifying the checker & any of its state, other than the function's source,
+		which affects what it does for a function
+		"""
+		return type(self).__name__
+
+	def function_mark(self):
+		"""
+		called before a function is walked
+		@returns the position in the checker's diagnostics & levels, passed to save_function
+		"""
+		return (len(self.diagnostics), len(self.levels))
+
+	def save_function(self, function, mark):
+		"""
+		called after a function is walked
+		@returns what the checker did for the function, with line numbers relative to its first line
+		"""
+		(n_diagnostics, n_levels) = mark
+		return (relocate_diagnostics(self.diagnostics[n_diagnostics:], -function.start_line), self.levels[n_levels:])
+
+	def replay_function(self, function, saved):
+		"""
+		repeat what the checker did for an unchanged function, saved is from save_function
+		"""
+		(diagnostics, levels) = saved
+		self.diagnostics += relocate_diagnostics(diagnostics, function.start_line)
+		self.levels += levels
+
+
+class SyntaxTreeChecker(Checker):
+	"""
+	run the checks in SYNTAX_TREE_NODE_CHECKS on every node
+	"""
+	def __init__(self, *args):
+		super().__init__(*args)
+		self.plan = self.args.check_plan
+		# headers in -I directories may be the program's own, see lexical_triggers
+		if self.plan and not self.args.full_parse and not self.args.include_directories:
+			self.plan = prune_check_plan(self.plan, '\n'.join(self.source_lines))
+		self.state = {'tokens': self.tokens}
+
+	def enabled(self):
+		return bool(self.plan)
+
+	def enter(self, n):
+		for (function, level) in self.plan.get(n.kind, ()):
+			description = function(n, self.args, self.state)
+			if description:
+				self.diagnostics.append(node_diagnostic(n, description, level))
+				self.levels.append(level)
+
+	def finish(self):
+		if self.args.extra_text and (('not_permitted' in self.levels) or ('not_recommended' in self.levels)):
+			self.diagnostics.append(text_diagnostic(self.source_filename, self.args.extra_text))
+		return self.levels
+
+	def function_state(self):
+		# check_multiple_malloc counts calls across functions
+		return (type(self).__name__, self.state.get('malloc_calls_count', 0))
+
+	def save_function(self, function, mark):
+		return (super().save_function(function, mark), self.state.get('malloc_calls_count', 0))
+
+	def replay_function(self, function, saved):
+		(saved, malloc_calls_count) = saved
+		super().replay_function(function, saved)
+		if malloc_calls_count:
+			self.state['malloc_calls_count'] = malloc_calls_count
+
+
+Diagnostic = collections.namedtuple('Diagnostic', ['filename', 'line', 'column', 'level', 'message', 'render', 'end_line', 'end_column', 'details'],
+	defaults=[None, None, None])
+Diagnostic.__doc__ = """
+diagnostic collected by a checker, render is called with (diagnostic, args, source lines) to produce its text
+only if it is shown, see render_diagnostics
+line is None for diagnostics about a whole file, level is None for text which isn't a diagnostic, e.g. --extra-text
+"""
+
+
+def node_diagnostic(n, message, level):
+	"""
+	@returns Diagnostic located at n, a Node or SummaryLocation
+	"""
+	return Diagnostic(n.filename, n.start_line, n.start_column, level, message, render_node_diagnostic, n.end_line, n.end_column)
+
+
+def text_diagnostic(C_source_filename, text):
+	return Diagnostic(C_source_filename, None, None, None, text, render_text)
+
+
+def render_node_diagnostic(diagnostic, args, source_lines):
+	"""
+	@returns diagnostic's message, followed by its source line with the node underlined if it is on one line
+	"""
+	message = node_diagnostic_message(diagnostic, args)
+	text = f"{diagnostic.filename}:{diagnostic.line}:{diagnostic.column} {colored(level_severity(diagnostic.level), 'red')}: {message}\n"
+
+	line_number = diagnostic.line
+	if line_number != diagnostic.end_line:
+		# should we display multi-line constructs
+		return text
 
-	clang_resource_dir = subprocess.check_output([clang_bin, '-print-resource-dir'], universal_newlines=True).splitlines()[0]
-	include_directory = os.path.join(clang_resource_dir, 'include')
+	if not line_number or line_number > len(source_lines):
+		return text
 
-	# it'd sure be nice if clang knew where libclang was...
-	libclang_path = os.path.dirname(os.path.dirname(clang_resource_dir))
-	libclangs = glob.glob(f'{libclang_path}/libclang.so.*')
-	if not libclangs:
-		print("c_check: can't find 'libclang.so'!", file=sys.stderr)
-		return []
+	line = source_lines[line_number - 1]
+	start = diagnostic.column
+	end = diagnostic.end_column
 
-	libclang = libclangs[0]
-	clang.cindex.Config.set_library_file(libclang)
+	if not start or not end:
+		return text
+	if start > len(line) or end > len(line) or start >= end:
+		return text
 
-	return ['-isystem', include_directory]
+	underline = '^' + '~' * (end - start - 1)
+	return text + line + '\n' + ' ' * (start - 1) + colored(underline, 'green') + '\n'
 
 
-def check_file(index, C_source_filename, args, index_parse_args):
+def node_diagnostic_message(diagnostic, args):
 	"""
-	@returns False if any check fails, True otherwise
+	@returns message shown for a diagnostic made by node_diagnostic, saying if what it found is not permitted or recommended
 	"""
-	try:
-		with open(C_source_filename, encoding='utf-8', errors='replace') as f:
-			C_source = f.read()
-	except OSError as e:
-		print(e, file=sys.stderr)
-		return False
-	try:
-		# using the unsaved_files parameter to avoid rereading the file produces
-		# a syntax error with activities/crack_substitution/solutions/crack_substitution.c
-		tu = index.parse(C_source_filename, args=index_parse_args)
-		for diagnostic in tu.diagnostics:
-			if diagnostic.severity in [clang.cindex.Diagnostic.Error, clang.cindex.Diagnostic.Fatal]:
-				print(diagnostic.format())
-				return 1
-			elif args.debug:
-				print(diagnostic.format())
-		abstract_syntax_tree = tu.cursor
-	except clang.cindex.TranslationUnitLoadError:
-		return False
+	message = diagnostic.message
+	if diagnostic.level in ["not_permitted", "not_recommended"]:
+		message += f" - this is {colored(diagnostic.level.replace('_', ' '), 'red')}"
+		if args.where_text:
+			message += " " + args.where_text
+	return message
 
-	if args.debug:
-		print_ast(abstract_syntax_tree)
 
-	C_source_lines = C_source.splitlines()
+def level_severity(level):
+	return "error" if level in ["error", "not_permitted"] else "warning"
 
-	checkers = [check_syntax_tree, check_file_expressions, check_tabs_spaces_mixed, check_body_indents]
 
-	for checker in checkers:
-		diagnostics_printed = checker(abstract_syntax_tree, args, C_source_lines, C_source_filename)
-		if ('not_permitted' in diagnostics_printed) or ('error' in diagnostics_printed):
-			return False
+def render_file_warning(diagnostic, args, source_lines):
+	"""
+	@returns a warning about the whole file followed by the lines in diagnostic.details
+	"""
+	return f"{diagnostic.filename}: {colored('warning', 'red')}: {diagnostic.message}\n" + ''.join(line + '\n' for line in diagnostic.details)
 
-	return True
 
+def render_text(diagnostic, args, source_lines):
+	return diagnostic.message + '\n'
 
-def check_syntax_tree(abstract_syntax_tree, args, C_source_lines, C_source_filename):
+
+def relocate_diagnostics(diagnostics, line_offset):
 	"""
-	@returns list of levels of diagnostic messages printed
+	@returns diagnostics with line_offset added to their line numbers
 	"""
-	state = {}
-	levels = []
-	for n in abstract_syntax_tree_nodes(abstract_syntax_tree):
-		for check in SYNTAX_TREE_NODE_CHECKS:
-			level = getattr(args, check)
-			if not level:
-				continue
-			function = globals()['check_' + check]
-			description = function(n, args, state)
-			if description:
-				print_diagnostic(n, description, args, level=level, source_lines=C_source_lines)
-				levels.append(level)
+	return [d if d.line is None else d._replace(line=d.line + line_offset, end_line=d.end_line and d.end_line + line_offset) for d in diagnostics]
 
-	if args.extra_text and (('not_permitted' in levels) or ('not_recommended' in levels)):
-		print(args.extra_text)
 
-	return levels
+def diagnostic_order(diagnostic):
+	"""
+	sort key putting diagnostics in order of location, followed by those about the whole file
+	"""
+	return (diagnostic.line is None, diagnostic.line or 0, diagnostic.column or 0)
 
 
-def print_diagnostic(n, message, args, level='warning', source_lines=[]):
-	prefix = level
-	if level in ["not_permitted", "not_recommended"]:
-		prefix = "error" if level == "not_permitted" else "warning"
-		message += f" - this is {colored(level.replace('_', ' '), 'red')}"
-		if args.where_text:
-			message += " " + args.where_text
-	print(f"{node_location(n)} {colored(prefix, 'red')}: {message}")
+def render_diagnostics(diagnostics, args, source_lines):
+	"""
+	source_lines is a function returning the lines of a file
+	@returns text of diagnostics, without duplicates, only diagnostics shown are rendered
+	after args.max_diagnostics diagnostics of a level the rest are counted rather than shown
+	"""
+	counts = collections.Counter()
+	text = []
+	for diagnostic in unique_diagnostics(diagnostics):
+		if diagnostic.level:
+			counts[diagnostic.level] += 1
+			if args.max_diagnostics and counts[diagnostic.level] > args.max_diagnostics:
+				continue
+		text.append(diagnostic.render(diagnostic, args, source_lines(diagnostic.filename)))
+	for (level, count) in counts.items():
+		if args.max_diagnostics and count > args.max_diagnostics:
+			kind = level_severity(level)
+			n_hidden = count - args.max_diagnostics
+			text.append(f"c_check: {n_hidden} more {kind}{'s' if n_hidden != 1 else ''} not shown, see --max-diagnostics\n")
+	return ''.join(text)
 
-	line_number = n.extent.start.line
-	if line_number != n.extent.end.line:
-		# should we display multi-line constructs
-		return
 
-	if not line_number or line_number > len(source_lines):
-		return
+def unique_diagnostics(diagnostics):
+	"""
+	@returns diagnostics without duplicates, e.g. from a macro used twice
+	"""
+	seen = set()
+	unique = []
+	for diagnostic in diagnostics:
+		key = (diagnostic.filename, diagnostic.line, diagnostic.column, diagnostic.level, diagnostic.message)
+		if key not in seen:
+			seen.add(key)
+			unique.append(diagnostic)
+	return unique
 
-	line = source_lines[line_number - 1]
-	start = n.extent.start.column
-	end = n.extent.end.column
 
-	if not start or not end:
-		return
-	if start > len(line) or end > len(line) or start >= end:
-		return
+def diagnostic_records(diagnostics, args):
+	"""
+	@returns list of dicts describing diagnostics, for batch & LSP output,
+	without duplicates but including any not shown because of --max-diagnostics
+	text which isn't a diagnostic, e.g. --extra-text, is left out
 
-	print(line)
-	underline = '^' + '~' * (end - start - 1)
-	print(' ' * (start - 1) + colored(underline, 'green'))
+	Each has the file, line, column, severity & message of the diagnostic's first line,
+	end_line & end_column if it is about a node, details if other lines follow its first line,
+	and lines if it is about incorrectly indented lines.
+	"""
+	records = []
+	for diagnostic in unique_diagnostics(diagnostics):
+		record = {'file': diagnostic.filename, 'line': diagnostic.line, 'column': diagnostic.column}
+		if diagnostic.render is render_node_diagnostic:
+			record.update(severity=level_severity(diagnostic.level), message=node_diagnostic_message(diagnostic, args),
+				end_line=diagnostic.end_line, end_column=diagnostic.end_column)
+		elif diagnostic.render is render_file_warning:
+			record.update(severity='warning', message=diagnostic.message, details=list(diagnostic.details))
+		elif diagnostic.render is render_indents:
+			(line_indent, show_intervals) = diagnostic.details
+			lines = [n for (start, end) in show_intervals for n in range(start, end + 1) if n in line_indent and not line_indent[n].correctly_indented()]
+			record.update(severity='warning', message=diagnostic.message, lines=lines)
+		elif diagnostic.render is render_line_note:
+			record.update(severity=level_severity(diagnostic.level), message=diagnostic.message)
+		elif diagnostic.render is render_clang_diagnostic:
+			record.update(severity=diagnostic.details[0], message=diagnostic.message)
+		else:
+			continue
+		records.append(record)
+	return records
 
 
 def check_break(n, args, state):     return check_kind(n, "break statement",    CKind.BREAK_STMT)
@@ -285,12 +2337,12 @@ def check_kind(n, name, value):
 
 
 def check_array(n, args, state):
-	if n.kind == CKind.VAR_DECL and '[' in n.type.spelling:
+	if n.kind == CKind.VAR_DECL and '[' in n.type_spelling:
 		return "array used"
 
 
 def check_comma(n, args, state):
-	if n.kind == CKind.BINARY_OPERATOR and get_operator(n) == ',':
+	if n.kind == CKind.BINARY_OPERATOR and get_operator(n, state['tokens']) == ',':
 		return "comma operator used"
 
 
@@ -316,7 +2368,7 @@ def check_multiple_malloc(n, args, state):
 
 
 def check_non_char_array(n, args, state):
-	if n.kind == CKind.VAR_DECL and '[' in n.type.spelling and 'char' not in n.type.spelling:
+	if n.kind == CKind.VAR_DECL and '[' in n.type_spelling and 'char' not in n.type_spelling:
 		return "non-char array used"
 
 
@@ -334,57 +2386,207 @@ def check_static_local_variable(n, args, state):
 			return f"variable '{colored(n.displayname, 'cyan')}' is a static variable"
 
 
-def check_string_library(n, args, state):
-	if (n.kind == CKind.DECL_REF_EXPR and
-		n.referenced and
-		n.referenced.location and
-		n.referenced.location.file and
-		n.referenced.location.file.name == "/usr/include/string.h"):
-		return "string.h used"
+def check_banned_header(n, args, state):   return check_header_used(n, "banned_header", args, state)
+def check_string_library(n, args, state):  return check_header_used(n, "string_library", args, state)
+def check_unistd_library(n, args, state):  return check_header_used(n, "unistd_library", args, state)
+
+
+def check_header_used(n, check, args, state):
+	"""
+	the checks in BANNED_HEADER_CHECKS are given the same DECL_REF_EXPR in turn
+	so what it refers to is looked up once & remembered in state,
+	as is the result for each declaration, as most programs call the same few functions many times
+	"""
+	if state.get('header_used_node') is not n:
+		state['header_used_node'] = n
+		state['header_used'] = args.banned_header_index.lookup(n, state.setdefault('header_used_declarations', {}))
+	header = state['header_used'].get(check)
+	if header:
+		return f"{header} used"
 
 
-def check_unistd_library(n, args, state):
-	if (n.kind == CKind.DECL_REF_EXPR and
-		n.referenced and
-		n.referenced.location and
-		n.referenced.location.file and
-		n.referenced.location.file.name == "/usr/include/unistd.h"):
-		return "unistd.h used"
+def banned_headers(args):
+	"""
+	@returns dict of each enabled check in BANNED_HEADER_CHECKS -> list of the headers it bans
+	"""
+	headers = {}
+	for (check, check_headers) in BANNED_HEADER_CHECKS.items():
+		if not getattr(args, check):
+			continue
+		if check == 'banned_header':
+			check_headers = [header.strip() for header in (args.banned_headers or '').split(',') if header.strip()]
+		headers[check] = check_headers
+	return headers
 
 
-def check_file_expressions(abstract_syntax_tree, args, source_lines, C_source_filename):
-	levels = []
-	for function in get_functions(abstract_syntax_tree):
-		variables_used_for_ASCII = set()
-		for n in abstract_syntax_tree_nodes(function):
-			levels += check_for_char_input_function_assigned_to_char_variable(args, n, source_lines)
-			levels += check_for_integer_ascii_codes(n, args, variables_used_for_ASCII, source_lines)
-	return levels
+class BannedHeaderIndex():
+	"""
+	Whether a reference is to a function from a header can't be decided by comparing the path
+	of the file declaring it with the header's path, as system headers move
+	(e.g. /usr/include/x86_64-linux-gnu/...) and declarations are often in files they include (e.g. bits/getopt_posix.h).
+
+	Instead each header is parsed, when first needed, and the USRs (libclang's unique identifiers)
+	of the functions, variables & enumeration constants it declares are collected. _GNU_SOURCE is defined
+	so declarations a program only sees if it defines a feature test macro are included.
+	A reference is checked by looking up the USR of what it refers to, and only references
+	with a name some header declares need this, so most references cost one libclang call.
+	A C function's USR is just its name, so what it refers to must also be in a system header,
+	otherwise a program's own function with the same name as one from a header would be reported.
+
+	The USRs are stored on disk, like PrecompiledHeader, and collected again if any file
+	the header includes changes.
+	"""
+	def __init__(self, check_headers, directory, index_parse_args):
+		self.check_headers = check_headers
+		self.store = HeaderDerivedFiles(directory)
+		self.index_parse_args = index_parse_args + ['-D_GNU_SOURCE']
+		self.usrs = None
+		self.names = None
+		self.is_in_system_header = None
+
+	def lookup(self, n, declarations):
+		"""
+		declarations is a dict remembering the result for each declaration already looked up in n's translation unit
+
+		@returns dict of check -> header for the checks banning the declaration DECL_REF_EXPR n refers to
+		"""
+		if self.usrs is None:
+			self.load()
+		spelling = n.spelling
+		if spelling not in self.names:
+			return {}
+		referenced = n.referenced
+		if not referenced:
+			return {}
+		key = (spelling, referenced.hash)
+		if key not in declarations:
+			checks = self.usrs.get(referenced.get_usr(), {})
+			if checks and not self.is_in_system_header(referenced.location):
+				checks = {}
+			declarations[key] = checks
+		return declarations[key]
+
+	def load(self):
+		self.usrs = {}
+		self.names = set()
+		self.is_in_system_header = get_system_header_test()
+		index = None
+		for (check, headers) in self.check_headers.items():
+			for header in headers:
+				declarations = self.load_header(header)
+				if declarations is None:
+					index = index or clang.cindex.Index.create()
+					declarations = self.index_header(index, header)
+				for (usr, name) in declarations.items():
+					self.usrs.setdefault(usr, {}).setdefault(check, header)
+					self.names.add(name)
+		if index:
+			dispose_clang_object(index, 'clang_disposeIndex')
+
+	def path(self, header):
+		return self.store.path(f'banned-{self.store.key([header, self.index_parse_args])}.json')
+
+	def load_header(self, header):
+		"""
+		@returns dict of USR -> name of declarations from header stored on disk, None if they aren't up to date
+		"""
+		import json
+		if not self.store.owned():
+			return None
+		try:
+			with open(self.path(header)) as f:
+				(file_states, declarations) = json.load(f)
+		except (OSError, ValueError):
+			return None
+		if ResultCache.file_states(name for (name, _, _) in file_states) != file_states:
+			return None
+		return declarations
+
+	def index_header(self, index, header):
+		"""
+		@returns dict of USR -> name of the functions, variables & enumeration constants header declares
+		"""
+		import json
+		source_filename = 'c_check_banned_header.c'
+		source = f'#include <{header}>\n'.encode()
+		try:
+			tu = index.parse(source_filename, args=self.index_parse_args, unsaved_files=[(source_filename, source)],
+				options=clang.cindex.TranslationUnit.PARSE_INCOMPLETE)
+		except clang.cindex.TranslationUnitLoadError as e:
+			print(f"c_check: can not index {header}: {e}", file=sys.stderr)
+			return {}
+		errors = [clang.cindex.Diagnostic.Error, clang.cindex.Diagnostic.Fatal]
+		for diagnostic in tu.diagnostics:
+			if diagnostic.severity in errors:
+				print(f"c_check: can not index {header}: {diagnostic.spelling}", file=sys.stderr)
+				return {}
+
+		kinds = [CKind.FUNCTION_DECL, CKind.VAR_DECL, CKind.ENUM_CONSTANT_DECL]
+		declarations = {}
+		for cursor in tu.cursor.get_children():
+			for declaration in cursor.get_children() if cursor.kind == CKind.ENUM_DECL else [cursor]:
+				if declaration.kind in kinds:
+					declarations[declaration.get_usr()] = declaration.spelling
+		file_states = ResultCache.file_states(inclusion.include.name for inclusion in tu.get_includes())
+		dispose_clang_object(tu, 'clang_disposeTranslationUnit')
+
+		try:
+			if self.store.owned(create=True):
+				write_file_atomically(self.path(header), json.dumps([file_states, declarations]))
+		except OSError:
+			# storing the USRs is only an optimization
+			pass
+		return declarations
+
+
+class ExpressionChecker(Checker):
+	"""
+	check expressions within each function
+	"""
+	def __init__(self, *args):
+		super().__init__(*args)
+		self.function = None
+		self.variables_used_for_ASCII = set()
+
+	def enabled(self):
+		return bool(self.args.assign_getchar_char or self.args.integer_ascii_code)
+
+	def enter_function(self, function):
+		self.function = function
+		self.variables_used_for_ASCII = set()
+
+	def exit_function(self, function):
+		self.function = None
+
+	def enter(self, n):
+		if self.function is None:
+			return
+		self.levels += check_for_char_input_function_assigned_to_char_variable(self.args, n, self.diagnostics)
+		self.levels += check_for_integer_ascii_codes(n, self.args, self.variables_used_for_ASCII, self.tokens, self.diagnostics)
 
 
-def check_for_char_input_function_assigned_to_char_variable(args, n, source_lines):
+def check_for_char_input_function_assigned_to_char_variable(args, n, diagnostics):
 	level = args.assign_getchar_char
 	if not level:
 		return []
 	variable = None
 	function = None
 	if n.kind == CKind.BINARY_OPERATOR:
-		left, right = n.get_children()
+		left, right = n.children
 		variable = is_variable(left)
 		function = is_char_input_function(right)
 	elif n.kind == CKind.VAR_DECL:
 		variable = n
-		children = list(n.get_children())
-		if children:
-			function = is_char_input_function(children[0])
+		if n.children:
+			function = is_char_input_function(n.children[0])
 	if variable and function and variable.type.spelling == 'char':
 		message = f" return value of {function.spelling} assigned to {colored('char', 'red')} variable '{variable.spelling}', change the type of '{variable.spelling}' to {colored('int', 'red')}"
-		print_diagnostic(n, message, args, level=level, source_lines=source_lines)
+		diagnostics.append(node_diagnostic(n, message, level))
 		return [level]
 	return []
 
 
-def check_for_integer_ascii_codes(n, args, variables_used_for_ASCII, source_lines):
+def check_for_integer_ascii_codes(n, args, variables_used_for_ASCII, tokens, diagnostics):
 	level = args.integer_ascii_code
 	if not level:
 		return []
@@ -399,21 +2601,17 @@ def check_for_integer_ascii_codes(n, args, variables_used_for_ASCII, source_line
 	"""
 
 	if n.kind == CKind.VAR_DECL:
-		try:
-			initializer = next(n.get_children())
-			if is_char_expr(initializer, variables_used_for_ASCII):
-				variables_used_for_ASCII.add(n.hash)
-		except StopIteration:
-			pass
+		if n.children and is_char_expr(n.children[0], variables_used_for_ASCII):
+			variables_used_for_ASCII.add(n.hash)
 		return []
 
 	if n.kind != CKind.BINARY_OPERATOR:
 		return []
 
-	operator = get_operator(n)
+	operator = get_operator(n, tokens)
 
 	if operator == '=':
-		(left, right) = n.get_children()
+		(left, right) = n.children
 		variable = is_variable(left)
 		if variable:
 			if is_char_expr(right, variables_used_for_ASCII):
@@ -437,11 +2635,15 @@ def check_for_integer_ascii_codes(n, args, variables_used_for_ASCII, source_line
 
 	#  variable previously assigned result of getchar etc. is  compared to integer literal
 	try:
-		ascii_code = int(next(integer_literal.get_tokens()).spelling)
+		spelling = tokens.token_at(integer_literal.start_offset)
+		if not spelling or not spelling[0].isdigit():
+			# the literal is from a macro, e.g. #define NEWLINE 10, the token at its expansion location is the macro's name
+			spelling = tokens.first_token(integer_literal.cursor)
+		ascii_code = int(spelling or '')
 		if 6 < ascii_code < 13 or 31 < ascii_code < 126:
 			correct = repr(chr(ascii_code))
 			message = f"ASCII code {colored(str(ascii_code), 'red')} used, replace with {colored(correct, 'red')}"
-			print_diagnostic(integer_literal, message, args, level='warning', source_lines=source_lines)
+			diagnostics.append(node_diagnostic(integer_literal, message, 'warning'))
 			return [level]
 	except ValueError:
 		pass
@@ -449,7 +2651,7 @@ def check_for_integer_ascii_codes(n, args, variables_used_for_ASCII, source_line
 
 
 def test_children(n, condition):
-	for child in n.get_children():
+	for child in n.children:
 		value = condition(child)
 		if value:
 			return child if value is True else value
@@ -457,15 +2659,15 @@ def test_children(n, condition):
 
 def is_variable(n):
 	while n.kind == CKind.UNEXPOSED_EXPR:
-		n = next(n.get_children())
+		n = n.children[0]
 	if n and n.kind == CKind.DECL_REF_EXPR:
 		return n.referenced
 
 
 def is_char_expr(n, variables_used_for_ASCII):
 	while n.kind == CKind.UNEXPOSED_EXPR:
-		n = next(n.get_children())
-	if n and n.type and n.type.spelling == 'char':
+		n = n.children[0]
+	if n and n.type_spelling == 'char':
 		return n
 	# these return int, but are char for these purposes
 	if is_char_input_function(n):
@@ -477,65 +2679,199 @@ def is_char_expr(n, variables_used_for_ASCII):
 
 def is_char_input_function(n):
 	while n and n.kind == CKind.UNEXPOSED_EXPR:
-		n = next(n.get_children())
+		n = n.children[0]
 	if n and n.kind == CKind.CALL_EXPR and n.spelling in ['getchar', 'getc', 'fgetc']:
 		return n
 
 
-def get_operator(n):
+def get_operator(n, tokens):
+	"""
+	for some reason n.spelling doesn't contain the operator for a binary operator
+	libclang >= 17 can give us the operator directly, otherwise
+	use the extents of the operands to find the appropriate token
+	"""
+	binary_operator_spelling = get_binary_operator_spelling_function()
+	if binary_operator_spelling:
+		return binary_operator_spelling(n.cursor)
+	(left,right) = n.children
+	return tokens.token_between(left.end_offset, right.start_offset)
+
+
+@functools.lru_cache(maxsize=None)
+def get_binary_operator_spelling_function():
+	"""
+	@returns function returning the spelling of a binary operator cursor's operator
+	or None if libclang doesn't provide clang_getCursorBinaryOperatorKind (added in libclang 17)
+	"""
+	import ctypes
+	lib = clang.cindex.conf.lib
+	try:
+		operator_kind = lib['clang_getCursorBinaryOperatorKind']
+		operator_kind_spelling = lib['clang_getBinaryOperatorKindSpelling']
+	except AttributeError:
+		return None
+	operator_kind.argtypes = [clang.cindex.Cursor]
+	operator_kind.restype = ctypes.c_int
+	operator_kind_spelling.argtypes = [ctypes.c_int]
+	operator_kind_spelling.restype = clang.cindex._CXString
+	operator_kind_spelling.errcheck = clang.cindex._CXString.from_result
+	operator_kind = counted_libclang_function('clang_getCursorBinaryOperatorKind', operator_kind)
+	operator_kind_spelling = counted_libclang_function('clang_getBinaryOperatorKindSpelling', operator_kind_spelling)
+	return lambda cursor: operator_kind_spelling(operator_kind(cursor))
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_spelling_function():
+	"""
+	The python bindings decode token spellings as UTF-8, raising UnicodeDecodeError for a token
+	such as a string literal containing a Latin-1 byte, so clang_getTokenSpelling is declared here
+	as in get_main_file_test & its result decoded with errors='replace'.
+	@returns function returning the spelling of a token
+	"""
+	import ctypes
+	lib = clang.cindex.conf.lib
+	token_spelling = lib['clang_getTokenSpelling']
+	token_spelling.argtypes = [clang.cindex.TranslationUnit, clang.cindex.Token]
+	token_spelling.restype = clang.cindex._CXString
+	token_spelling = counted_libclang_function('clang_getTokenSpelling', token_spelling)
+	# the _CXString frees itself when garbage collected
+	get_C_string = lib['clang_getCString']
+	get_C_string.argtypes = [clang.cindex._CXString]
+	get_C_string.restype = ctypes.c_char_p
+	return lambda token: (get_C_string(token_spelling(token._tu, token)) or b'').decode('utf-8', errors='replace')
+
+
+class TokenIndex():
+	"""
+	tokens of the main file, so operators & literals can be found by binary search on source offset
+	rather than tokenizing the extent of each node examined
+
+	the file is tokenized when the first lookup is made
+
+	if declarations, the top-level nodes of the file, is given, only the declaration containing
+	the offset looked up is tokenized, which is quicker when few of the file's nodes are examined (see --watch)
 	"""
-	for some reason n.spelling doesn't contain the operator
-	for a binary operator - so use n.extent to find the appropriate token
-	we could instead use n.extent to drag the chars from the file
+	def __init__(self, translation_unit, declarations=None):
+		self.translation_unit = translation_unit
+		self.starts = None
+		self.ends = None
+		self.spellings = None
+		self.declarations = declarations
+		if declarations is not None:
+			self.declaration_starts = [declaration.start_offset for declaration in declarations]
+			self.declaration_tokens = {}
+
+	def tokenize(self, extent=None):
+		"""
+		tokenize extent, by default the whole file
+		"""
+		self.starts = []
+		self.ends = []
+		self.spellings = []
+		token_spelling = get_token_spelling_function()
+		for token in self.translation_unit.get_tokens(extent=extent or self.translation_unit.cursor.extent):
+			extent = token.extent
+			self.starts.append(extent.start.offset)
+			self.ends.append(extent.end.offset)
+			self.spellings.append(token_spelling(token))
+
+	def tokens_around(self, offset):
+		"""
+		@returns (starts, ends, spellings) of tokens including any containing offset
+		"""
+		if self.declarations is None:
+			if self.starts is None:
+				self.tokenize()
+			return (self.starts, self.ends, self.spellings)
+		i = bisect.bisect_right(self.declaration_starts, offset) - 1
+		if i < 0 or offset > self.declarations[i].end_offset:
+			return ([], [], [])
+		if i not in self.declaration_tokens:
+			self.tokenize(self.declarations[i].cursor.extent)
+			self.declaration_tokens[i] = (self.starts, self.ends, self.spellings)
+		return self.declaration_tokens[i]
+
+	def token_at(self, offset):
+		"""
+		@returns spelling of the token containing offset, None if there isn't one
+		"""
+		(starts, ends, spellings) = self.tokens_around(offset)
+		i = bisect.bisect_right(starts, offset) - 1
+		if i >= 0 and offset < ends[i]:
+			return spellings[i]
+
+	def first_token(self, cursor):
+		"""
+		@returns spelling of the first token of cursor's extent, which for a cursor
+		from a macro expansion is in the macro's definition, None if there isn't one
+		"""
+		for token in self.translation_unit.get_tokens(extent=cursor.extent):
+			return get_token_spelling_function()(token)
+
+	def token_between(self, start, end):
+		"""
+		@returns spelling of the first token lying within start..end, None if there isn't one
+		"""
+		(starts, ends, spellings) = self.tokens_around(start)
+		i = bisect.bisect_left(starts, start)
+		if i < len(starts) and ends[i] <= end:
+			return spellings[i]
+
+
+class TabsSpacesMixedChecker(Checker):
+	"""
+	check tabs & spaces not mixed in formatting
 	"""
-	(left,right) = n.get_children()
-	left_end = (left.extent.end.line, left.extent.end.column)
-	right_start = (right.extent.start.line, right.extent.start.column)
-	for t in n.get_tokens():
-		if (
-			left_end <= (t.extent.start.line, t.extent.start.column) and
-			right_start >= (t.extent.end.line, t.extent.end.column)
-			):
-			return t.spelling
+	def __init__(self, *args):
+		super().__init__(*args)
+		self.functions = []
 
+	def enabled(self):
+		return bool(self.args.indenting)
 
-def check_tabs_spaces_mixed(abstract_syntax_tree, args, C_source_lines, C_source_filename):
+	def enter_function(self, function):
+		self.functions.append(function)
+
+	def replay_function(self, function, saved):
+		super().replay_function(function, saved)
+		self.functions.append(function)
+
+	def finish(self):
+		return check_tabs_spaces_mixed(self.functions, self.args, self.source_lines, self.source_filename, self.diagnostics)
+
+
+def check_tabs_spaces_mixed(functions, args, C_source_lines, C_source_filename, diagnostics):
 	"""
 	check tabs & spaces not mixed in formatting
 	"""
 	level = args.indenting
-	if not level:
-		return []
-	line_indent_type = collections.defaultdict(lambda:set())
-	for (line_number, line) in enumerate(C_source_lines):
-		indent_type = categorize_line(line)
-		if indent_type:
-			line_indent_type[indent_type].add(line_number)
-
-	if line_indent_type['mixed']:
-		lines_description = describe_line_set(line_indent_type['mixed'])
-		print(f"{C_source_filename}: {colored('warning', 'red')}: {lines_description} indented with a mixture of tabs and spaces")
-		if args.mixed_indenting_text:
-			print(args.mixed_indenting_text)
+	# line numbers here are indexes into C_source_lines
+	line_indent_types = [categorize_line(line) for line in C_source_lines]
+
+	mixed_lines = [line_number for (line_number, indent_type) in enumerate(line_indent_types) if indent_type == 'mixed']
+	if mixed_lines:
+		lines_description = describe_line_set(mixed_lines)
+		details = [args.mixed_indenting_text] if args.mixed_indenting_text else []
+		diagnostics.append(Diagnostic(C_source_filename, None, None, level, f"{lines_description} indented with a mixture of tabs and spaces", render_file_warning, details=details))
 		return [level]
 
 	# only warn if tabs and spaced used in same function
 	# to avoid warning when student has been supplied code indented with spaces
 	# and uses tabs for their own code or vice versa
 
-	for function in get_functions(abstract_syntax_tree):
-		function_lines = set(range(function.extent.start.line, function.extent.end.line + 1))
-		tabbed_lines = function_lines & line_indent_type['tabs']
-		spaced_lines = function_lines & line_indent_type['spaces']
+	for function in functions:
+		function_lines = range(function.start_line, min(function.end_line + 1, len(line_indent_types)))
+		tabbed_lines = [line_number for line_number in function_lines if line_indent_types[line_number] == 'tabs']
+		spaced_lines = [line_number for line_number in function_lines if line_indent_types[line_number] == 'spaces']
 		if not tabbed_lines or not spaced_lines:
 			continue
 		tabbed_description = describe_line_set(tabbed_lines)
 		spaced_description = describe_line_set(spaced_lines)
-		print(f"""{C_source_filename}: {colored('warning', 'red')}: function {colored(function.spelling, 'cyan')} is indented with a mixture of tabs and spaces:
-	{tabbed_description} indented with tabs
-	{spaced_description} indented with spaces""")
+		details = [f"\t{tabbed_description} indented with tabs", f"\t{spaced_description} indented with spaces"]
 		if args.mixed_indenting_text:
-			print(args.mixed_indenting_text)
+			details.append(args.mixed_indenting_text)
+		message = f"function {colored(function.spelling, 'cyan')} is indented with a mixture of tabs and spaces:"
+		diagnostics.append(Diagnostic(C_source_filename, None, None, level, message, render_file_warning, details=details))
 		return [level]
 
 	return []
@@ -555,132 +2891,221 @@ def describe_line_set(lines):
 
 
 def categorize_line(line):
-	if re.match(r'^ +\S', line):
+	"""
+	@returns "spaces", "tabs" or "mixed" for a line indented with spaces, tabs or both, None if not indented
+	"""
+	text = line.lstrip(' \t')
+	indent_length = len(line) - len(text)
+	if not indent_length or not text or text[0].isspace():
+		return None
+	indent = line[0:indent_length]
+	if indent[0] == ' ' and not indent.strip(' '):
 		return "spaces"
-	if re.match(r'^\t+\S', line):
+	if indent[0] == '\t' and not indent.strip('\t'):
 		return "tabs"
-	if re.match(r'^[ \t]+\S', line):
-		return "mixed"
+	return "mixed"
 
 
-def check_body_indents(abstract_syntax_tree, args, C_source_lines, C_source_filename):
+class BodyIndentChecker(Checker):
 	"""
 	check bodies of of if/while/for/functions consistently indented
 	This is done per function, to avoid warnings when student has been supplied code
 	indented with a different indent to which they use
-	"""
-	level = args.indenting
-	if not level:
-		return []
-	line_indent = {}
-	show_lines = set()
-	for function in get_functions(abstract_syntax_tree):
-		show_lines |= check_function_indent(C_source_filename, function, args, line_indent)
-	incorrectly_indented_lines = len(show_lines)
-
-	if incorrectly_indented_lines and args.highlight_incorrect_indenting:
-		show_lines = expand_lines_shown(C_source_lines, show_lines)
-		print_indents(C_source_filename, C_source_lines, args, line_indent, show_lines)
-
-	return [level] if incorrectly_indented_lines else []
-
 
-def check_function_indent(C_source_filename, abstract_syntax_tree, args, file_line_indent):
+	For each node entered within a function a frame is pushed:
+	(children_indented, children_indent_depth, indent_parent, if_chain_top)
+	indent_parent is set for the body of an if/while/for/function
+	and is the node its statements are indented relative to
+	if_chain_top is the outermost of the node & any directly enclosing if statements,
+	so bodies in an if else-if chain are indented relative to the first if
+	without climbing the chain for every body
+	"""
+	def __init__(self, *args):
+		super().__init__(*args)
+		self.line_indent = {}
+		self.show_intervals = []
+		self.function_line_indent = None
+		self.frames = []
+
+	def enabled(self):
+		return bool(self.args.indenting)
+
+	def enter_function(self, function):
+		self.function_line_indent = {}
+		self.frames = []
+
+	def exit_function(self, function):
+		self.show_intervals += check_function_indent(self.source_filename, self.function_line_indent, self.args, self.line_indent, self.diagnostics)
+		self.function_line_indent = None
+
+	def enter(self, n):
+		if self.function_line_indent is None:
+			return
+		if self.frames:
+			(indented, indent_depth, indent_parent, parent_if_chain_top) = self.frames[-1]
+		else:
+			(indented, indent_depth, indent_parent, parent_if_chain_top) = (True, 0, None, None)
+		if parent_if_chain_top and n.parent.kind == CKind.IF_STMT:
+			if_chain_top = parent_if_chain_top
+		else:
+			if_chain_top = n
+		if indent_parent:
+			li = Indent(
+				relative_indent = n.start_column - indent_parent.start_column,
+				absolute_indent = n.start_column - 1,
+				indent_depth = indent_depth,
+				parent = indent_parent)
+			self.function_line_indent.setdefault(n.start_line, li)
+
+		if not indented:
+			frame = (False, 0, None, if_chain_top)
+		elif n.kind != CKind.COMPOUND_STMT:
+			frame = (True, indent_depth, None, if_chain_top)
+		elif n.parent.kind in [CKind.IF_STMT, CKind.WHILE_STMT, CKind.FOR_STMT, CKind.FUNCTION_DECL]:
+			# handle if else if chains
+			frame = (True, indent_depth + 1, parent_if_chain_top or n.parent, if_chain_top)
+		else:
+			frame = (False, 0, None, if_chain_top)
+		self.frames.append(frame)
+
+	def function_mark(self):
+		return (super().function_mark(), len(self.show_intervals))
+
+	def save_function(self, function, mark):
+		(mark, n_show_intervals) = mark
+		start = function.start_line
+		line_indent = [(line - start, self.line_indent[line]) for line in range(start, function.end_line + 1) if line in self.line_indent]
+		show_intervals = [(first - start, last - start) for (first, last) in self.show_intervals[n_show_intervals:]]
+		return (super().save_function(function, mark), line_indent, show_intervals)
+
+	def replay_function(self, function, saved):
+		(saved, line_indent, show_intervals) = saved
+		super().replay_function(function, saved)
+		start = function.start_line
+		for (line, indent) in line_indent:
+			self.line_indent.setdefault(start + line, indent)
+		self.show_intervals += [(start + first, start + last) for (first, last) in show_intervals]
+
+	def exit(self, n):
+		if self.function_line_indent is None:
+			return
+		(indented, indent_depth, indent_parent, if_chain_top) = self.frames.pop()
+		if indent_parent:
+			closing_brace = Indent(
+				relative_indent = n.end_column - indent_parent.start_column - 1,
+				absolute_indent = n.end_column - 2,
+				indent_depth = indent_depth - 1,
+				parent = indent_parent)
+			self.function_line_indent.setdefault(n.end_line, closing_brace)
+
+	def finish(self):
+		incorrectly_indented_lines = bool(self.show_intervals)
+		if incorrectly_indented_lines and self.args.highlight_incorrect_indenting:
+			show_intervals = expand_lines_shown(self.source_lines, merge_line_intervals(self.show_intervals))
+			message = "some lines are not consistently indented."
+			self.diagnostics.append(Diagnostic(self.source_filename, None, None, self.args.indenting, message, render_indents, details=(self.line_indent, show_intervals)))
+		return [self.args.indenting] if incorrectly_indented_lines else []
+
+
+def check_function_indent(C_source_filename, line_indent, args, file_line_indent, diagnostics):
 	"""
 	determine the indent_unit for a function
 	then check lines are consistently indented
+	@returns list of (first line, last line) of the constructs containing incorrectly indented lines
 	"""
-	line_indent = {}
-	get_indents(abstract_syntax_tree, None, 0, line_indent)
 	indent_counts = collections.Counter(i.relative_indent for i in line_indent.values() if i.relative_indent > 0)
 	if args.debug:
 		print('indent_counts', indent_counts)
 	if len(indent_counts) < 2:
-		return set()
+		return []
 
 	# FIXME - change extraction of indent_unit to be per function
 	# for small program ensure an indent of 4 has priority
 	#indent_counts[4] += 2
 	indent_unit = indent_counts.most_common(1)[0][0]
-	show_lines = set()
-	incorrectly_indented_lines = 0
+	show_intervals = {}
 	for (line, indent) in sorted(line_indent.items()):
 		file_line_indent.setdefault(line, indent)
 		indent.correct_indent = indent.indent_depth * indent_unit
 		if not indent.correctly_indented():
 			if not args.highlight_incorrect_indenting:
-				print(f"{C_source_filename}:{line} indented {indent.absolute_indent} should be {indent.correct_indent}")
-			incorrectly_indented_lines += 1
-			show_lines = show_lines.union(range(indent.parent.extent.start.line, indent.parent.extent.end.line + 1))
-	return show_lines
+				message = f"indented {indent.absolute_indent} should be {indent.correct_indent}"
+				diagnostics.append(Diagnostic(C_source_filename, line, None, args.indenting, message, render_line_note))
+			# many lines usually share a parent, so record each parent's lines once
+			show_intervals[indent.parent.start_line, indent.parent.end_line] = True
+	return list(show_intervals)
+
+
+def merge_line_intervals(intervals):
+	"""
+	@returns sorted list of disjoint (first line, last line) intervals covering the same lines as intervals
+	"""
+	merged = []
+	for (start, end) in sorted(intervals):
+		if merged and start <= merged[-1][1] + 1:
+			if end > merged[-1][1]:
+				merged[-1] = (merged[-1][0], end)
+		else:
+			merged.append((start, end))
+	return merged
 
 
-def expand_lines_shown(C_source_lines, show_lines):
+def expand_lines_shown(C_source_lines, show_intervals):
 	"""
 		fill in small gaps in lines shown from a file for prettier less confusing output
+		show_intervals is a list from merge_line_intervals, a list of the same form is returned
 	"""
+	expanded = []
 	last_line_number = 0
-	for line_number in sorted(show_lines):
-		if last_line_number + 1 < line_number < last_line_number + 5:
-			show_lines = show_lines.union(range( last_line_number + 1, line_number))
-		last_line_number = line_number
+	for (start, end) in show_intervals:
+		if last_line_number + 1 < start < last_line_number + 5:
+			if expanded:
+				start = expanded.pop()[0]
+			else:
+				start = last_line_number + 1
+		expanded.append((start, end))
+		last_line_number = end
 
-	if len(C_source_lines) < last_line_number + 5:
-		show_lines = show_lines.union(range(last_line_number + 1, len(C_source_lines) + 1))
-	return show_lines
+	if expanded and len(C_source_lines) < last_line_number + 5:
+		expanded[-1] = (expanded[-1][0], max(last_line_number, len(C_source_lines)))
+	return expanded
 
 
 
-def print_indents(C_source_filename, C_source_lines, args, line_indent, show_lines):
+def print_indents(C_source_filename, C_source_lines, args, line_indent, show_intervals, file=None):
 	"""
 	display correct/incorrect indents in red/green - idea due to AndrewB
+	show_intervals is a list of (first line, last line) from expand_lines_shown
 	"""
-	print(f"{C_source_filename}: {colored('warning', 'red')}: some lines are not consistently indented.")
-	print("Incorrectly indented lines are marked with an *.", end='')
+	print(f"{C_source_filename}: {colored('warning', 'red')}: some lines are not consistently indented.", file=file)
+	print("Incorrectly indented lines are marked with an *.", end='', file=file)
 	if args.colorize:
-		print(f" The correct indent is {colored('shown in red', on_color='on_red')}.")
-		print(f"Correctly indented lines are {colored('shown in green', on_color='on_green')}.", end='')
-	print()
+		print(f" The correct indent is {colored('shown in red', on_color='on_red')}.", file=file)
+		print(f"Correctly indented lines are {colored('shown in green', on_color='on_green')}.", end='', file=file)
+	print(file=file)
 	last_line_number = 0
-	for line_number in sorted(show_lines):
+	for line_number in (line_number for (start, end) in show_intervals for line_number in range(start, end + 1)):
 		if last_line_number and line_number > last_line_number + 5:
-			print('......')
+			print('......', file=file)
 		line = C_source_lines[line_number - 1]
-		print(f'{line_number:6}', end='')
+		print(f'{line_number:6}', end='', file=file)
 		if line_number in line_indent:
-			print(line_indent[line_number].get_indent_string(line))
+			print(line_indent[line_number].get_indent_string(line), file=file)
 		else:
-			print(' ', line)
+			print(' ', line, file=file)
 		last_line_number = line_number
 
-def get_indents(n, parent, indent_depth, line_indent):
-	n.parent = parent
-	if n.kind == CKind.COMPOUND_STMT:
-		if parent.kind not in [CKind.IF_STMT, CKind.WHILE_STMT, CKind.FOR_STMT, CKind.FUNCTION_DECL]:
-			return
-		# handle if else if chains
-		while parent.parent and parent.parent.kind == CKind.IF_STMT:
-			parent = parent.parent
-		for child in n.get_children():
-			li = Indent(
-				relative_indent = child.extent.start.column - parent.extent.start.column,
-				absolute_indent = child.extent.start.column - 1,
-				indent_depth = indent_depth + 1,
-				parent = parent)
-			line_indent.setdefault(child.extent.start.line, li)
-			get_indents(child, n, indent_depth + 1 , line_indent)
-		closing_brace = Indent(
-			relative_indent = n.extent.end.column - parent.extent.start.column - 1,
-			absolute_indent = n.extent.end.column - 2,
-			indent_depth = indent_depth,
-			parent = parent)
-		line_indent.setdefault(n.extent.end.line, closing_brace)
-	else:
-		parent_filename = n.location.file.name if n.location.file else n.displayname
-		for child in n.get_children():
-			child_filename = child.location.file.name if child.location.file else child.displayname
-			if child_filename == parent_filename:
-				get_indents(child, n, indent_depth, line_indent)
+
+
+def render_indents(diagnostic, args, source_lines):
+	(line_indent, show_intervals) = diagnostic.details
+	output = io.StringIO()
+	print_indents(diagnostic.filename, source_lines, args, line_indent, show_intervals, file=output)
+	return output.getvalue()
+
+
+def render_line_note(diagnostic, args, source_lines):
+	return f"{diagnostic.filename}:{diagnostic.line} {diagnostic.message}\n"
 
 
 class Indent():
@@ -708,41 +3133,706 @@ class Indent():
 		return f'{marker} {colored(prefix, on_color=on_color)}{suffix}'
 
 
-def abstract_syntax_tree_nodes(node, depth=0, parent=None):
+class Node():
+	"""
+	compact snapshot of a cursor made by abstract_syntax_tree_nodes
+
+	the attributes checkers use most are read from libclang once,
+	other attributes (spelling, referenced, ...) are looked up on the underlying cursor
+	semantic_parent & lexical parents don't seem to be implement so we track our own parent & depth
+	"""
+	__slots__ = ('cursor', 'kind', 'filename', 'start_line', 'start_column', 'start_offset',
+		'end_line', 'end_column', 'end_offset', 'parent', 'depth', 'children', '_type_spelling')
+
+	def __init__(self, cursor, filename, parent, depth):
+		extent = cursor.extent
+		start = extent.start
+		end = extent.end
+		self.cursor = cursor
+		self.kind = cursor.kind
+		self.filename = filename
+		self.start_line = start.line
+		self.start_column = start.column
+		self.start_offset = start.offset
+		self.end_line = end.line
+		self.end_column = end.column
+		self.end_offset = end.offset
+		self.parent = parent
+		self.depth = depth
+		self.children = []
+		self._type_spelling = None
+
+	@property
+	def type_spelling(self):
+		if self._type_spelling is None:
+			self._type_spelling = self.cursor.type.spelling
+		return self._type_spelling
+
+	def __getattr__(self, name):
+		return getattr(self.cursor, name)
+
+
+def abstract_syntax_tree_nodes(translation_unit_cursor, skip_children=None):
 	"""
-	traverse ast nodes from same file (don't go into #includes)
-	semantic_parent & lexical parents don't seem to be implement so add own our parent & depth
+	snapshot ast nodes from the main file (don't go into #includes)
+	if skip_children is given, the children of nodes for which it returns True are not snapshotted
+	@returns list of Node in depth-first order, starting with the translation unit's node
 	"""
-	node.depth = depth
-	node.parent = parent
-	yield node
-	parent_filename = node.location.file.name if node.location.file else node.displayname
-	for child in node.get_children():
-		child_filename = child.location.file.name if child.location.file else child.displayname
-		if  child_filename == parent_filename:
-			for rn in abstract_syntax_tree_nodes(child, depth + 1, node):
-				yield rn
+	main_filename = translation_unit_cursor.displayname
+	is_from_main_file = get_main_file_test(translation_unit_cursor.translation_unit)
+	nodes = [Node(translation_unit_cursor, None, None, 0)]
+	add_syntax_tree_children(nodes[0], nodes, main_filename, is_from_main_file, skip_children)
+	return nodes
 
 
-def get_functions(root):
-	for function in root.get_children():
-		if (function.kind != CKind.FUNCTION_DECL or
-			not function.location.file or
-			function.location.file.name != root.displayname or
-			# skip declarations
-			not any(c.kind == CKind.COMPOUND_STMT for c in function.get_children())):
-			continue
-		yield function
+def release_syntax_tree(nodes):
+	"""
+	break the parent <-> children reference cycles of a snapshot once it has been used,
+	so it is freed by reference counting immediately, rather than when Python's cycle collector runs,
+	along with the cursors it holds, which keep their translation unit alive
+	"""
+	for node in nodes:
+		node.parent = None
+		node.children = None
+
+
+def add_syntax_tree_children(root, nodes, main_filename, is_from_main_file, skip_children=None):
+	"""
+	snapshot the descendants of root from the main file, appending them to nodes in depth-first order
+	an explicit stack is used rather than recursion so deeply nested code can't exceed Python's recursion limit
+	"""
+	stack = [root]
+	while stack:
+		node = stack.pop()
+		if node is not root:
+			nodes.append(node)
+			if skip_children and skip_children(node):
+				continue
+		node.children = [Node(child, main_filename, node, node.depth + 1) for child in node.cursor.get_children() if is_from_main_file(child)]
+		stack.extend(reversed(node.children))
+
 
+def get_main_file_test(translation_unit):
+	"""
+	Most top-level cursors are declarations from #included headers.
+	Fetching and comparing the file name of every cursor to skip them takes several libclang calls
+	plus building a string, so instead compare the cursor's (expansion) file handle
+	with the main file's handle which is a single libclang call.
+
+	The python bindings don't expose file handles, so we declare the libclang functions ourselves.
+	Indexing conf.lib returns a new function object, so the bindings' own declarations are untouched.
+
+	@returns function which returns True iff a cursor is from the main file
+	"""
+	import ctypes
+	lib = clang.cindex.conf.lib
+
+	get_file = lib['clang_getFile']
+	get_file.argtypes = [clang.cindex.TranslationUnit, ctypes.c_char_p]
+	get_file.restype = ctypes.c_void_p
+	get_file = counted_libclang_function('clang_getFile', get_file)
+	main_file = get_file(translation_unit, translation_unit.spelling.encode())
+	if not main_file:
+		main_filename = translation_unit.spelling
+		return lambda cursor: cursor.location.file and cursor.location.file.name == main_filename
+
+	get_expansion_location = lib['clang_getExpansionLocation']
+	get_expansion_location.argtypes = [clang.cindex.SourceLocation, ctypes.POINTER(ctypes.c_void_p),
+		ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+	get_expansion_location.restype = None
+	get_expansion_location = counted_libclang_function('clang_getExpansionLocation', get_expansion_location)
+	file = ctypes.c_void_p()
+	file_reference = ctypes.byref(file)
+
+	def is_from_main_file(cursor):
+		get_expansion_location(cursor.location, file_reference, None, None, None)
+		return file.value == main_file
+
+	return is_from_main_file
+
+
+def get_system_header_test():
+	"""
+	The python bindings don't expose clang_Location_isInSystemHeader, so it is declared here as in get_main_file_test.
+	@returns function which returns True iff a SourceLocation is in a system header
+	"""
+	import ctypes
+	is_in_system_header = clang.cindex.conf.lib['clang_Location_isInSystemHeader']
+	is_in_system_header.argtypes = [clang.cindex.SourceLocation]
+	is_in_system_header.restype = ctypes.c_int
+	is_in_system_header = counted_libclang_function('clang_Location_isInSystemHeader', is_in_system_header)
+	return lambda location: bool(is_in_system_header(location))
 
-def print_ast(node):
-	for n in abstract_syntax_tree_nodes(node):
+
+def print_ast(nodes):
+	for n in nodes:
 		print(' ' * n.depth, end='')
-		print(f"{n.location.file}:{n.extent.start.line}:{n.extent.start.column} {n.kind.name} spelling='{n.spelling}' type='{n.type.spelling}'")
+		print(f"{n.filename}:{n.start_line}:{n.start_column} {n.kind.name} spelling='{n.spelling}' type='{n.type_spelling}'")
+
+
+CHECKERS = [SyntaxTreeChecker, ExpressionChecker, TabsSpacesMixedChecker, BodyIndentChecker]
+
+
+def watch_files(source_files, args, index_parse_args):
+	"""
+	check source_files, then check each again whenever it or a file it includes changes, until interrupted
+
+	changes are noticed with inotify if available, otherwise by polling the files' directories & -I directories
+	each file's translation unit is kept & reparsed, with its preamble (the leading #includes) precompiled,
+	and FunctionResults lets unchanged functions be skipped, so a small edit is checked in a few milliseconds
+	"""
+	directories = {os.path.realpath(os.path.dirname(filename) or '.') for filename in source_files}
+	directories |= {os.path.realpath(directory) for directory in args.include_directories}
+	watcher = file_watcher(sorted(directories), args.watch_poll_interval)
+	index = clang.cindex.Index.create()
+	watched_files = [WatchedFile(filename) for filename in source_files]
+	for watched_file in watched_files:
+		watched_file.check(index, args, index_parse_args)
+	print(f"c_check: watching {len(watched_files)} file{'s' if len(watched_files) != 1 else ''} for changes", file=sys.stderr)
+	while True:
+		sys.stdout.flush()
+		changed = watcher.wait()
+		for watched_file in watched_files:
+			if changed & watched_file.dependencies:
+				watched_file.check(index, args, index_parse_args)
+
+
+class WatchedFile():
+	"""
+	a file checked by --watch or --lsp, its translation unit & FunctionResults are kept between checks
+	"""
+	def __init__(self, filename):
+		self.filename = filename
+		self.realpath = os.path.realpath(filename)
+		self.included_files = set()
+		self.included_states = []
+		self.dependencies = {self.realpath}
+		self.tu = None
+		self.function_results = FunctionResults()
+
+	def check(self, index, args, index_parse_args, C_source=None, cancelled=None, records=None):
+		"""
+		check the file, or if C_source is given check it as the file's contents, e.g. an editor's unsaved buffer
+		if cancelled is given, it is called as the check proceeds and if it returns True
+		the check is abandoned by raising CheckCancelled
+		if records is a list, a dict describing each diagnostic is appended to it (see diagnostic_records)
+		@returns False if any check fails, True otherwise
+		"""
+		start = time.perf_counter()
+		timings = Timings(self.filename) if args.timings else NO_TIMINGS
+		if C_source is None:
+			try:
+				with timings.phase('read'):
+					with open(self.filename, 'rb') as f:
+						C_source = f.read()
+			except OSError as e:
+				# editors may briefly remove a file while saving it, it'll be checked when it reappears
+				print(e, file=sys.stderr)
+				return False
+		# the contents are given to libclang so the source checked is exactly that parsed
+		unsaved_files = [(self.filename, C_source)]
+		# included files are looked at before parsing, so a change made while parsing is noticed next time
+		included_states = ResultCache.file_states(sorted(self.included_files))
+		try:
+			with timings.phase('parse'):
+				if self.tu is None:
+					options = clang.cindex.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+					self.tu = index.parse(self.filename, args=index_parse_args, unsaved_files=unsaved_files, options=options)
+				else:
+					self.tu.reparse(unsaved_files=unsaved_files)
+		except clang.cindex.TranslationUnitLoadError:
+			self.tu = None
+			print(f"c_check: can not parse {self.filename}", file=sys.stderr)
+			return False
+		if included_states != self.included_states:
+			self.function_results.clear()
+		included_files = {os.path.realpath(inclusion.include.name) for inclusion in self.tu.get_includes()}
+		if included_files != self.included_files:
+			self.included_files = included_files
+			included_states = ResultCache.file_states(sorted(included_files))
+		self.included_states = included_states
+		self.dependencies = self.included_files | {self.realpath}
+		if cancelled and cancelled():
+			raise CheckCancelled()
+		C_source = C_source.decode('utf-8', errors='replace')
+		self.function_results.cancelled = cancelled
+		passed = check_translation_unit(self.tu, self.filename, C_source, args, timings=timings, function_results=self.function_results, records=records)
+		sys.stdout.flush()
+		if args.timings:
+			print_timings(timings.report())
+		print(f"c_check: checked {self.filename} in {(time.perf_counter() - start) * 1000:.0f}ms", file=sys.stderr)
+		return passed
+
+
+def file_watcher(directories, poll_interval):
+	"""
+	@returns InotifyWatcher for directories, or PollingWatcher if poll_interval is set or inotify isn't available
+	"""
+	if not poll_interval:
+		try:
+			return InotifyWatcher(directories)
+		except (OSError, AttributeError):
+			poll_interval = 0.5
+	return PollingWatcher(directories, poll_interval)
+
+
+class InotifyWatcher():
+	"""
+	notice files changing in a set of directories using Linux's inotify, called via ctypes
+	directories rather than files are watched so files replaced by editors renaming a new version are noticed
+	"""
+	IN_CLOSE_WRITE = 0x8
+	IN_MOVED_FROM = 0x40
+	IN_MOVED_TO = 0x80
+	IN_CREATE = 0x100
+	IN_DELETE = 0x200
+
+	def __init__(self, directories, quiet_period=0.05):
+		import ctypes, ctypes.util
+		libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		self.fd = libc.inotify_init1(os.O_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		self.quiet_period = quiet_period
+		self.directories = {}
+		mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+		for directory in directories:
+			wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+			if wd < 0:
+				raise OSError(ctypes.get_errno(), f"can not watch {directory}")
+			self.directories[wd] = directory
+
+	def wait(self):
+		"""
+		wait until files change, then until there have been no changes for quiet_period seconds,
+		as editors often write a file in several steps
+		@returns set of paths of files changed
+		"""
+		import select, struct
+		changed = set()
+		timeout = None
+		while True:
+			(readable, _, _) = select.select([self.fd], [], [], timeout)
+			if not readable:
+				return changed
+			events = os.read(self.fd, 65536)
+			offset = 0
+			while offset < len(events):
+				(wd, mask, cookie, length) = struct.unpack_from('iIII', events, offset)
+				name = events[offset + 16:offset + 16 + length].rstrip(b'\0')
+				offset += 16 + length
+				if wd in self.directories and name:
+					changed.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+			timeout = self.quiet_period
+
+
+class PollingWatcher():
+	"""
+	notice files changing in a set of directories by comparing their modification times & sizes every interval seconds
+	"""
+	def __init__(self, directories, interval):
+		self.directories = directories
+		self.interval = interval
+		self.states = self.file_states()
+
+	def file_states(self):
+		states = {}
+		for directory in self.directories:
+			try:
+				entries = list(os.scandir(directory))
+			except OSError:
+				continue
+			for entry in entries:
+				try:
+					stat = entry.stat()
+				except OSError:
+					continue
+				states[os.path.join(directory, entry.name)] = (stat.st_mtime_ns, stat.st_size)
+		return states
+
+	def wait(self):
+		"""
+		@returns set of paths of files changed
+		"""
+		while True:
+			time.sleep(self.interval)
+			states = self.file_states()
+			changed = {path for path in states.keys() | self.states.keys() if states.get(path) != self.states.get(path)}
+			self.states = states
+			if changed:
+				return changed
+
+
+class LanguageServer():
+	"""
+	a Language Server Protocol server on stdin & stdout, publishing c_check's diagnostics for C files open in an editor
+
+	Each open document has a WatchedFile, so its translation unit is kept & reparsed from the editor's buffer,
+	passed to libclang as an unsaved file, and nothing is written to disk.
+	A document is checked once there have been no edits to it for args.lsp_debounce seconds.
+	Messages are read by a separate thread, so a check of a document which has been edited again
+	is noticed and abandoned (see CheckCancelled) and its diagnostics never published.
+	"""
+	# https://microsoft.github.io/language-server-protocol/specifications/lsp/3.17/specification/
+	TEXT_DOCUMENT_SYNC_FULL = 1
+	SEVERITY = {'error': 1, 'fatal error': 1, 'warning': 2, 'note': 3, 'ignored': 3}
+	METHOD_NOT_FOUND = -32601
+
+	def __init__(self, args, index_parse_args, input=None, output=None):
+		import queue
+		self.args = args
+		self.index_parse_args = index_parse_args
+		# unbuffered, as the interpreter can't exit while a thread holds the lock of a buffered stream
+		self.input = input or open(sys.stdin.fileno(), 'rb', buffering=0, closefd=False)
+		self.output = output or sys.stdout.buffer
+		self.index = clang.cindex.Index.create()
+		self.documents = {}
+		self.due = {}
+		self.messages = queue.Queue()
+		# latest version of each document, updated as soon as an edit is read
+		self.versions = {}
+		self.shutdown = False
+
+	def run(self):
+		"""
+		@returns True if the client shut the server down before it exited
+		"""
+		import queue, threading
+		threading.Thread(target=self.read_messages, daemon=True).start()
+		while True:
+			timeout = max(0, min(self.due.values()) - time.monotonic()) if self.due else None
+			try:
+				message = self.messages.get(timeout=timeout)
+			except queue.Empty:
+				message = {}
+			if message is None:
+				return False
+			if message.get('method') == 'exit':
+				return self.shutdown
+			self.handle(message)
+			if self.messages.empty():
+				self.check_due_documents()
+
+	def read_messages(self):
+		"""
+		read messages from the client, putting them on self.messages, then None when input ends
+		"""
+		import json
+		while True:
+			headers = {}
+			while True:
+				line = self.input.readline()
+				if not line:
+					self.messages.put(None)
+					return
+				line = line.decode('ascii', errors='replace').strip()
+				if not line:
+					break
+				(name, _, value) = line.partition(':')
+				headers[name.strip().lower()] = value.strip()
+			length = headers.get('content-length', '')
+			body = b''
+			while length.isdigit() and len(body) < int(length):
+				data = self.input.read(int(length) - len(body))
+				if not data:
+					self.messages.put(None)
+					return
+				body += data
+			try:
+				message = json.loads(body)
+			except ValueError as e:
+				print(f"c_check: invalid LSP message: {e}", file=sys.stderr)
+				continue
+			if not isinstance(message, dict):
+				print(f"c_check: unsupported LSP message: {body[0:80]}", file=sys.stderr)
+				continue
+			if message.get('method') in ['textDocument/didChange', 'textDocument/didClose']:
+				document = message.get('params', {}).get('textDocument', {})
+				self.versions[document.get('uri')] = document.get('version')
+			self.messages.put(message)
+
+	def send(self, message):
+		import json
+		body = json.dumps({'jsonrpc': '2.0', **message}).encode('utf-8')
+		self.output.write(f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body)
+		self.output.flush()
+
+	def handle(self, message):
+		method = message.get('method')
+		params = message.get('params') or {}
+		if method is None:
+			# a response, or no message as a check became due
+			return
+		if method == 'initialize':
+			capabilities = {'textDocumentSync': {'openClose': True, 'change': self.TEXT_DOCUMENT_SYNC_FULL}}
+			self.send({'id': message.get('id'), 'result': {'capabilities': capabilities, 'serverInfo': {'name': 'c_check'}}})
+		elif method == 'shutdown':
+			self.shutdown = True
+			self.send({'id': message.get('id'), 'result': None})
+		elif method == 'textDocument/didOpen':
+			document = params['textDocument']
+			filename = uri_filename(document['uri'])
+			if filename.endswith('.c'):
+				self.documents[document['uri']] = LanguageServerDocument(filename, document['text'], document.get('version'))
+				self.versions[document['uri']] = document.get('version')
+				self.due[document['uri']] = time.monotonic()
+		elif method == 'textDocument/didChange':
+			document = self.documents.get(params['textDocument']['uri'])
+			if document and params.get('contentChanges'):
+				document.text = params['contentChanges'][-1]['text']
+				document.version = params['textDocument'].get('version')
+				self.due[params['textDocument']['uri']] = time.monotonic() + self.args.lsp_debounce
+		elif method == 'textDocument/didClose':
+			uri = params['textDocument']['uri']
+			self.due.pop(uri, None)
+			document = self.documents.pop(uri, None)
+			if document:
+				if document.watched_file.tu:
+					dispose_clang_object(document.watched_file.tu, 'clang_disposeTranslationUnit')
+				self.send({'method': 'textDocument/publishDiagnostics', 'params': {'uri': uri, 'diagnostics': []}})
+		elif 'id' in message:
+			self.send({'id': message['id'], 'error': {'code': self.METHOD_NOT_FOUND, 'message': f'{method} not supported'}})
+
+	def check_due_documents(self):
+		now = time.monotonic()
+		for uri in [uri for (uri, due) in self.due.items() if due <= now]:
+			del self.due[uri]
+			self.check_document(uri, self.documents[uri])
+
+	def check_document(self, uri, document):
+		"""
+		check document publishing its diagnostics, unless it is edited again while being checked
+		"""
+		import contextlib
+		version = document.version
+		C_source = document.text.encode('utf-8')
+		records = []
+		try:
+			with contextlib.redirect_stdout(io.StringIO()):
+				document.watched_file.check(self.index, self.args, self.index_parse_args, C_source=C_source, cancelled=lambda: self.versions.get(uri) != version, records=records)
+		except CheckCancelled:
+			print(f"c_check: check of {document.watched_file.filename} cancelled", file=sys.stderr)
+			return
+		diagnostics = language_server_diagnostics(records, document.watched_file.filename, C_source)
+		self.send({'method': 'textDocument/publishDiagnostics', 'params': {'uri': uri, 'version': version, 'diagnostics': diagnostics}})
+
+
+class LanguageServerDocument():
+	"""
+	a document open in the editor of a LanguageServer client
+	"""
+	def __init__(self, filename, text, version):
+		self.watched_file = WatchedFile(filename)
+		self.text = text
+		self.version = version
+
+
+def uri_filename(uri):
+	"""
+	@returns path of the file a file: URI names, otherwise the path part of the URI
+	"""
+	import urllib.parse
+	return urllib.parse.unquote(urllib.parse.urlparse(uri).path)
+
+
+def language_server_diagnostics(records, C_source_filename, C_source):
+	"""
+	convert records describing the diagnostics from checking C_source_filename (see diagnostic_records),
+	whose contents are C_source (bytes), into LSP diagnostics
+
+	A diagnostic's range is its node if that is on one line, otherwise the token at its location.
+	Indenting diagnostics are given for each incorrectly indented line,
+	others without a location are placed on the first line their details mention.
+	"""
+	source_lines = C_source.splitlines()
+	diagnostics = []
+	for record in records:
+		(line_number, column, message) = (record['line'], record['column'], record['message'])
+		ranges = []
+		if record['file'] != C_source_filename and line_number:
+			# e.g. an error in an included file
+			message = f"{record['file']}:{line_number}:{column}: {record['severity']}: {message}"
+			ranges.append((1, 1, 1))
+		elif line_number and column:
+			if record.get('end_line') == line_number and record.get('end_column', 0) > column:
+				end_column = record['end_column']
+			else:
+				token = re.compile(rb'\w+|\S').search(source_lines[line_number - 1] if line_number <= len(source_lines) else b'', column - 1)
+				end_column = token.end() + 1 if token else column
+			ranges.append((line_number, column, end_column))
+		else:
+			marked_lines = record.get('lines') or ([line_number] if line_number else [])
+			if not marked_lines:
+				details = record.get('details', [])
+				mentioned = re.search(r'\bline (\d+)\b', '\n'.join(details))
+				marked_lines = [int(mentioned.group(1)) if mentioned else 1]
+				message = '\n'.join([message] + [detail.strip() for detail in details])
+			for n in marked_lines:
+				line = source_lines[n - 1] if n <= len(source_lines) else b''
+				ranges.append((n, len(line) - len(line.lstrip()) + 1, len(line) + 1))
+		for (n, start_column, end_column) in ranges:
+			diagnostics.append({
+				'range': {'start': lsp_position(source_lines, n, start_column), 'end': lsp_position(source_lines, n, end_column)},
+				'severity': LanguageServer.SEVERITY[record['severity']],
+				'source': 'c_check',
+				'message': message,
+			})
+	return diagnostics
+
+
+def lsp_position(source_lines, line_number, column):
+	"""
+	@returns LSP position of 1-based line_number & byte column, LSP counts characters in UTF-16 code units
+	"""
+	line = source_lines[line_number - 1] if 0 < line_number <= len(source_lines) else b''
+	prefix = line[0:column - 1].decode('utf-8', errors='replace')
+	return {'line': max(line_number - 1, 0), 'character': len(prefix.encode('utf-16-le')) // 2}
+
+
+def daemon_socket_path():
+	"""
+	must match daemon_socket_path in c_check_client.py
+	"""
+	if os.environ.get('C_CHECK_SOCKET'):
+		return os.environ['C_CHECK_SOCKET']
+	directory = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+	return os.path.join(directory, f'c_check-{os.getuid()}.sock')
+
+
+def run_daemon(socket_path, idle_timeout):
+	"""
+	listen on a unix socket for requests from c_check_client.py
+	libclang is loaded & toolchain discovery done once, then each request
+	is run by a forked child, so requests can't affect each other or the daemon
+
+	A request is a JSON line with the client's argv, cwd, environment & whether its stdout is a tty.
+	The response is a sequence of frames: 1 byte channel (1=stdout 2=stderr x=exit status),
+	4 byte big-endian length, then data.
+	"""
+	import signal, socket
+	get_library_include()
+	clang.cindex.conf.lib
+
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	if os.path.exists(socket_path):
+		try:
+			server.connect(socket_path)
+			print(f"c_check: daemon already listening on {socket_path}", file=sys.stderr)
+			sys.exit(1)
+		except ConnectionRefusedError:
+			# left by a daemon which didn't exit cleanly
+			os.unlink(socket_path)
+		server.close()
+		server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	old_umask = os.umask(0o077)
+	try:
+		server.bind(socket_path)
+	finally:
+		os.umask(old_umask)
+	server.listen(64)
+	server.settimeout(idle_timeout or None)
+	socket_inode = os.stat(socket_path).st_ino
+
+	# children report their own exit status to the client, so don't need to be waited for
+	signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+	try:
+		while True:
+			try:
+				connection, _ = server.accept()
+			except socket.timeout:
+				break
+			if not daemon_peer_allowed(connection):
+				connection.close()
+				continue
+			if os.fork() == 0:
+				server.close()
+				signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+				handle_daemon_request(connection)
+				os._exit(0)
+			connection.close()
+	finally:
+		server.close()
+		if os.path.exists(socket_path) and os.stat(socket_path).st_ino == socket_inode:
+			os.unlink(socket_path)
+
+
+def daemon_peer_allowed(connection):
+	"""
+	only check files for the user running the daemon
+	"""
+	import socket, struct
+	if not hasattr(socket, 'SO_PEERCRED'):
+		return True
+	credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+	(_, uid, _) = struct.unpack('3i', credentials)
+	return uid == os.getuid()
+
+
+def handle_daemon_request(connection):
+	"""
+	run c_check with the client's arguments, current directory & environment
+	"""
+	import json, traceback
+	request_line = connection.makefile('rb').readline()
+	if not request_line:
+		# connection just checking the daemon is running
+		connection.close()
+		return
+	request = json.loads(request_line)
+	os.chdir(request['cwd'])
+	os.environ.clear()
+	os.environ.update(request['environ'])
+	sys.argv = [sys.argv[0]] + request['argv']
+	sys.stdout = daemon_output(connection, b'1', request['isatty'])
+	sys.stderr = daemon_output(connection, b'2', request['isatty'])
+	try:
+		main()
+		exit_status = 0
+	except SystemExit as e:
+		if e.code is None or isinstance(e.code, int):
+			exit_status = e.code or 0
+		else:
+			print(e.code, file=sys.stderr)
+			exit_status = 1
+	except Exception:
+		traceback.print_exc()
+		exit_status = 1
+	try:
+		sys.stdout.flush()
+		sys.stderr.flush()
+		send_daemon_frame(connection, b'x', str(exit_status).encode())
+	except OSError:
+		# client has gone away
+		pass
+	connection.close()
+
+
+def daemon_output(connection, channel, isatty):
+	"""
+	@returns text stream sending what is written to the client as frames on channel
+	"""
+	return io.TextIOWrapper(io.BufferedWriter(DaemonOutputStream(connection, channel, isatty)), encoding='utf-8', errors='replace')
+
+
+class DaemonOutputStream(io.RawIOBase):
+	def __init__(self, connection, channel, isatty):
+		self.connection = connection
+		self.channel = channel
+		self.client_isatty = isatty
+
+	def writable(self):
+		return True
+
+	def isatty(self):
+		return self.client_isatty
+
+	def write(self, data):
+		send_daemon_frame(self.connection, self.channel, bytes(data))
+		return len(data)
 
 
-def node_location(n):
-	return f'{n.location.file}:{n.extent.start.line}:{n.extent.start.column}'
+def send_daemon_frame(connection, channel, data):
+	connection.sendall(channel + len(data).to_bytes(4, 'big') + data)
 
 
 def dump(obj):
@@ -18,13 +18,18 @@ mixed_indenting_text="
 
 c_check=/usr/local/lib/c_check/c_check.py
 
+# c_check_client.py passes its arguments to a daemon started with "c_check.py --daemon" if one is running
+# otherwise it runs $C_CHECK
+c_check_client=/usr/local/lib/c_check/c_check_client.py
+export C_CHECK="$c_check"
+
 warning=assign_getchar_char,indenting,integer_ascii_code
 
 not_permitted=global_variable,goto,static_local_variable,unistd_library
 
 not_recommended=comma,do_while,switch,ternary,union
 
-exec /usr/bin/python3 -I "$c_check" \
+exec /usr/bin/python3 -I "$c_check_client" \
 	--where-text "$where_text" \
 	--extra-text "$extra_text" \
 	--mixed-indenting-text "$mixed_indenting_text" \
@@ -0,0 +1,86 @@
+#!/usr/bin/python3 -I
+
+# thin client for a c_check daemon started with: c_check.py --daemon
+#
+# passes arguments, current directory and environment to the daemon
+# and relays its stdout, stderr and exit status
+#
+# if no daemon is running, c_check.py from the same directory is run instead
+#
+# Repo: https://github.com/COMP1511UNSW/c_check
+
+import json, os, socket, sys
+
+
+def main():
+	connection = connect(daemon_socket_path())
+	if not connection:
+		run_c_check()
+
+	request = {
+		'argv': sys.argv[1:],
+		'cwd': os.getcwd(),
+		'environ': dict(os.environ),
+		'isatty': sys.stdout.isatty(),
+	}
+	try:
+		connection.sendall(json.dumps(request).encode() + b'\n')
+		response = connection.makefile('rb')
+		streams = {b'1': sys.stdout.buffer, b'2': sys.stderr.buffer}
+		received = False
+		while True:
+			header = response.read(5)
+			if len(header) < 5:
+				break
+			received = True
+			channel = header[0:1]
+			data = response.read(int.from_bytes(header[1:5], 'big'))
+			if channel == b'x':
+				sys.stdout.flush()
+				sys.exit(int(data))
+			streams[channel].write(data)
+			streams[channel].flush()
+	except OSError:
+		pass
+	if not received:
+		# daemon went away before doing anything
+		run_c_check()
+	print("c_check: lost connection to daemon", file=sys.stderr)
+	sys.exit(1)
+
+
+def daemon_socket_path():
+	"""
+	must match daemon_socket_path in c_check.py
+	"""
+	if os.environ.get('C_CHECK_SOCKET'):
+		return os.environ['C_CHECK_SOCKET']
+	directory = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+	return os.path.join(directory, f'c_check-{os.getuid()}.sock')
+
+
+def connect(socket_path):
+	"""
+	@returns socket connected to daemon or None if there isn't one
+	"""
+	try:
+		# don't talk to a socket created by someone else
+		if os.stat(socket_path).st_uid != os.getuid():
+			return None
+		connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		connection.connect(socket_path)
+		return connection
+	except OSError:
+		return None
+
+
+def run_c_check():
+	c_check = os.environ.get('C_CHECK') or os.path.join(os.path.dirname(os.path.realpath(__file__)), 'c_check.py')
+	os.execv(sys.executable, [sys.executable, '-I', c_check] + sys.argv[1:])
+
+
+if __name__ == "__main__":
+	try:
+		main()
+	except KeyboardInterrupt:
+		sys.exit(2)